@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+近似最近鄰索引 - IVF-flat（純 numpy）
+k-means 粗聚類把向量分到 nlist 個倒排列表，查詢時只掃描最近的 nprobe 個列表，
+向量本身仍存放在 EmbeddingStore 的 memmap 矩陣中，索引只保存 id。
+
+持久化於 memory/index.ann.npz（與 index.json 同目錄）：
+    centroids  nlist × dim 的歸一化質心
+    ids        按列表拼接的記憶 id
+    offsets    每個列表在 ids 中的起點（長度 nlist + 1）
+    built      構建時間戳（增量記錄只對同一次構建的質心有效）
+    max_id     索引中最大的記憶 id
+增量維護寫入 memory/index.ann.delta：追加 (id, 列表) 的 int64 記錄（列表 -1 表示移除），
+每次提交只追加這一批記錄；累計 Config.ANN_DELTA_MERGE 條後併入 npz 並清空。
+"""
+
+import os
+import sys
+import time
+import json
+import fcntl
+import argparse
+from contextlib import contextmanager
+
+import numpy as np
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+from embedding_store import EmbeddingStore, normalize
+
+logger = get_logger('ann_index')
+
+DELTA_RECORD = 16  # 增量日誌每條記錄的字節數（id, 列表 各一個 int64）
+
+
+def _kmeans(vectors, nlist, iterations=10, seed=0):
+    """球面 k-means（向量已歸一化，用點積分配）"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # 空簇重新隨機播種
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """IVF-flat 近似最近鄰索引"""
+
+    def __init__(self, path=None, lists=True):
+        """lists=False 時只載入質心（增量寫入端不需要倒排列表）"""
+        self.path = Config.ANN_INDEX_PATH if path is None else path
+        self.delta_path = self.path.with_suffix('.delta')
+        self.centroids = None
+        self.built = 0
+        self.max_id = 0
+        self.lists = []
+        self._extra = {}       # 增量日誌中的新增：id → 列表
+        self._removed = set()  # 增量日誌中從基礎列表移除的 id
+        self._extra_lists = None
+        self._pending = []     # 尚未寫入增量日誌的 (id, 向量或 None)
+        self.load(lists)
+
+    # ---------- 持久化 ----------
+
+    @property
+    def trained(self):
+        return self.centroids is not None and len(self.centroids) > 0
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._merged())
+
+    def _read_delta(self):
+        """增量日誌的 (id, 列表) 記錄；列表為 -1 表示移除，末尾未寫完的半條記錄忽略"""
+        try:
+            records = np.fromfile(self.delta_path, dtype=np.int64)
+        except FileNotFoundError:
+            return np.empty((0, 2), dtype=np.int64)
+        return records[:len(records) // 2 * 2].reshape(-1, 2)
+
+    def _apply(self, records):
+        nlist = len(self.centroids)
+        for mem_id, c in records.tolist():
+            if c < 0:
+                self._extra.pop(mem_id, None)
+                self._removed.add(mem_id)
+            elif c < nlist:  # 讀到重建前的舊日誌時列表號可能越界
+                self._extra[mem_id] = c
+                self.max_id = max(self.max_id, mem_id)
+        self._extra_lists = None
+
+    def load(self, lists=True):
+        """
+        載入索引（不存在時為未訓練狀態）
+        先讀增量日誌再讀 npz：合併（先替換 npz 再清空日誌）期間讀到的最多是重複 id，不會遺漏
+        """
+        self.centroids, self.built, self.max_id, self.lists = None, 0, 0, []
+        self._extra, self._removed, self._extra_lists = {}, set(), None
+        if not self.path.exists():
+            return False
+        records = self._read_delta()
+        try:
+            with np.load(self.path) as data:
+                self.centroids = data["centroids"]
+                self.built = int(data["built"]) if "built" in data else 0
+                if lists or "max_id" not in data:
+                    ids, offsets = data["ids"], data["offsets"]
+                    # 保持 numpy 切片視圖
+                    self.lists = [ids[offsets[c]:offsets[c + 1]] for c in range(len(self.centroids))]
+                    self.max_id = int(ids.max()) if len(ids) else 0
+                else:
+                    self.max_id = int(data["max_id"])
+            self._apply(records)
+            logger.debug(f"Loaded ANN index: {len(self.centroids)} lists, {len(records)} delta records")
+            return True
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"ANN index corrupted, ignoring: {e}")
+            self.centroids, self.lists = None, []
+            return False
+
+    def _merged(self):
+        """基礎列表套用增量日誌後的各列表 id"""
+        drop = np.fromiter(self._removed | self._extra.keys(), dtype=np.int64)
+        extra = self._by_list()
+        merged = []
+        for c in range(len(self.centroids) if self.trained else 0):
+            ids = np.asarray(self.lists[c], dtype=np.int64)
+            if len(drop):
+                ids = ids[~np.isin(ids, drop)]
+            if c in extra:
+                ids = np.concatenate([ids, np.asarray(extra[c], dtype=np.int64)])
+            merged.append(ids)
+        return merged
+
+    def _write(self):
+        """原子寫入 npz（臨時文件 + rename），讀取端無需加鎖；調用方持有日誌鎖並隨後清空日誌"""
+        self.lists = self._merged()
+        self._extra, self._removed, self._extra_lists = {}, set(), None
+        sizes = [len(ids) for ids in self.lists]
+        offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        ids = np.concatenate(self.lists)
+        self.max_id = int(ids.max()) if len(ids) else 0
+        tmp_path = self.path.with_suffix('.npz.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, ids=ids, offsets=offsets,
+                     built=np.int64(self.built), max_id=np.int64(self.max_id))
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def _delta_lock(self):
+        with open(self.delta_path, 'ab') as delta:
+            fcntl.flock(delta, fcntl.LOCK_EX)
+            try:
+                yield delta
+            finally:
+                fcntl.flock(delta, fcntl.LOCK_UN)
+
+    def save(self):
+        """把當前索引（含增量）完整寫入 npz 並清空增量日誌（build 或完整 load 之後調用）"""
+        if not self.trained:
+            return
+        with self._delta_lock() as delta:
+            self._write()
+            delta.truncate(0)
+        self._pending = []
+
+    def flush(self):
+        """
+        把 add / remove 的變更追加到增量日誌（只寫這一批記錄，不重寫 npz）
+        日誌累計超過 Config.ANN_DELTA_MERGE 條時在同一把鎖內併入 npz
+        """
+        if not self.trained or not self._pending:
+            return
+        with self._delta_lock() as delta:
+            with np.load(self.path) as data:
+                built = int(data["built"]) if "built" in data else 0
+            if built != self.built:
+                # 索引在此期間被重建：按新質心重新分配
+                pending, self._pending = self._pending, []
+                self.load(lists=False)
+                for mem_id, vec in pending:
+                    if vec is None:
+                        self.remove([mem_id])
+                    else:
+                        self.add(mem_id, vec)
+            records = np.asarray([(mem_id, -1 if vec is None else self._nearest_list(vec))
+                                  for mem_id, vec in self._pending], dtype=np.int64)
+            delta.write(records.tobytes())
+            delta.flush()
+            self._pending = []
+            if delta.tell() // DELTA_RECORD >= Config.ANN_DELTA_MERGE:
+                self.load()
+                self._write()
+                delta.truncate(0)
+                logger.info(f"Merged ANN delta log into {self.path.name}")
+
+    # ---------- 構建與增量維護 ----------
+
+    def build(self, store, nlist=None, sample=None):
+        """從向量庫全量訓練並分配"""
+        ids, rows = store.live()
+        if not ids:
+            logger.warning("Embedding store is empty, ANN index not built")
+            return False
+        if nlist is None:
+            nlist = max(1, int(np.sqrt(len(ids))))
+        nlist = min(nlist, len(ids))
+        sample = sample or Config.ANN_TRAIN_SAMPLE
+
+        rng = np.random.default_rng(0)
+        train_rows = rows if len(rows) <= sample else rng.choice(rows, sample, replace=False)
+        self.centroids = _kmeans(np.asarray(store.matrix[np.sort(train_rows)]), nlist)
+
+        lists = [[] for _ in range(nlist)]
+        ids_arr = np.asarray(ids, dtype=np.int64)
+        # 分塊分配，避免一次性載入整個矩陣
+        for start in range(0, len(rows), 65536):
+            chunk = rows[start:start + 65536]
+            assign = np.argmax(np.asarray(store.matrix[chunk]) @ self.centroids.T, axis=1)
+            for mem_id, c in zip(ids_arr[start:start + 65536].tolist(), assign.tolist()):
+                lists[c].append(mem_id)
+        self.lists = [np.asarray(lst, dtype=np.int64) for lst in lists]
+        self._extra, self._removed, self._extra_lists, self._pending = {}, set(), None, []
+        self.built = time.time_ns()
+        self.max_id = int(ids_arr.max())
+        logger.info(f"Built ANN index: {nlist} lists over {len(ids)} vectors")
+        return True
+
+    def _nearest_list(self, vec):
+        return int(np.argmax(self.centroids @ normalize(vec)))
+
+    def _by_list(self):
+        if self._extra_lists is None:
+            self._extra_lists = {}
+            for mem_id, c in self._extra.items():
+                self._extra_lists.setdefault(c, []).append(mem_id)
+        return self._extra_lists
+
+    def add(self, mem_id, vec):
+        """增量加入一條向量（未訓練時忽略，等待 build）；flush 後才寫入磁碟"""
+        if not self.trained:
+            return False
+        if mem_id <= self.max_id:
+            # 只有已存在的 id（向量被替換）才需要先移除；新記憶的 id 都大於 max_id
+            self.remove([mem_id])
+        self._pending.append((mem_id, vec))
+        self._extra[mem_id] = self._nearest_list(vec)
+        self._extra_lists = None
+        self.max_id = max(self.max_id, mem_id)
+        return True
+
+    def remove(self, mem_ids):
+        """從倒排列表移除（記錄為增量），返回記錄的移除數；flush 後才寫入磁碟"""
+        if not self.trained or not mem_ids:
+            return 0
+        for mem_id in mem_ids:
+            self._pending.append((mem_id, None))
+            self._extra.pop(mem_id, None)
+            self._removed.add(mem_id)
+        self._extra_lists = None
+        return len(mem_ids)
+
+    # ---------- 查詢 ----------
+
+    def candidates(self, query_vec, nprobe=None):
+        """返回最近 nprobe 個列表中的候選 id"""
+        nprobe = min(nprobe or Config.ANN_NPROBE, len(self.centroids))
+        sims = self.centroids @ normalize(query_vec)
+        probe = np.argpartition(-sims, nprobe - 1)[:nprobe].tolist()
+        cand = np.concatenate([np.asarray(self.lists[c], dtype=np.int64) for c in probe])
+        if self._removed:
+            cand = cand[~np.isin(cand, np.fromiter(self._removed, dtype=np.int64))]
+        extra = self._by_list()
+        added = [mem_id for c in probe for mem_id in extra.get(c, ())]
+        if added:
+            # 合併期間讀到的舊日誌可能與 npz 重複
+            cand = np.unique(np.concatenate([cand, np.asarray(added, dtype=np.int64)]))
+        return cand.tolist()
+
+    def search(self, query_vec, store, k=10, nprobe=None):
+        """
+        近似搜尋
+        Returns:
+            (ids, scores) - 按分數降序，最多 k 條
+        """
+        cand = self.candidates(query_vec, nprobe)
+        found_ids, rows = store.rows_for(cand)
+        if not found_ids:
+            return [], np.empty(0, dtype=np.float32)
+        # 行號排序後讀取，memmap 順序訪問
+        order = np.argsort(rows)
+        rows = rows[order]
+        scores = np.asarray(store.matrix[rows]) @ normalize(query_vec)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        ids = [found_ids[i] for i in order[top].tolist()]
+        return ids, scores[top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - ANN 索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="從向量庫全量構建索引")
+    build.add_argument("--nlist", type=int, help="倒排列表數（默認 sqrt(N)）")
+    sub.add_parser("stats", help="顯示索引統計")
+    args = parser.parse_args()
+
+    index = IVFIndex()
+    if args.command == "build":
+        start = time.perf_counter()
+        if index.build(EmbeddingStore(), nlist=args.nlist):
+            index.save()
+            print(f"✅ ANN 索引已構建：{len(index.centroids)} 個列表，{len(index)} 條向量 "
+                  f"({time.perf_counter() - start:.1f}s)")
+    elif args.command == "stats":
+        sizes = [len(lst) for lst in index._merged()]
+        print(json.dumps({
+            "trained": index.trained,
+            "lists": len(sizes),
+            "vectors": sum(sizes),
+            "max_list": max(sizes) if sizes else 0,
+        }, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
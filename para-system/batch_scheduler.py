@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+推理調度（異步微批）- brain_server 的編碼請求不在事件循環裡直接跑模型
+請求先排隊；第一個請求到達後等待 Config.SERVER_BATCH_WAIT_MS，或累計 Config.SERVER_BATCH_MAX_ITEMS 條，
+合成一個微批交給推理線程池（Config.SERVER_INFERENCE_WORKERS 個線程），再按請求拆分向量。
+推理線程都在忙時請求繼續累積，負載越高批次越大；事件循環始終可以接收新請求。
+"""
+
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('batch_scheduler')
+
+
+class BatchScheduler:
+    """encode() 在事件循環中調用；合批由一個後台協程完成，推理在線程池中執行"""
+
+    def __init__(self, encode_fn, max_batch=None, max_wait_ms=None, workers=None):
+        """encode_fn(texts) → 與 texts 一一對應的向量矩陣（在推理線程中調用）"""
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch or Config.SERVER_BATCH_MAX_ITEMS
+        self.max_wait = (Config.SERVER_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.workers = workers or Config.SERVER_INFERENCE_WORKERS
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="inference")
+        self._queue = deque()  # [(enqueued, texts, future), ...]
+        self._wakeup = None
+        self._slots = None
+        self._task = None
+        self._in_flight = 0
+        self._stats = {"requests": 0, "items": 0, "batches": 0, "max_batch": 0, "max_queue": 0,
+                       "failed": 0, "wait_seconds": 0.0, "infer_seconds": 0.0}
+        self._sizes = {}  # 批大小分佈：上界（1, 2, 4, ...）→ 批次數
+
+    def _start(self):
+        """在首次請求時綁定當前事件循環"""
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def encode(self, texts):
+        """排隊等待所在微批推理完成，返回本請求的向量（推理失敗時拋出同一異常）"""
+        texts = list(texts)
+        loop = asyncio.get_running_loop()
+        if not texts:
+            return await loop.run_in_executor(self._executor, self.encode_fn, texts)
+        if self._task is None:
+            self._start()
+        future = loop.create_future()
+        self._queue.append((loop.time(), texts, future))
+        self._stats["max_queue"] = max(self._stats["max_queue"], len(self._queue))
+        self._wakeup.set()
+        return await future
+
+    def _queued_items(self):
+        return sum(len(texts) for _, texts, _ in self._queue)
+
+    def _take(self):
+        """按到達順序取出不超過 max_batch 條的請求（單個請求超過上限時獨佔一批，不拆開）"""
+        batch, items = [], 0
+        while self._queue and (not batch or items + len(self._queue[0][1]) <= self.max_batch):
+            request = self._queue.popleft()
+            batch.append(request)
+            items += len(request[1])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # 先等空閒的推理線程再封批：線程都在忙時請求繼續累積
+            await self._slots.acquire()
+            deadline = self._queue[0][0] + self.max_wait
+            while self._queued_items() < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = self._take()
+            self._in_flight += 1
+            asyncio.ensure_future(self._dispatch(batch, loop.time()))
+
+    async def _dispatch(self, batch, started):
+        loop = asyncio.get_running_loop()
+        texts = [text for _, request_texts, _ in batch for text in request_texts]
+        t0 = time.perf_counter()
+        try:
+            vecs = await loop.run_in_executor(self._executor, self.encode_fn, texts)
+        except Exception as e:
+            logger.error(f"Inference batch of {len(texts)} texts failed: {e}")
+            self._stats["failed"] += 1
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+        elapsed = time.perf_counter() - t0
+
+        start = 0
+        for _, request_texts, future in batch:
+            # 客戶端斷開時 future 已被取消
+            if not future.done():
+                future.set_result(vecs[start:start + len(request_texts)])
+            start += len(request_texts)
+
+        stats = self._stats
+        stats["requests"] += len(batch)
+        stats["items"] += len(texts)
+        stats["batches"] += 1
+        stats["max_batch"] = max(stats["max_batch"], len(texts))
+        stats["wait_seconds"] += sum(started - enqueued for enqueued, _, _ in batch)
+        stats["infer_seconds"] += elapsed
+        bucket = 1 << (len(texts) - 1).bit_length()
+        self._sizes[bucket] = self._sizes.get(bucket, 0) + 1
+        logger.debug(f"Encoded {len(texts)} texts from {len(batch)} requests in {elapsed * 1000:.1f}ms")
+
+    def stats(self):
+        stats = dict(self._stats, queued=len(self._queue), queued_items=self._queued_items(),
+                     in_flight=self._in_flight, max_batch_items=self.max_batch,
+                     max_wait_ms=self.max_wait * 1000, workers=self.workers)
+        batches = max(stats["batches"], 1)
+        stats["avg_batch"] = round(stats["items"] / batches, 2)
+        stats["avg_wait_ms"] = round(stats.pop("wait_seconds") / max(stats["requests"], 1) * 1000, 2)
+        stats["avg_infer_ms"] = round(stats.pop("infer_seconds") / batches * 1000, 2)
+        stats["batch_sizes"] = {f"<={size}": count for size, count in sorted(self._sizes.items())}
+        return stats
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
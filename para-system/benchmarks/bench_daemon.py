@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+守護進程基準測試 - CLI 冷啟動（每次加載模型）vs 熱啟動（轉發給常駐守護進程）
+每輪以子進程方式運行 brain_retrieve.py，記錄端到端耗時
+
+用法: python3 benchmarks/bench_daemon.py [--runs 5] [--query "測試查詢"]
+      （需要已有記憶索引；熱啟動輪次會臨時啟動 model_daemon.py serve）
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from model_daemon import DaemonClient
+
+
+def run_cli(query, use_daemon):
+    env = dict(os.environ, YUE_ENCODER_BACKEND="daemon" if use_daemon else "sentence-transformers")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(ROOT / "brain_retrieve.py"), query, "--threshold", "0"],
+                   env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    return (time.perf_counter() - start) * 1000
+
+
+def wait_for_daemon(timeout):
+    client = DaemonClient()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if client.ping():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    print(f"{label:>6} {statistics.median(timings):>10.1f} {timings[0]:>10.1f} {timings[-1]:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="守護進程冷 / 熱啟動基準測試")
+    parser.add_argument("--runs", type=int, default=5, help="每種模式的運行次數")
+    parser.add_argument("--query", default="測試查詢", help="檢索查詢")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="等待守護進程加載模型的秒數")
+    args = parser.parse_args()
+
+    if DaemonClient().ping():
+        print("❌ 已有守護進程在運行，請先停止再測冷啟動")
+        return 1
+
+    cold = [run_cli(args.query, use_daemon=False) for _ in range(args.runs)]
+
+    daemon = subprocess.Popen([sys.executable, str(ROOT / "model_daemon.py"), "serve"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_daemon(args.startup_timeout):
+            print("❌ 守護進程未能在時限內啟動")
+            return 1
+        warm = [run_cli(args.query, use_daemon=True) for _ in range(args.runs)]
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+    print(f"{'mode':>6} {'p50 ms':>10} {'min ms':>10} {'max ms':>10}")
+    report("cold", cold)
+    report("warm", warm)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+查重基準測試 - 舊的逐條循環 vs DedupEngine 批量矩陣乘法
+用模擬編碼器（固定延遲 + 確定性隨機向量）代替 MiniLM，不需要下載模型
+
+用法: python3 benchmarks/bench_dedup.py [--sizes 1000 10000 50000] [--model-ms 5]
+"""
+
+import sys
+import time
+import zlib
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from embedding_store import EmbeddingStore, normalize
+from dedup import DedupEngine
+
+DIM = 384
+
+
+class StubEncoder:
+    """模擬編碼器：每次調用固定延遲，計數模型調用次數"""
+
+    def __init__(self, model_ms):
+        self.delay = model_ms / 1000.0
+        self.calls = 0
+
+    def encode(self, text):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        rng = np.random.default_rng(zlib.crc32(text.encode('utf-8')))
+        return rng.standard_normal(DIM).astype(np.float32)
+
+
+def build_store(directory, n):
+    store = EmbeddingStore(Path(directory), dim=DIM)
+    rng = np.random.default_rng(n)
+    vecs = rng.standard_normal((n, DIM)).astype(np.float32)
+    store.append_many(list(zip(range(1, n + 1), vecs)))
+    memories = [{"id": i} for i in range(1, n + 1)]
+    return store, memories
+
+
+def legacy_check(content, memories, store, encoder, max_items):
+    """舊實現：每條記憶都重新編碼一次新文本，逐對計算餘弦相似度"""
+    best = 0.0
+    for mem in memories[:max_items]:
+        mem_vec = store.get(mem["id"])
+        query_vec = encoder.encode(content)
+        score = float(np.dot(normalize(query_vec), mem_vec))
+        best = max(best, score)
+    return best
+
+
+def bench(n, model_ms, legacy_cap):
+    with tempfile.TemporaryDirectory() as tmp:
+        store, memories = build_store(tmp, n)
+
+        # 舊實現只跑前 legacy_cap 條，再線性外推
+        encoder = StubEncoder(model_ms)
+        start = time.perf_counter()
+        legacy_check("新的記憶內容", memories, store, encoder, legacy_cap)
+        legacy_ms = (time.perf_counter() - start) * 1000 * n / min(n, legacy_cap)
+        legacy_calls = n
+
+        encoder = StubEncoder(model_ms)
+        engine = DedupEngine(store)
+        by_id = {mem["id"]: mem for mem in memories}
+        start = time.perf_counter()
+        engine.find(encoder.encode("新的記憶內容"), by_id.get)
+        engine_ms = (time.perf_counter() - start) * 1000
+
+        return {
+            "memories": n,
+            "legacy_model_calls": legacy_calls,
+            "legacy_ms": legacy_ms,
+            "engine_model_calls": encoder.calls,
+            "engine_ms": engine_ms,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查重基準測試")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--model-ms", type=float, default=5.0, help="模擬單次模型推理耗時（毫秒）")
+    parser.add_argument("--legacy-cap", type=int, default=200, help="舊實現實測條數上限（其餘外推）")
+    args = parser.parse_args()
+
+    print(f"{'memories':>10} {'legacy calls':>13} {'legacy ms':>12} {'engine calls':>13} {'engine ms':>10}")
+    for n in args.sizes:
+        r = bench(n, args.model_ms, args.legacy_cap)
+        print(f"{r['memories']:>10} {r['legacy_model_calls']:>13} {r['legacy_ms']:>12.1f} "
+              f"{r['engine_model_calls']:>13} {r['engine_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+索引存儲按 id 操作的耗時報告 - 分配 id、查找、強化、刪除、取向量
+與舊實現（每次 max(id) / 線性掃描列表）對照，驗證耗時不隨記憶數增長
+
+用法: python3 benchmarks/bench_index_store.py [--sizes 10000 100000 1000000] [--ops 2000] [--backend json]
+"""
+
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from index_store import JsonIndexStore, SqliteIndexStore
+from embedding_store import EmbeddingStore
+
+DIM = 32  # 只測查找，不需要真實維度
+
+
+def synthetic_memories(n):
+    now = "2026-01-01T00:00:00"
+    return [{"id": i, "content": f"memory {i}", "actor": "Self", "target": "Core", "domain": "Role",
+             "initial_importance": 0.5, "current_importance": 0.5, "density": 0.5, "access_count": 0,
+             "retrieval_count": 0, "last_access": now, "creation_date": now, "state": "Silver"}
+            for i in range(1, n + 1)]
+
+
+def open_store(backend, directory, memories):
+    if backend == "json":
+        store = JsonIndexStore(directory / "index.json")
+        store.load()
+        store.index["memories"] = memories
+        store.save()
+        store = JsonIndexStore(directory / "index.json")
+    else:
+        store = SqliteIndexStore(directory / "index.db")
+        store.import_index({"memories": memories})
+    return store
+
+
+def per_op_us(fn, args):
+    t0 = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - t0) / len(args) * 1e6
+
+
+def run(size, ops, backend):
+    rng = random.Random(size)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        memories = synthetic_memories(size)
+        store = open_store(backend, directory, memories)
+
+        t0 = time.perf_counter()
+        store.load()
+        load_ms = (time.perf_counter() - t0) * 1000
+
+        embeddings = EmbeddingStore(directory / "embeddings", dim=DIM)
+        vecs = np.random.default_rng(0).standard_normal((size, DIM)).astype(np.float32)
+        for start in range(0, size, 100000):
+            chunk = vecs[start:start + 100000]
+            embeddings.append_many(list(zip(range(start + 1, start + len(chunk) + 1), chunk)))
+
+        ids = [rng.randint(1, size) for _ in range(ops)]
+        row = {
+            "get": per_op_us(store.get, ids),
+            "embedding": per_op_us(embeddings.get, ids),
+            "add": per_op_us(lambda i: store.add({"content": f"new {i}", "state": "Silver"}), range(ops)),
+        }
+
+        def reinforce(mem_id):
+            mem = store.get(mem_id)
+            mem["access_count"] = mem.get("access_count", 0) + 1
+            store.update_many("reinforce", [(mem, ("access_count",))])
+        row["reinforce"] = per_op_us(reinforce, ids)
+        row["delete"] = per_op_us(lambda mem_id: store.delete_many([mem_id]), rng.sample(range(1, size + 1), ops))
+
+        # 舊實現：每次新增掃描最大 id，按 id 查找線性掃描
+        sample = ids[:max(ops // 20, 1)]
+        row["old add"] = per_op_us(lambda _: max(m["id"] for m in memories), sample)
+        row["old get"] = per_op_us(lambda mem_id: next(m for m in memories if m["id"] == mem_id), sample)
+        if backend == "sqlite":
+            store.close()
+        return load_ms, row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="索引存儲按 id 操作耗時")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--ops", type=int, default=2000, help="每種操作的次數")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    args = parser.parse_args()
+
+    columns = ["get", "embedding", "add", "reinforce", "delete", "old add", "old get"]
+    print(f"backend={args.backend}（每次操作微秒；load 為毫秒）")
+    print(f"{'memories':>10} {'load ms':>9} " + " ".join(f"{name:>10}" for name in columns))
+    for size in args.sizes:
+        load_ms, row = run(size, args.ops, args.backend)
+        print(f"{size:>10} {load_ms:>9.0f} " + " ".join(f"{row[name]:>10.1f}" for name in columns))
+
+
+if __name__ == "__main__":
+    main()
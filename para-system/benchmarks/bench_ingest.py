@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+合併提交壓測 - N 個寫入進程逐條編碼記憶：經守護進程合併提交 vs 各自 _locked_ingest
+group 模式下客戶端調用 DaemonClient.ingest，守護進程在 INGEST_WINDOW_MS 內把並發請求合成一批
+（一次推理、一次查重、一次提交）；direct 模式即 bench_writers 的樂觀並發流程（每條一次推理與提交）。
+每 5 條有一條內容在進程間共享，檢驗合併後仍不產生重複記憶。
+
+用法: python3 benchmarks/bench_ingest.py [--writers 1 4 16] [--items 50] [--encode-ms 10] [--item-ms 2] [--window-ms 30]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_writers import contents_for
+
+
+def slow_encoder(encode_ms, item_ms):
+    """hashing 後端加上模擬的模型推理：每次調用 encode_ms + 每條 item_ms 的 CPU 忙等
+    （CPU 推理在進程間互相爭用，sleep 會高估多進程各自推理的吞吐量）"""
+    import encoders
+    if encode_ms or item_ms:
+        encode_many = encoders.HashingBackend.encode_many
+
+        def slow_encode_many(self, texts, batch_size=None):
+            deadline = time.process_time() + (encode_ms + item_ms * len(texts)) / 1000
+            while time.process_time() < deadline:
+                pass
+            return encode_many(self, texts, batch_size)
+        encoders.HashingBackend.encode_many = slow_encode_many
+
+
+def serve(cost):
+    import logging
+    logging.disable(logging.CRITICAL)
+    slow_encoder(*cost)
+
+    from encoders import create_backend
+    from model_daemon import ModelDaemon
+    backend = create_backend(allow_daemon=False)
+    ModelDaemon(backend.encode_many, backend.model_name, dim=backend.dim).serve_forever()
+
+
+def worker(writer, items, mode, cost, barrier, results):
+    import logging
+    logging.disable(logging.CRITICAL)
+    slow_encoder(*cost)
+
+    import brain_encode
+    from model_daemon import DaemonClient
+
+    # 預先導入編碼路徑上的模塊，計時不包含首次導入
+    import dedup  # noqa: F401
+    import minhash  # noqa: F401
+    import semantic_encoder  # noqa: F401
+    import usage_buffer  # noqa: F401
+
+    ingest = DaemonClient().ingest if mode == "group" else brain_encode._locked_ingest
+    latencies = []
+    barrier.wait()
+    for content in contents_for(writer, items):
+        t0 = time.perf_counter()
+        ingest([brain_encode.prepare_item(content)])
+        latencies.append(time.perf_counter() - t0)
+    results.put(latencies)
+
+
+def run(writers, items, mode, cost, window_ms):
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        # 子進程在 spawn 時繼承環境變量，Config 據此指向臨時工作區與 socket
+        os.environ.update(YUE_WORKSPACE=tmp, YUE_DAEMON_SOCKET=os.path.join(tmp, "brain.sock"),
+                          YUE_INGEST_WINDOW_MS=str(window_ms))
+        os.makedirs(os.path.join(tmp, "memory"), exist_ok=True)
+
+        from model_daemon import DaemonClient
+        client = DaemonClient(os.environ["YUE_DAEMON_SOCKET"])
+        daemon = None
+        if mode == "group":
+            daemon = ctx.Process(target=serve, args=(cost,), daemon=True)
+            daemon.start()
+            while not client.ping():
+                time.sleep(0.05)
+
+        barrier, results = ctx.Barrier(writers + 1), ctx.Queue()
+        procs = [ctx.Process(target=worker, args=(w, items, mode, cost, barrier, results))
+                 for w in range(writers)]
+        for proc in procs:
+            proc.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        collected = [results.get() for _ in procs]
+        elapsed = time.perf_counter() - t0
+        for proc in procs:
+            proc.join()
+
+        stats = {}
+        if daemon is not None:
+            stats = client.ping().get("ingest", {})
+            daemon.terminate()
+            daemon.join()
+
+        from index_store import JsonIndexStore
+        hashes = [mem["content_hash"] for mem in JsonIndexStore(Path(tmp) / "memory" / "index.json").memories()]
+
+    latencies = sorted(lat for lats in collected for lat in lats)
+    return {
+        "items_per_s": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "batches": stats.get("batches", len(latencies)),
+        "avg_batch": stats.get("avg_batch", 1.0),
+        "memories": len(hashes),
+        "duplicates": len(hashes) - len(set(hashes)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="守護進程合併提交吞吐量")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--items", type=int, default=50, help="每個寫入進程提交的條數")
+    parser.add_argument("--encode-ms", type=float, default=10, help="模擬每次模型推理的固定 CPU 耗時（毫秒）")
+    parser.add_argument("--item-ms", type=float, default=2, help="模擬每條文本的推理 CPU 耗時（毫秒）")
+    parser.add_argument("--window-ms", type=float, default=30, help="守護進程的合併窗口（毫秒）")
+    parser.add_argument("--mode", choices=["group", "direct", "both"], default="both")
+    args = parser.parse_args()
+
+    os.environ.update(YUE_ENCODER_BACKEND="hashing", YUE_INDEX_BACKEND="json")
+    modes = ["group", "direct"] if args.mode == "both" else [args.mode]
+    print(f"items/writer={args.items} encode={args.encode_ms}ms+{args.item_ms}ms/item window={args.window_ms}ms")
+    print(f"{'mode':>7} {'writers':>7} {'items/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'batches':>7} {'avg batch':>9} {'memories':>8} {'dups':>5}")
+    for mode in modes:
+        for writers in args.writers:
+            row = run(writers, args.items, mode, (args.encode_ms, args.item_ms), args.window_ms)
+            print(f"{mode:>7} {writers:>7} {row['items_per_s']:>9.1f} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+                  f"{row['batches']:>7} {row['avg_batch']:>9} {row['memories']:>8} {row['duplicates']:>5}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+無模型查重報告 - MinHash/LSH 候選 + difflib 確認 vs 逐條 difflib 線性掃描
+查詢是隨機記憶的輕微改寫（改一個字 / 加標點 / 改空白），統計找回率與每條耗時
+
+用法: python3 benchmarks/bench_minhash.py [--sizes 1000 10000] [--queries 50] [--linear-max 10000]
+"""
+
+import sys
+import time
+import random
+import difflib
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from minhash import MinHashIndex, signature
+
+WORDS = ("記憶 衰減 強化 檢索 向量 模型 索引 日誌 快照 子代理 任務 用戶 設計 測試 部署 "
+         "memory decay index journal snapshot agent task deploy review cache").split()
+
+
+def synthetic_texts(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 30))) + f" #{i}" for i in range(n)]
+
+
+def perturb(text, rng):
+    """輕微改寫：替換一個字符、追加標點或插入空白"""
+    kind = rng.randrange(3)
+    if kind == 0:
+        pos = rng.randrange(len(text))
+        return text[:pos] + "的" + text[pos + 1:]
+    if kind == 1:
+        return text + "。"
+    pos = text.find(" ")
+    return text[:pos] + "  " + text[pos:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash/LSH vs difflib 線性掃描")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--confirm", type=int, default=8, help="每條最多確認的候選數")
+    parser.add_argument("--linear-max", type=int, default=10000, help="超過此規模不跑線性掃描")
+    args = parser.parse_args()
+
+    print(f"{'memories':>10} {'build s':>8} {'lsh ms':>8} {'lsh recall':>10} {'candidates':>10} "
+          f"{'linear ms':>10} {'linear recall':>13}")
+    for size in args.sizes:
+        texts = synthetic_texts(size)
+        rng = random.Random(size)
+        targets = [rng.randrange(size) for _ in range(args.queries)]
+        queries = [perturb(texts[i], rng) for i in targets]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index = MinHashIndex(Path(tmp) / "minhash.db")
+            t0 = time.perf_counter()
+            index.add_many(list(enumerate(texts)))
+            build_s = time.perf_counter() - t0
+
+            found, candidates, t0 = 0, 0, time.perf_counter()
+            for target, query in zip(targets, queries):
+                ranked = index.candidates(signature(query), args.confirm)
+                candidates += len(ranked)
+                for mem_id, _ in ranked:
+                    if difflib.SequenceMatcher(None, texts[mem_id], query).ratio() > 0.95:
+                        found += mem_id == target
+                        break
+            lsh_ms = (time.perf_counter() - t0) / len(queries) * 1000
+            index.close()
+
+        linear = "-", "-"
+        if size <= args.linear_max:
+            hits, t0 = 0, time.perf_counter()
+            sample = list(zip(targets, queries))[:max(len(queries) // 5, 1)]
+            for target, query in sample:
+                for mem_id, text in enumerate(texts):
+                    if difflib.SequenceMatcher(None, text, query).ratio() > 0.95:
+                        hits += mem_id == target
+                        break
+            linear = f"{(time.perf_counter() - t0) / len(sample) * 1000:.1f}", f"{hits / len(sample):.3f}"
+
+        print(f"{size:>10} {build_s:>8.1f} {lsh_ms:>8.2f} {found / len(queries):>10.3f} "
+              f"{candidates / len(queries):>10.1f} {linear[0]:>10} {linear[1]:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+量化存儲報告 - float32 / float16 / int8 粗排 + 全精度重排的召回率、延遲與佔用
+使用帶聚類結構的合成向量，不需要模型
+
+用法: python3 benchmarks/bench_quant.py [--size 200000] [--queries 200] [--k 10] [--candidates 200]
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from embedding_store import EmbeddingStore, normalize
+from bench_ann import synthetic_vectors, percentile_ms
+
+DIM = 384
+PRECISIONS = ["float32", "float16", "int8"]
+
+
+def build_store(directory, vecs, precision):
+    store = EmbeddingStore(Path(directory), dim=DIM, precision=precision)
+    for start in range(0, len(vecs), 100000):
+        chunk = vecs[start:start + 100000]
+        store.append_many(list(zip(range(start + 1, start + len(chunk) + 1), chunk)))
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量化存儲召回率 / 延遲 / 佔用報告")
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--candidates", type=int, default=200, help="重排候選數")
+    args = parser.parse_args()
+
+    vecs = synthetic_vectors(args.size, args.topics)
+    rng = np.random.default_rng(1)
+    queries = synthetic_vectors(args.queries, args.topics, seed=0)[rng.permutation(args.queries)]
+    queries += 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries = [normalize(q) for q in queries]
+
+    print(f"memories={args.size} k={args.k} candidates={args.candidates}")
+    print(f"{'precision':>10} {'coarse recall':>14} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'scan MB':>8} {'disk MB':>8}")
+
+    truth = None
+    for precision in PRECISIONS:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = build_store(tmp, vecs, precision)
+            row_ids = store.row_ids()
+
+            results, coarse_hits, lat = [], 0, []
+            for q in queries:
+                t0 = time.perf_counter()
+                ids, _ = store.search(q, args.k, candidates=args.candidates)
+                lat.append(time.perf_counter() - t0)
+                results.append(set(ids))
+                # 不重排時的召回（只看粗排前 k 名）
+                coarse = store.coarse_scores(q)
+                top = np.argpartition(-coarse, args.k - 1)[:args.k]
+                if truth is not None:
+                    coarse_hits += len(set(row_ids[top].tolist()) & truth[len(results) - 1])
+
+            if truth is None:
+                truth = results  # float32 即精確結果
+            hits = sum(len(got & expected) for got, expected in zip(results, truth))
+            total = args.k * len(queries)
+            coarse_recall = 1.0 if precision == "float32" else coarse_hits / total
+
+            stats = store.stats()
+            scan_bytes = stats["coarse_bytes"] if precision != "float32" else stats["bytes"]
+            disk_bytes = stats["bytes"] + stats["coarse_bytes"]
+            print(f"{precision:>10} {coarse_recall:>14.3f} {hits / total:>9.3f} "
+                  f"{percentile_ms(lat, 50):>8.2f} {percentile_ms(lat, 99):>8.2f} "
+                  f"{scan_bytes / 1e6:>8.1f} {disk_bytes / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
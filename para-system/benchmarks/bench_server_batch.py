@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+推理調度壓測 - N 個並發客戶端逐條請求編碼：事件循環內直接推理 vs BatchScheduler 微批
+inline 模式即舊的 brain_server 端點（async def 裡直接調用 encode_many，請求逐個執行、批大小恆為 1）；
+scheduler 模式經 BatchScheduler 合批後在推理線程池執行。
+模擬推理為每次調用 --encode-ms + 每條 --item-ms 的 sleep（與 torch 一樣在推理期間釋放 GIL）。
+不依賴 fastapi：直接在 asyncio 中壓測端點內部的編碼路徑。
+
+用法: python3 benchmarks/bench_server_batch.py [--clients 1 4 16 64] [--requests 20] [--encode-ms 10] [--item-ms 0.5]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def slow_encoder(encode_ms, item_ms):
+    """hashing 後端加上模擬的模型推理耗時"""
+    from encoders import create_backend
+    backend = create_backend("hashing", allow_daemon=False)
+
+    def encode_many(texts, batch_size=None):
+        time.sleep((encode_ms + item_ms * len(texts)) / 1000)
+        return backend.encode_many(texts, batch_size)
+    return encode_many
+
+
+async def client(encode, client_id, requests, latencies):
+    for i in range(requests):
+        t0 = time.perf_counter()
+        vecs = await encode([f"client {client_id} request {i}"])
+        assert len(vecs) == 1
+        latencies.append(time.perf_counter() - t0)
+
+
+async def run(clients, requests, mode, encode_fn, max_batch, wait_ms):
+    from batch_scheduler import BatchScheduler
+    scheduler = None
+    if mode == "scheduler":
+        scheduler = BatchScheduler(encode_fn, max_batch=max_batch, max_wait_ms=wait_ms)
+        encode = scheduler.encode
+    else:
+        async def encode(texts):
+            return encode_fn(texts)
+
+    latencies = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(encode, c, requests, latencies) for c in range(clients)))
+    elapsed = time.perf_counter() - t0
+    stats = scheduler.stats() if scheduler is not None else {}
+    if scheduler is not None:
+        scheduler.close()
+
+    latencies.sort()
+    return {
+        "req_per_s": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "batches": stats.get("batches", len(latencies)),
+        "avg_batch": stats.get("avg_batch", 1.0),
+        "max_queue": stats.get("max_queue", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="brain_server 推理調度吞吐量")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=20, help="每個客戶端的請求數")
+    parser.add_argument("--encode-ms", type=float, default=10, help="模擬每次模型推理的固定耗時（毫秒）")
+    parser.add_argument("--item-ms", type=float, default=0.5, help="模擬每條文本的推理耗時（毫秒）")
+    parser.add_argument("--max-batch", type=int, default=64, help="單個微批的文本數上限")
+    parser.add_argument("--wait-ms", type=float, default=5, help="合批等待上限（毫秒）")
+    parser.add_argument("--mode", choices=["scheduler", "inline", "both"], default="both")
+    args = parser.parse_args()
+
+    os.environ.update(YUE_ENCODER_BACKEND="hashing")
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    encode_fn = slow_encoder(args.encode_ms, args.item_ms)
+    modes = ["scheduler", "inline"] if args.mode == "both" else [args.mode]
+    print(f"requests/client={args.requests} encode={args.encode_ms}ms+{args.item_ms}ms/item "
+          f"max_batch={args.max_batch} wait={args.wait_ms}ms")
+    print(f"{'mode':>9} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'batches':>7} {'avg batch':>9} {'max queue':>9}")
+    for mode in modes:
+        for clients in args.clients:
+            row = asyncio.run(run(clients, args.requests, mode, encode_fn, args.max_batch, args.wait_ms))
+            print(f"{mode:>9} {clients:>7} {row['req_per_s']:>8.1f} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+                  f"{row['batches']:>7} {row['avg_batch']:>9} {row['max_queue']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+分片索引報告 - 單一 index.json vs 按月份 × 領域分片（index_shards）
+合成語料（perf_suite，時間戳分佈在一年內）+ hashing 編碼器；每個後端在獨立子進程的臨時工作區中運行。
+統計每次檢索載入索引的耗時與讀取的記憶數（無條件按質心選分片 / domain 條件 / since 條件）、
+按質心選分片相對全部分片的 top-5 召回率，以及衰減（首次全量與之後的增量）耗時。
+
+用法: python3 benchmarks/bench_shards.py [--sizes 10000 50000] [--queries 30] [--probe 12]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from perf_suite import synthetic_corpus, sentence
+
+CASES = {
+    "all": {},
+    "domain": {"domain": "User"},
+    "since": {"since": "30d"},
+}
+
+
+def run_worker(backend, size, queries, seed, probe):
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    from config import Config
+    from index_store import JsonIndexStore, open_index_store
+    from meta_index import parse_since
+    from semantic_encoder import SemanticEncoder
+    import brain_retrieve
+    import memory_decay
+
+    Config.SHARD_PROBE = probe
+    encoder = SemanticEncoder(backend="hashing")
+    corpus = synthetic_corpus(size, seed)
+    os.makedirs(Config.MEMORY_DIR, exist_ok=True)
+    for start in range(0, size, 10000):
+        chunk = corpus[start:start + 10000]
+        vecs = encoder.encode_many([mem["content"] for mem in chunk])
+        encoder.store.append_many([(mem["id"], vec) for mem, vec in zip(chunk, vecs)])
+    if backend == "json":
+        store = JsonIndexStore()
+        store.load()
+        store.index["memories"] = corpus
+        store.save()
+    else:
+        store = open_index_store()
+        store.import_index({"memories": corpus})
+        store.rebuild_centroids(encoder.store)
+
+    rng = random.Random(seed + 1)
+    texts = [sentence(rng) for _ in range(queries)]
+    results = {"backend": backend, "size": size}
+    if backend == "sharded":
+        results["shards"] = len(store.keys())
+    for case, filters in CASES.items():
+        filters = {key: parse_since(value) if key == "since" else value for key, value in filters.items()}
+        loads, loaded = [], 0
+        for text in texts:
+            query_vec = encoder.encode(text)
+            t0 = time.perf_counter()
+            index = brain_retrieve.load_index(filters, query_vec, encoder.model_name)
+            loads.append(time.perf_counter() - t0)
+            loaded += len(index["memories"])
+        results[case] = {"load_ms": round(sum(loads) / len(loads) * 1000, 2), "loaded": loaded // len(texts)}
+
+    if backend == "sharded":
+        # 按質心選分片 vs 讀取全部分片（exact 模式不剪枝）的 top-5 重合度
+        overlap = 0
+        for text in texts:
+            probed = {r["id"] for r in brain_retrieve.search_memories(text, 5, 0.0, encoder=encoder)}
+            exact = {r["id"] for r in brain_retrieve.search_memories(text, 5, 0.0, encoder=encoder, mode="exact")}
+            overlap += len(probed & exact) / max(len(exact), 1)
+        results["recall@5"] = round(overlap / len(texts), 3)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for run in ("decay_first", "decay_next"):
+            t0 = time.perf_counter()
+            memory_decay.apply_decay()
+            results[run + "_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="單一索引 vs 分片索引")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--probe", type=int, default=12, help="無條件檢索按質心讀取的分片數（SHARD_PROBE）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        backend, size = args.worker
+        json.dump(run_worker(backend, int(size), args.queries, args.seed, args.probe), sys.stdout)
+        return 0
+
+    print(f"{'memories':>9} {'backend':>8} {'shards':>6} " + " ".join(f"{case + ' ms':>10} {'read':>7}" for case in CASES)
+          + f" {'recall@5':>8} {'decay 1st':>10} {'decay next':>10}")
+    for size in args.sizes:
+        for backend in ("json", "sharded"):
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(os.environ, YUE_WORKSPACE=tmp, YUE_INDEX_BACKEND=backend,
+                           YUE_ENCODER_BACKEND="hashing")
+                proc = subprocess.run([sys.executable, __file__, "--worker", backend, str(size),
+                                       "--queries", str(args.queries), "--seed", str(args.seed), "--probe", str(args.probe)],
+                                      env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                return 1
+            row = json.loads(proc.stdout)
+            print(f"{size:>9} {backend:>8} {row.get('shards', 1):>6} "
+                  + " ".join(f"{row[case]['load_ms']:>10.1f} {row[case]['loaded']:>7}" for case in CASES)
+                  + f" {row.get('recall@5', '-'):>8} {row['decay_first_ms']:>10.1f} {row['decay_next_ms']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
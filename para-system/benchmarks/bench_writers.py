@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+並發寫入壓測 - 1 / 4 / 16 個 brain_encode 寫入進程同時編碼記憶的提交吞吐量
+每個進程逐條調用 brain_encode._locked_ingest（每條一次提交）；每 5 條有一條內容在進程間共享
+（一半逐字相同、一半只差標點），用來檢驗並發提交不會產生重複記憶。
+--mode locked 對照舊流程：模型推理與查重都在排他鎖內。
+--encode-ms 模擬模型推理耗時（hashing 後端本身只要微秒級）。
+
+用法: python3 benchmarks/bench_writers.py [--writers 1 4 16] [--items 50] [--encode-ms 20] [--backend json]
+"""
+
+import os
+import sys
+import time
+import fcntl
+import random
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+WORDS = ("記憶 衰減 強化 檢索 向量 模型 索引 日誌 快照 子代理 任務 用戶 設計 測試 部署 "
+         "memory decay index journal snapshot agent task deploy review cache").split()
+
+
+def contents_for(writer, items):
+    rng = random.Random(writer)
+    contents = []
+    for i in range(items):
+        if i % 5 == 0:
+            # 進程間共享：奇數輪加一個標點（語義 / MinHash 近重複），偶數輪逐字相同
+            contents.append(f"共享記錄 shared note {i} 所有寫入方都會提交" + ("！" if writer % 2 and i % 10 else ""))
+        else:
+            contents.append(f"writer {writer} note {i}: " + " ".join(rng.choice(WORDS) for _ in range(12)))
+    return contents
+
+
+def worker(writer, items, mode, encode_ms, barrier, results):
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    import encoders
+    import brain_encode
+    from config import Config
+    from index_store import open_index_store
+
+    if encode_ms:
+        encode_many = encoders.HashingBackend.encode_many
+
+        def slow_encode_many(self, texts, batch_size=None):
+            time.sleep(encode_ms / 1000)
+            return encode_many(self, texts, batch_size)
+        encoders.HashingBackend.encode_many = slow_encode_many
+
+    revalidations = [0]
+    revalidate = brain_encode._revalidate
+
+    def counting_revalidate(*args):
+        revalidations[0] += 1
+        return revalidate(*args)
+    brain_encode._revalidate = counting_revalidate
+
+    def locked_ingest(items):
+        """舊流程：持排他鎖完成推理、查重與提交"""
+        from semantic_encoder import SemanticEncoder
+        encoder = SemanticEncoder()
+        lock_path = os.path.join(Config.MEMORY_DIR, "index.lock")
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                store = open_index_store()
+                store.refresh()
+                return brain_encode._ingest(store, items, encoder)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # 預先導入編碼路徑上的模塊，計時不包含首次導入
+    import dedup  # noqa: F401
+    import minhash  # noqa: F401
+    import semantic_encoder  # noqa: F401
+    import usage_buffer  # noqa: F401
+
+    ingest = brain_encode._locked_ingest if mode == "optimistic" else locked_ingest
+    latencies = []
+    barrier.wait()
+    for content in contents_for(writer, items):
+        t0 = time.perf_counter()
+        ingest([brain_encode.prepare_item(content)])
+        latencies.append(time.perf_counter() - t0)
+    results.put((latencies, revalidations[0]))
+
+
+def run(writers, items, mode, encode_ms, backend):
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        # 子進程在 spawn 時繼承環境變量，Config 據此指向臨時工作區
+        os.environ["YUE_WORKSPACE"] = tmp
+        os.makedirs(os.path.join(tmp, "memory"), exist_ok=True)
+        barrier, results = ctx.Barrier(writers + 1), ctx.Queue()
+        procs = [ctx.Process(target=worker, args=(w, items, mode, encode_ms, barrier, results))
+                 for w in range(writers)]
+        for proc in procs:
+            proc.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        collected = [results.get() for _ in procs]
+        elapsed = time.perf_counter() - t0
+        for proc in procs:
+            proc.join()
+
+        from index_store import JsonIndexStore, SqliteIndexStore
+        memory_dir = Path(tmp) / "memory"
+        if backend == "json":
+            store = JsonIndexStore(memory_dir / "index.json")
+        else:
+            store = SqliteIndexStore(memory_dir / "index.db")
+        hashes = [mem["content_hash"] for mem in store.memories()]
+        duplicates = len(hashes) - len(set(hashes))
+        if backend == "sqlite":
+            store.close()
+
+    latencies = sorted(lat for lats, _ in collected for lat in lats)
+    return {
+        "commits_per_s": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "revalidated": sum(count for _, count in collected),
+        "memories": len(hashes),
+        "duplicates": duplicates,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="並發寫入提交吞吐量")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--items", type=int, default=50, help="每個寫入進程提交的條數")
+    parser.add_argument("--encode-ms", type=float, default=20, help="模擬每次模型推理的耗時（毫秒）")
+    parser.add_argument("--mode", choices=["optimistic", "locked", "both"], default="both")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    args = parser.parse_args()
+
+    os.environ.update(YUE_ENCODER_BACKEND="hashing", YUE_INDEX_BACKEND=args.backend)
+    modes = ["optimistic", "locked"] if args.mode == "both" else [args.mode]
+    print(f"backend={args.backend} items/writer={args.items} encode={args.encode_ms}ms")
+    print(f"{'mode':>10} {'writers':>7} {'commits/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'revalidated':>11} {'memories':>8} {'dups':>5}")
+    for mode in modes:
+        for writers in args.writers:
+            row = run(writers, args.items, mode, args.encode_ms, args.backend)
+            print(f"{mode:>10} {writers:>7} {row['commits_per_s']:>10.1f} {row['p50_ms']:>8.1f} "
+                  f"{row['p99_ms']:>8.1f} {row['revalidated']:>11} {row['memories']:>8} {row['duplicates']:>5}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
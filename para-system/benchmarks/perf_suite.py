@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+記憶管線性能基準 - 編碼 / 查重 / 檢索 / 衰減 / 蒸餾的吞吐量、p50/p99 延遲與峰值 RSS
+合成語料（中英混合、真實的狀態分佈與時間戳）+ encoders 的 hashing 後端（確定性、離線），不需要下載模型。
+每個規模在獨立子進程的臨時工作區中運行（峰值 RSS 互不影響），結果輸出為 JSON，
+可用 --compare 與其他提交的結果對比。
+
+用法: python3 benchmarks/perf_suite.py [--sizes 1000 10000] [--out perf.json] [--compare base.json]
+      python3 benchmarks/perf_suite.py --sizes 100000 1000000 --queries 50
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+STAGES = ["encode", "encode_batch", "dedup", "retrieve", "retrieve_filtered", "decay_full", "decay", "distill"]
+
+WORDS_EN = ("memory decay index journal snapshot agent task deploy review cache vector model "
+            "user prefers tea release schedule bug fix design test server daemon latency").split()
+WORDS_ZH = ("記憶 衰減 強化 檢索 向量 模型 索引 日誌 快照 子代理 任務 用戶 設計 測試 部署 "
+            "喜歡 烏龍茶 發佈 排程 修復 服務 守護進程 延遲 原則 身份").split()
+ACTORS = ["Self", "空", "剀", "玥", "User"]
+TARGETS = ["Core", "Subagents", "Task", "Memory"]
+DOMAINS = ["World", "Role", "User"]
+# (狀態, 比例, 重要性範圍, 距今最多天數)
+STATES = [("Golden", 0.05, (0.85, 1.0), 365), ("Silver", 0.55, (0.5, 0.84), 14),
+          ("Bronze", 0.40, (0.2, 0.49), 90)]
+
+
+def sentence(rng):
+    words = WORDS_ZH if rng.random() < 0.5 else WORDS_EN
+    joiner = "" if words is WORDS_ZH else " "
+    return joiner.join(rng.choice(words) for _ in range(rng.randint(6, 24)))
+
+
+def synthetic_corpus(n, seed):
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    memories = []
+    for mem_id in range(1, n + 1):
+        pick, acc = rng.random(), 0.0
+        for state, share, (low, high), max_days in STATES:
+            acc += share
+            if pick <= acc:
+                break
+        created = now - datetime.timedelta(days=rng.uniform(0, max_days))
+        accessed = created + (now - created) * rng.random()
+        importance = round(rng.uniform(low, high), 4)
+        memories.append({
+            "id": mem_id, "content": f"{sentence(rng)} #{mem_id}",
+            "actor": rng.choice(ACTORS), "target": rng.choice(TARGETS), "domain": rng.choice(DOMAINS),
+            "initial_importance": importance, "current_importance": importance, "s_factor": 0.995,
+            "density": round(rng.uniform(0, 1), 2), "access_count": rng.randint(0, 5), "retrieval_count": 0,
+            "last_access": accessed.isoformat(), "creation_date": created.isoformat(), "state": state,
+        })
+    return memories
+
+
+def percentile_ms(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)] * 1000
+
+
+def peak_rss_mb():
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(usage / 1024 if sys.platform != "darwin" else usage / 1024 / 1024, 1)
+
+
+def summarize(latencies, items=None):
+    total = sum(latencies)
+    items = len(latencies) if items is None else items
+    return {"count": items, "seconds": round(total, 4),
+            "throughput_per_s": round(items / total, 1) if total else None,
+            "p50_ms": round(percentile_ms(latencies, 50), 3), "p99_ms": round(percentile_ms(latencies, 99), 3),
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def run_worker(size, queries, seed):
+    """子進程：YUE_WORKSPACE 已指向臨時目錄，構建語料後依次測量各階段"""
+    import io
+    import logging
+    import contextlib
+    logging.disable(logging.CRITICAL)
+
+    from config import Config
+    from index_store import open_index_store
+    import brain_encode
+    import brain_retrieve
+    import memory_decay
+    import memory_distill
+
+    from semantic_encoder import SemanticEncoder
+    encoder = SemanticEncoder(backend="hashing")
+    rng = random.Random(seed + 1)
+    results = {"size": size}
+
+    # === 構建語料 ===
+    t0 = time.perf_counter()
+    corpus = synthetic_corpus(size, seed)
+    os.makedirs(Config.MEMORY_DIR, exist_ok=True)
+    store = open_index_store()
+    if Config.INDEX_BACKEND == "json":
+        store.load()
+        store.index["memories"] = corpus
+        store.save()
+    else:
+        store.import_index({"memories": corpus})
+    for start in range(0, size, 10000):
+        chunk = corpus[start:start + 10000]
+        vecs = encoder.encode_many([mem["content"] for mem in chunk])
+        encoder.store.append_many([(mem["id"], vec) for mem, vec in zip(chunk, vecs)])
+    results["setup_seconds"] = round(time.perf_counter() - t0, 2)
+
+    def ingest(items):
+        """生產流程 brain_encode._locked_ingest（編碼器固定為 hashing 後端）"""
+        return brain_encode._locked_ingest(items, encoder=encoder)
+
+    def timed(fn, args):
+        latencies = []
+        for arg in args:
+            t = time.perf_counter()
+            fn(arg)
+            latencies.append(time.perf_counter() - t)
+        return latencies
+
+    new_items = [brain_encode.prepare_item(f"{sentence(rng)} new-{i}") for i in range(queries)]
+    results["encode"] = summarize(timed(lambda item: ingest([item]), new_items))
+
+    batch = [brain_encode.prepare_item(f"{sentence(rng)} batch-{i}") for i in range(max(queries * 5, 100))]
+    results["encode_batch"] = summarize(timed(ingest, [batch]), items=len(batch))
+
+    # 查重：一半只有空白不同（精確命中），一半追加一個詞（語義命中）
+    picks = [rng.choice(corpus)["content"] for _ in range(queries)]
+    dups = [brain_encode.prepare_item(("  " + text) if i % 2 else f"{text} {rng.choice(WORDS_EN)}")
+            for i, text in enumerate(picks)]
+    outcomes = []
+    results["dedup"] = summarize(timed(lambda item: outcomes.extend(ingest([item])), dups))
+    results["dedup"]["reinforced"] = sum(1 for outcome in outcomes if outcome[0] == "reinforced")
+
+    search_queries = [sentence(rng) for _ in range(queries)]
+    results["retrieve"] = summarize(timed(
+        lambda q: brain_retrieve.search_memories(q, 5, 0.3, encoder=encoder), search_queries))
+    results["retrieve_filtered"] = summarize(timed(
+        lambda q: brain_retrieve.search_memories(q, 5, 0.3, encoder=encoder,
+                                                 filters={"actor": "剀", "target": "Memory"}), search_queries))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["decay_full"] = summarize(timed(lambda _: memory_decay.apply_decay(full=True), [None]))
+        results["decay"] = summarize(timed(lambda _: memory_decay.apply_decay(), [None]))
+
+        # 蒸餾讀取 subagents/central_memory_index.json
+        memory_distill.INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(memory_distill.INDEX_FILE, 'w', encoding='utf-8') as f:
+            json.dump(open_index_store().load()["memories"], f, ensure_ascii=False)
+        results["distill"] = summarize(timed(lambda _: memory_distill.main(), [None]))
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """按規模 / 階段打印 p50 與吞吐量的變化"""
+    old = {str(run["size"]): run for run in baseline["runs"]}
+    print(f"\n對比 {baseline['meta'].get('commit')} → {current['meta'].get('commit')}")
+    print(f"{'size':>8} {'stage':>18} {'p50 ms':>18} {'Δ':>8} {'throughput/s':>22}")
+    for run in current["runs"]:
+        base = old.get(str(run["size"]))
+        if base is None:
+            continue
+        for stage in STAGES:
+            if stage not in run or stage not in base:
+                continue
+            now_p50, base_p50 = run[stage]["p50_ms"], base[stage]["p50_ms"]
+            delta = (now_p50 - base_p50) / base_p50 * 100 if base_p50 else 0.0
+            print(f"{run['size']:>8} {stage:>18} {base_p50:>8.2f} → {now_p50:<8.2f}"
+                  f"{delta:>+7.1f}% {base[stage]['throughput_per_s']!s:>10} → {run[stage]['throughput_per_s']!s:<10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記憶管線性能基準")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="語料規模（如 1000 10000 100000 1000000）")
+    parser.add_argument("--queries", type=int, default=50, help="每個階段的操作次數")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json", help="索引存儲後端")
+    parser.add_argument("--out", help="結果 JSON 路徑（默認輸出到 stdout）")
+    parser.add_argument("--compare", help="與之前的結果 JSON 對比")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        json.dump(run_worker(args.worker, args.queries, args.seed), sys.stdout)
+        return 0
+
+    import numpy
+    report = {"meta": {"commit": git_commit(), "created": datetime.datetime.now().isoformat(),
+                       "python": platform.python_version(), "numpy": numpy.__version__,
+                       "platform": platform.platform(), "cpus": os.cpu_count(), "seed": args.seed,
+                       "queries": args.queries, "backend": args.backend},
+              "runs": []}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, YUE_WORKSPACE=tmp, YUE_INDEX_BACKEND=args.backend,
+                       YUE_ENCODER_BACKEND="hashing")
+            proc = subprocess.run([sys.executable, __file__, "--worker", str(size), "--queries", str(args.queries),
+                                   "--seed", str(args.seed)], env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            return 1
+        run = json.loads(proc.stdout)
+        report["runs"].append(run)
+        print(f"size={size} setup={run['setup_seconds']}s peak_rss={run['peak_rss_mb']}MB", file=sys.stderr)
+        for stage in STAGES:
+            stats = run[stage]
+            print(f"  {stage:>18}: p50 {stats['p50_ms']:>9.2f} ms  p99 {stats['p99_ms']:>9.2f} ms  "
+                  f"{stats['throughput_per_s']!s:>9}/s", file=sys.stderr)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+CLI 啟動預算檢查 - 以 python -X importtime 測量常用命令的導入耗時
+每條命令：導入總耗時（多次運行取最小值）不超過預算，且不得導入重型模塊；
+--help 類命令還不得在工作區創建任何目錄。超出預算時返回非零（scripts/test-system.sh 調用）
+
+用法: python3 benchmarks/startup_budget.py [--runs 3] [--scale 1.0]
+"""
+
+import os
+import sys
+import json
+import argparse
+import datetime
+import tempfile
+import compileall
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 這些模塊只應在真正編碼 / 檢索時才加載
+HEAVY_MODULES = {"numpy", "torch", "sentence_transformers", "sqlite3", "transformers"}
+
+# (命令, 導入預算毫秒, 是否要求無文件系統副作用, 是否預置記憶)
+COMMANDS = [
+    (["brain_encode.py", "--help"], 150, True, False),
+    (["memory_decay.py", "--dry-run"], 150, False, True),
+    (["failure_classifier.py", "report"], 150, False, False),
+]
+
+# 預置的記憶數：空工作區會讓衰減提前返回，測不到真正的載入 / 計算路徑
+SEED_MEMORIES = 5
+
+
+def parse_importtime(stderr):
+    """返回 (導入總耗時毫秒, 已導入模塊集合)"""
+    total_us, modules = 0, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 表頭
+        total_us += int(fields[0])
+        modules.add(fields[2].strip())
+    return total_us / 1000, modules
+
+
+def seed_workspace(workspace):
+    """寫入一個只含幾條記憶的 index.json（不導入項目模塊，避免影響被測命令）"""
+    now = datetime.datetime.now()
+    memories = []
+    for mem_id in range(1, SEED_MEMORIES + 1):
+        created = (now - datetime.timedelta(days=mem_id * 7)).isoformat()
+        importance = round(0.3 + 0.1 * mem_id, 2)
+        memories.append({
+            "id": mem_id, "content": f"startup budget seed {mem_id}", "actor": "Self", "target": "Memory",
+            "domain": "World", "initial_importance": importance, "current_importance": importance,
+            "s_factor": 0.995, "density": 0.5, "access_count": 0, "retrieval_count": 0,
+            "last_access": created, "creation_date": created, "state": "Silver",
+        })
+    memory_dir = workspace / "memory"
+    memory_dir.mkdir(parents=True)
+    with open(memory_dir / "index.json", 'w', encoding='utf-8') as f:
+        json.dump({"memories": memories}, f, ensure_ascii=False)
+
+
+def measure(args, runs, seed=False):
+    """在臨時工作區中運行命令（seed 時預置幾條記憶），返回 (最小導入耗時, 模塊集合, 工作區是否被寫入)"""
+    best, modules, touched = None, set(), False
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            workspace = Path(tmp) / "workspace"
+            if seed:
+                seed_workspace(workspace)
+            env = dict(os.environ, YUE_WORKSPACE=str(workspace), YUE_ENCODER_BACKEND="sentence-transformers")
+            proc = subprocess.run([sys.executable, "-X", "importtime", str(ROOT / args[0]), *args[1:]],
+                                  env=env, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                  text=True, check=False)
+            elapsed, modules = parse_importtime(proc.stderr)
+            touched = touched or workspace.exists()
+            best = elapsed if best is None else min(best, elapsed)
+    return best, modules, touched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI 啟動預算檢查")
+    parser.add_argument("--runs", type=int, default=3, help="每條命令運行次數（取最小值）")
+    parser.add_argument("--scale", type=float, default=1.0, help="預算倍數（慢機器上放寬）")
+    args = parser.parse_args()
+
+    # 預先編譯，測量的是導入而不是編譯
+    compileall.compile_dir(str(ROOT), quiet=1, maxlevels=0)
+
+    failures = 0
+    for command, budget_ms, pure, seed in COMMANDS:
+        budget_ms *= args.scale
+        elapsed, modules, touched = measure(command, args.runs, seed)
+        heavy = sorted(HEAVY_MODULES & modules)
+        problems = []
+        if elapsed > budget_ms:
+            problems.append(f"{elapsed:.0f} ms > {budget_ms:.0f} ms")
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        if pure and touched:
+            problems.append("creates workspace directories")
+
+        name = " ".join(command)
+        if problems:
+            failures += 1
+            print(f"  ❌ {name}: {'; '.join(problems)}")
+        else:
+            print(f"  ✅ {name}: {elapsed:.0f} ms / {budget_ms:.0f} ms, {len(modules)} modules")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
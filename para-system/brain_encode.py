@@ -10,21 +10,20 @@ import datetime
 import argparse
 import sys
 import fcntl
+import importlib.util
+from collections import namedtuple
 from pathlib import Path
 
 # 導入配置和日誌
 from config import Config
 from logger import get_logger
+from index_store import open_index_store, content_key
+from decay_model import effective
 
 logger = get_logger('brain_encode')
 
-# 導入語義編碼器
-try:
-    from semantic_encoder import SemanticEncoder
-    SEMANTIC_AVAILABLE = True
-except ImportError:
-    SEMANTIC_AVAILABLE = False
-    logger.warning("semantic_encoder not available, falling back to difflib")
+# 語義編碼器（numpy / 模型）延遲到第一次編碼時導入，--help 與 difflib 路徑不加載
+SEMANTIC_AVAILABLE = importlib.util.find_spec("numpy") is not None
 
 # 使用統一配置
 WORKSPACE = Config.WORKSPACE
@@ -32,34 +31,13 @@ MEMORY_DIR = Config.MEMORY_DIR
 INDEX_PATH = Config.INDEX_PATH
 SIMILARITY_THRESHOLD = Config.SIMILARITY_THRESHOLD
 
-def load_index():
-    if os.path.exists(INDEX_PATH):
-        try:
-            with open(INDEX_PATH, 'r', encoding='utf-8') as f:
-                index = json.load(f)
-                logger.debug(f"Loaded index with {len(index.get('memories', []))} memories")
-                return index
-        except json.JSONDecodeError as e:
-            logger.error(f"Index file corrupted: {e}")
-            backup_path = str(INDEX_PATH) + ".corrupt"
-            if os.path.exists(backup_path):
-                os.remove(backup_path)
-            os.rename(INDEX_PATH, backup_path)
-            logger.warning(f"Corrupt file moved to {backup_path}. Initializing new index.")
-    
-    MEMORY_DIR.mkdir(parents=True, exist_ok=True)
-    logger.info("Initialized new index")
-    return {"memories": [], "last_sync": datetime.datetime.now().isoformat()}
-
-def save_index(data):
-    data["last_sync"] = datetime.datetime.now().isoformat()
-    try:
-        with open(INDEX_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        logger.debug(f"Saved index with {len(data.get('memories', []))} memories")
-    except Exception as e:
-        logger.error(f"Failed to save index: {e}")
-        raise
+# 強化時會修改的字段（寫入日誌記錄）
+REINFORCE_FIELDS = ("last_access", "access_count", "density", "current_importance", "state")
+
+# 查重決策：kind 為 new / exact / similar / fuzzy（無模型回退，強化幅度較小）；
+# 強化目標是現有記憶 mem_id，或本批先出現的條目 batch；score 為相似度
+Decision = namedtuple('Decision', ['kind', 'mem_id', 'batch', 'score'])
+NEW = Decision("new", None, None, None)
 
 def get_s_factor(domain):
     factors = {
@@ -88,158 +66,495 @@ def update_state(mem):
     else:
         mem["state"] = "Dust"
 
-def check_semantic_duplicate(content, memories, encoder, threshold=None):
+def prepare_item(content, actor=None, target=None, domain="Role", importance=0.5):
+    """自動識別關係標記與 !REMEMBER，返回規範化的編碼參數"""
+    auto_actor, auto_target = parse_relation(content)
+    item = {
+        "content": content,
+        "actor": actor or auto_actor or "Unknown",
+        "target": target or auto_target or "General",
+        "domain": domain or "Role",
+        "importance": importance if importance is not None else 0.5,
+    }
+    
+    # !REMEMBER logic
+    if "!REMEMBER" in content:
+        item["importance"] = 1.0
+        item["domain"] = "User"
+    return item
+
+def build_memory(item):
+    """根據編碼參數創建新記憶（id 由存儲後端分配）"""
+    content = item["content"]
+    importance = item["importance"]
+    
+    # Density 計算（靜態部分）
+    density_from_len = round(len(content) / 500.0, 2)
+    density_from_importance = importance * 0.8 if importance > 0.8 else 0
+    initial_density = max(density_from_len, density_from_importance)
+    
+    now = datetime.datetime.now().isoformat()
+    mem = {
+        "id": None,
+        "content": content,
+        "actor": item["actor"],
+        "target": item["target"],
+        "domain": item["domain"],
+        "initial_importance": importance,
+        "current_importance": importance,
+        "s_factor": get_s_factor(item["domain"]),
+        "density": initial_density,
+        "access_count": 0,
+        "retrieval_count": 0,
+        "last_access": now,
+        "creation_date": now,
+        "state": "Silver"
+    }
+    # 初始狀態
+    update_state(mem)
+    return mem
+
+def reinforce_memory(mem, importance, boost=None, density_boost=None):
+    """強化現有記憶（access_count + density 動態增長）"""
+    if boost is None:
+        boost = Config.REINFORCEMENT_BOOST
+    if density_boost is None:
+        density_boost = Config.DENSITY_BOOST
+    
+    # 先把錨點重要性折算到現在（閉式衰減），再以現在為新錨點
+    now = datetime.datetime.now()
+    mem["current_importance"], _ = effective(mem, now)
+    mem["last_access"] = now.isoformat()
+    mem["access_count"] = mem.get("access_count", 0) + 1
+    
+    # 動態增加 density（刻骨銘心效果，上限 5.0）
+    if density_boost:
+        mem["density"] = round(min(Config.MAX_DENSITY, mem.get("density", 0) + density_boost), 2)
+    
+    # 重要性提升（每次強化 +15%，上限 2.0）
+    mem["current_importance"] = min(
+        Config.MAX_IMPORTANCE, mem["current_importance"] + importance * boost
+    )
+    
+    # 更新狀態
+    update_state(mem)
+    return mem
+
+def _index_embeddings(encoder, pairs):
+    """保存新記憶的向量並增量更新 ANN 索引（僅在已構建時）"""
+    pairs = [(mem_id, vec) for mem_id, vec in pairs if vec is not None]
+    if not pairs:
+        return
+    encoder.store.append_many(pairs)
+    
+    if Config.ANN_INDEX_PATH.exists():
+        # 只載入質心；新 id 追加到增量日誌，不重寫整個 index.ann.npz
+        from ann_index import IVFIndex
+        ann = IVFIndex(lists=False)
+        for mem_id, vec in pairs:
+            ann.add(mem_id, vec)
+        ann.flush()
+
+def _plan(store, items, encoder, batch_size=None):
     """
-    使用 MiniLM 檢查語義重複
+    查重決策（只讀索引與向量庫，不修改任何記憶，可在鎖外執行）
+    規範化內容摘要精確命中的不經過模型；其餘一次批量模型推理、一次查重，批內重複也會被合併
     Returns:
-        (matched_memory, similarity_score) 或 (None, 0)
+        (decisions, vecs) - 每條一個 Decision；vecs[i] 為歸一化向量（無模型時為 None）
     """
-    if threshold is None:
-        threshold = SIMILARITY_THRESHOLD
+    decisions = [None] * len(items)
+    vecs = [None] * len(items)
+    
+    # === 精確查重（content_hash）===
+    pending, first_of = [], {}
+    for idx, item in enumerate(items):
+        key = content_key(item["content"])
+        mem = store.find_duplicate(key)
+        if mem is not None:
+            decisions[idx] = Decision("exact", mem["id"], None, 1.0)
+        elif key in first_of:
+            decisions[idx] = Decision("exact", None, first_of[key], 1.0)  # 批內逐字重複
+        else:
+            first_of[key] = idx
+            pending.append(idx)
+    if len(pending) < len(items):
+        logger.debug(f"Exact duplicates: {len(items) - len(pending)}/{len(items)} items skipped the model")
+    
+    encoded = None
+    if pending and encoder and SEMANTIC_AVAILABLE:
+        # === 語義查重（MiniLM）===
+        encoded = encoder.encode_many([items[idx]["content"] for idx in pending], batch_size)
     
-    if not memories:
-        return None, 0
+    if encoded is not None:
+        import numpy as np
+        from dedup import DedupEngine
+        from embedding_store import normalize
+        
+        hits = DedupEngine(encoder.store).find_many(encoded, store.get)
+        batch_new, batch_vecs = [], []  # 本批新記憶的條目與向量
+        for idx, vec, hit in zip(pending, encoded, hits):
+            vecs[idx] = vec = normalize(vec)
+            if hit.near:
+                logger.debug("Near duplicates: " + ", ".join(
+                    f"#{mem['id']} ({score:.2f})" for mem, score in hit.near))
+            
+            # 批內查重：與本批已決定新增的記憶比較
+            batch_idx, batch_score = None, 0
+            if batch_vecs:
+                sims = np.stack(batch_vecs) @ vec
+                j = int(np.argmax(sims))
+                if sims[j] >= SIMILARITY_THRESHOLD:
+                    batch_idx, batch_score = batch_new[j], float(sims[j])
+            
+            if batch_idx is not None and batch_score >= hit.score:
+                decisions[idx] = Decision("similar", None, batch_idx, batch_score)
+            elif hit.best is not None:
+                decisions[idx] = Decision("similar", hit.best["id"], None, hit.score)
+            else:
+                decisions[idx] = NEW
+                batch_new.append(idx)
+                batch_vecs.append(vec)
+    elif pending:
+        # Fallback（無 MiniLM 時）：MinHash/LSH 找候選，difflib 只確認少數候選
+        from minhash import MinHashIndex, signature, band_keys, jaccard
+        lsh = MinHashIndex()
+        if lsh.count() != store.count():
+            lsh.rebuild(store.memories())
+        batch_buckets = {}  # 本批新記憶的分段桶 → [(條目, 簽名)]
+        for idx in pending:
+            content = items[idx]["content"]
+            sig = signature(content)
+            keys = band_keys(sig)
+            candidates = [(mem_id, None) for mem_id, _ in lsh.candidates(sig, Config.MINHASH_CONFIRM)]
+            batch = {j: j_sig for key in keys for j, j_sig in batch_buckets.get(key, [])}
+            candidates += [(None, j) for j in sorted(batch, key=lambda j: jaccard(sig, batch[j]),
+                                                     reverse=True)[:Config.MINHASH_CONFIRM]]
+            decisions[idx] = _fuzzy_match(content, candidates, store, items) or NEW
+            if decisions[idx] is NEW:
+                for key in keys:
+                    batch_buckets.setdefault(key, []).append((idx, sig))
     
-    best_match = None
-    best_score = 0
+    return decisions, vecs
+
+def _fuzzy_match(content, candidates, store, items):
+    """difflib 確認候選 [(記憶 id, None) 或 (None, 批內條目)]，返回第一個相似度 > 0.95 的決策"""
+    import difflib
+    for mem_id, batch_idx in candidates:
+        if batch_idx is not None:
+            text = items[batch_idx]["content"]
+        else:
+            mem = store.get(mem_id)
+            if mem is None:
+                continue
+            text = mem["content"]
+        ratio = difflib.SequenceMatcher(None, text, content).ratio()
+        if ratio > 0.95:
+            return Decision("fuzzy", mem_id, batch_idx, ratio)
+    return None
+
+def _load_encoder():
+    """加載語義編碼器；依賴缺失時返回 None（回退 difflib）"""
+    if not SEMANTIC_AVAILABLE:
+        return None
+    try:
+        from semantic_encoder import SemanticEncoder
+        return SemanticEncoder()
+    except ImportError as e:
+        logger.warning(f"semantic_encoder not available ({e}), falling back to difflib")
+        return None
+
+def _encode_orphans(store, items, decisions, vecs, encoder, batch_size=None):
+    """
+    強化目標被刪除、改為新增的條目：精確命中時規劃沒有經過模型，這裡補上推理與語義查重
+    （調用方持有排他鎖；只在衰減與寫入交錯時發生）
+    Returns:
+        encoder - 規劃時因全部精確命中而未加載的，在這裡加載
+    """
+    orphans = [idx for idx, decision in enumerate(decisions) if decision is NEW and vecs[idx] is None]
+    if not orphans:
+        return encoder
+    if encoder is None:
+        encoder = _load_encoder()
+    if encoder is None:
+        return None
+    from dedup import DedupEngine
+    from embedding_store import normalize
+    encoder.store.refresh()
+    encoded = encoder.encode_many([items[idx]["content"] for idx in orphans], batch_size)
+    if encoded is None:
+        return encoder
+    hits = DedupEngine(encoder.store).find_many(encoded, store.get)
+    for idx, vec, hit in zip(orphans, encoded, hits):
+        vecs[idx] = normalize(vec)
+        if hit.best is not None:
+            decisions[idx] = Decision("similar", hit.best["id"], None, hit.score)
+    return encoder
+
+def _revalidate(store, items, decisions, vecs, encoder, last_id, batch_size=None):
+    """
+    規劃之後版本號變化時只複核查重決策（調用方持有排他鎖）：
+    強化目標被刪除的改為新增（補上推理，見 _encode_orphans）；
+    新增的與期間其他寫入方新增的記憶（id > last_id）再比一次
+    Returns:
+        (decisions, encoder)
+    """
+    planned = list(decisions)
+    orphan_of = {}  # 內容摘要 → 本批第一個失去強化目標的條目（同一內容只新增一次）
+    for idx, decision in enumerate(decisions):
+        if decision.mem_id is not None and store.get(decision.mem_id) is None:
+            # 強化目標已被衰減刪除
+            key = content_key(items[idx]["content"])
+            if key in orphan_of:
+                decisions[idx] = Decision("exact", None, orphan_of[key], 1.0)
+            else:
+                orphan_of[key] = idx
+                decisions[idx] = NEW
+    encoder = _encode_orphans(store, items, decisions, vecs, encoder, batch_size)
     
-    for mem in memories:
-        mem_vec = encoder._get_memory_embedding(mem)
-        if mem_vec is not None:
-            from sentence_transformers import util
-            query_vec = encoder.encode(content)
-            score = float(util.cos_sim(query_vec, mem_vec)[0][0])
-            if score > best_score and score >= threshold:
-                best_score = score
-                best_match = mem
+    added = store.added_since(last_id)
+    added_ids, added_matrix = [], None
+    if added and encoder is not None and any(vec is not None for vec in vecs):
+        import numpy as np
+        encoder.store.refresh()
+        added_ids, rows = encoder.store.rows_for([mem["id"] for mem in added])
+        if added_ids:
+            added_matrix = np.asarray(encoder.store.matrix[rows])
     
-    return best_match, best_score
+    for idx, decision in enumerate(decisions):
+        if decision is NEW:
+            content = items[idx]["content"]
+            mem = store.find_duplicate(content_key(content))
+            if mem is not None:
+                decision = Decision("exact", mem["id"], None, 1.0)
+            elif vecs[idx] is not None and added_matrix is not None:
+                sims = added_matrix @ vecs[idx]
+                j = int(sims.argmax())
+                if sims[j] >= SIMILARITY_THRESHOLD:
+                    decision = Decision("similar", added_ids[j], None, float(sims[j]))
+            elif vecs[idx] is None and added:
+                decision = _fuzzy_match(content, [(mem["id"], None) for mem in added], store, items) or NEW
+        decisions[idx] = decision
+    changed = sum(decision != before for decision, before in zip(decisions, planned))
+    logger.debug(f"Index version moved: re-validated {len(decisions)} decisions against "
+                 f"{len(added)} new memories, {changed} changed")
+    return decisions, encoder
 
-def encode_memory(content, actor=None, target=None, domain="Role", importance=0.5):
+def _commit(store, items, decisions, vecs, encoder):
+    """
+    按查重決策一次提交（調用方持有排他鎖）
+    Returns:
+        [(status, memory, similarity, density_boost), ...] - status 為 "new" 或 "reinforced"；
+        density_boost 為這次強化實際增加的 density（無模型回退的 fuzzy 強化為 0，新增為 None）
+    """
+    # 先合併讀路徑緩衝的檢索計數，強化看到的是完整的使用統計
+    from usage_buffer import UsageBuffer
+    UsageBuffer().merge(store)
+    before = store.version
+    
+    outcomes = [None] * len(items)
+    new_memories, new_vecs = [], []
+    reinforced = {}  # id → 被強化的現有記憶（同一記憶多次命中時共用同一個 dict）
+    for idx, (item, decision) in enumerate(zip(items, decisions)):
+        # 批內重複指向先出現的條目：它新增的記憶或它強化的記憶
+        mem = None
+        if decision.batch is not None:
+            mem = outcomes[decision.batch][1]
+        elif decision.mem_id is not None:
+            mem = store.get(decision.mem_id)
+        if mem is None:
+            mem = build_memory(item)
+            new_memories.append(mem)
+            new_vecs.append(vecs[idx])
+            outcomes[idx] = ("new", mem, None, None)
+            continue
+        if mem.get("id") is not None:
+            mem = reinforced.setdefault(mem["id"], mem)
+        density = mem.get("density", 0)
+        if decision.kind == "fuzzy":
+            reinforce_memory(mem, item["importance"], boost=0.1, density_boost=0)
+        else:
+            reinforce_memory(mem, item["importance"])
+        outcomes[idx] = ("reinforced", mem, decision.score, round(mem["density"] - density, 2))
+    
+    # === 單次提交 ===
+    store.update_many("reinforce", [(mem, REINFORCE_FIELDS) for mem in reinforced.values()])
+    if reinforced and not hasattr(store, 'due_shards'):
+        # 衰減排程：強化後的轉換時間可能提前，記下 id 由下次衰減重新入堆（分片存儲由清單的 next_due 處理）
+        from decay_model import DecaySchedule
+        DecaySchedule().touch(list(reinforced))
+    if new_memories:
+        store.add_many(new_memories)
+    store.maybe_compact()
+    
+    # 全文倒排索引增量更新（僅在已構建時）
+    if new_memories and Config.TEXT_INDEX_PATH.exists():
+        from text_index import TextIndex
+        TextIndex().add_many([(mem["id"], mem["content"]) for mem in new_memories])
+    
+    if new_memories and Config.MINHASH_PATH.exists():
+        from minhash import MinHashIndex
+        MinHashIndex().add_many([(mem["id"], mem["content"]) for mem in new_memories])
+    
+    # 元數據索引同步新增與強化後的狀態，並把戳記推進到本次提交的版本（僅在已構建時）
+    if Config.META_INDEX_PATH.exists():
+        from meta_index import MetaIndex
+        meta = MetaIndex()
+        meta.upsert_many(list(reinforced.values()) + new_memories)
+        meta.advance(before, store.version)
+    
+    # 保存嵌入向量（供未來語義搜尋使用）
+    if encoder is not None:
+        _index_embeddings(encoder, [(mem["id"], vec) for mem, vec in zip(new_memories, new_vecs)])
+        # 分片存儲：新向量累加進所在分片的質心（檢索據此選擇分片）
+        add_vectors = getattr(store, 'add_vectors', None)
+        if add_vectors is not None:
+            add_vectors([(mem, vec) for mem, vec in zip(new_memories, new_vecs) if vec is not None],
+                        encoder.model_name)
+    
+    return outcomes
+
+def _ingest(store, items, encoder, batch_size=None):
+    """
+    編碼一批記憶（調用方持有排他鎖）：查重決策與提交在同一個鎖內
+    生產路徑是 _locked_ingest（推理在鎖外）；這裡只留給 bench_writers 的 locked 對照組
+    Returns:
+        與 _commit 相同
+    """
+    decisions, vecs = _plan(store, items, encoder, batch_size)
+    return _commit(store, items, decisions, vecs, encoder)
+
+def _needs_model(store, items):
+    """不加鎖預查：每條都是精確重複時不必加載模型"""
+    if not store.exists():
+        return True
+    store.refresh()
+    return any(store.find_duplicate(content_key(item["content"])) is None for item in items)
+
+def _locked_ingest(items, batch_size=None, encoder=None, store=None):
+    """
+    樂觀並發：鎖外加載編碼器、模型推理與查重，記下索引版本號；
+    持排他鎖時版本未變直接提交，變了只複核查重決策再提交（鎖內沒有模型推理）
+    常駐調用方（守護進程的合併提交）可傳入長期持有的 encoder 與 store
+    """
     lock_path = os.path.join(MEMORY_DIR, "index.lock")
     os.makedirs(MEMORY_DIR, exist_ok=True)
+    store = store or open_index_store()
+    
+    # 初始化語義編碼器（如果可用；全部精確命中時跳過）
+    if encoder is None and SEMANTIC_AVAILABLE and _needs_model(store, items):
+        encoder = _load_encoder()
     
-    # 初始化語義編碼器（如果可用）
-    encoder = SemanticEncoder() if SEMANTIC_AVAILABLE else None
+    store.refresh()
+    version, last_id = store.version, store.last_id()
+    decisions, vecs = _plan(store, items, encoder, batch_size)
     
     with open(lock_path, 'w') as lock_file:
         try:
             # Concurrency: Acquire exclusive lock for writing
             fcntl.flock(lock_file, fcntl.LOCK_EX)
-            index = load_index()
-            
-            # Auto-detect relation tags
-            auto_actor, auto_target = parse_relation(content)
-            actor = actor or auto_actor or "Unknown"
-            target = target or auto_target or "General"
-            
-            # !REMEMBER logic
-            if "!REMEMBER" in content:
-                importance = 1.0
-                domain = "User"
-            
-            s_factor = get_s_factor(domain)
-            
-            # === 語義查重（MiniLM）===
-            if encoder and SEMANTIC_AVAILABLE:
-                similar_mem, similarity = check_semantic_duplicate(
-                    content, index["memories"], encoder, threshold=SIMILARITY_THRESHOLD
-                )
-                
-                if similar_mem and similarity >= 0.75:
-                    # 強化現有記憶（access_count + density 動態增長）
-                    similar_mem["last_access"] = datetime.datetime.now().isoformat()
-                    similar_mem["access_count"] = similar_mem.get("access_count", 0) + 1
-                    
-                    # 動態增加 density（刻骨銘心效果，上限 5.0）
-                    similar_mem["density"] = round(min(5.0, similar_mem.get("density", 0) + 0.2), 2)
-                    
-                    # 重要性提升（每次強化 +15%，上限 2.0）
-                    similar_mem["current_importance"] = min(
-                        2.0, similar_mem["current_importance"] + importance * 0.15
-                    )
-                    
-                    # 更新狀態
-                    update_state(similar_mem)
-                    save_index(index)
-                    
-                    print(f"Memory #{similar_mem['id']} Reinforced (Similarity: {similarity:.2f})")
-                    print(f" Access count: {similar_mem['access_count']}")
-                    print(f" Density boost: +0.2 → {similar_mem['density']}")
-                    return similar_mem
-            
-            else:
-                # Fallback: 使用 difflib（無 MiniLM 時）
-                import difflib
-                for mem in index["memories"]:
-                    ratio = difflib.SequenceMatcher(None, mem["content"], content).ratio()
-                    if ratio > 0.95:
-                        mem["last_access"] = datetime.datetime.now().isoformat()
-                        mem["access_count"] = mem.get("access_count", 0) + 1
-                        mem["current_importance"] = min(2.0, mem["current_importance"] + importance * 0.1)
-                        update_state(mem)
-                        save_index(index)
-                        
-                        print(f"Memory #{mem['id']} Reinforced (Similarity: {ratio:.2f})")
-                        return mem
-            
-            # === 新記憶 ===
-            # Density 計算（靜態部分）
-            density_from_len = round(len(content) / 500.0, 2)
-            density_from_importance = importance * 0.8 if importance > 0.8 else 0
-            initial_density = max(density_from_len, density_from_importance)
-            
-            # ID Logic
-            max_id = 0
-            if index["memories"]:
-                max_id = max(m["id"] for m in index["memories"])
-            
-            # 初始狀態
-            state = "Silver"
-            if importance >= 0.85: state = "Golden"
-            elif importance < 0.20: state = "Dust"
-            elif importance < 0.50: state = "Bronze"
-            
-            new_memory = {
-                "id": max_id + 1,
-                "content": content,
-                "actor": actor,
-                "target": target,
-                "domain": domain,
-                "initial_importance": importance,
-                "current_importance": importance,
-                "s_factor": s_factor,
-                "density": initial_density,
-                "access_count": 0,
-                "retrieval_count": 0,
-                "last_access": datetime.datetime.now().isoformat(),
-                "creation_date": datetime.datetime.now().isoformat(),
-                "state": state
-            }
-            
-            # 保存嵌入向量（供未來語義搜尋使用）
-            if encoder and SEMANTIC_AVAILABLE:
-                encoder.save_embedding(new_memory['id'], content)
-            
-            index["memories"].append(new_memory)
-            save_index(index)
-            
-            print(f"Successfully encoded memory #{new_memory['id']}")
-            print(f" Initial density: {initial_density}")
-            print(f" State: {state}")
-            return new_memory
-        
+            # 規劃之後其他寫入方追加的日誌在這裡補上
+            store.refresh()
+            if store.version != version:
+                decisions, encoder = _revalidate(store, items, decisions, vecs, encoder, last_id, batch_size)
+            return _commit(store, items, decisions, vecs, encoder)
         finally:
             fcntl.flock(lock_file, fcntl.LOCK_UN)
 
+def _ingest_items(items, batch_size=None):
+    """守護進程在監聽時交給它合併提交（並發寫入方共用一批推理與一次提交），否則本進程提交"""
+    client = None
+    if Config.use_daemon():
+        from model_daemon import connect
+        client = connect()
+    if client is not None:
+        from model_daemon import DaemonRejected
+        try:
+            return client.ingest(items)
+        except (OSError, DaemonRejected) as e:
+            # 只在請求未送達或守護進程未提交就拒絕時回退；送出後失去響應（DaemonRequestLost）
+            # 可能已經提交，本進程重做會重複強化，直接拋出
+            logger.warning(f"Daemon ingest failed ({e}), encoding in process")
+    return _locked_ingest(items, batch_size)
+
+def encode_memory(content, actor=None, target=None, domain="Role", importance=0.5):
+    item = prepare_item(content, actor, target, domain, importance)
+    status, mem, similarity, density_boost = _ingest_items([item])[0]
+    
+    if status == "reinforced":
+        print(f"Memory #{mem['id']} Reinforced (Similarity: {similarity:.2f})")
+        print(f" Access count: {mem['access_count']}")
+        print(f" Density boost: +{density_boost} → {mem['density']}")
+    else:
+        print(f"Successfully encoded memory #{mem['id']}")
+        print(f" Initial density: {mem['density']}")
+        print(f" State: {mem['state']}")
+    return mem
+
+def read_batch(source):
+    """讀取 JSONL（每行一個對象，至少包含 content；也接受純文本行）"""
+    stream = sys.stdin if source == "-" else open(source, 'r', encoding='utf-8')
+    try:
+        items = []
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = {"content": line}
+            if isinstance(record, str):
+                record = {"content": record}
+            if not isinstance(record, dict) or not record.get("content"):
+                logger.warning(f"Skipping batch line {line_no}: missing content")
+                continue
+            items.append((line_no, prepare_item(
+                record["content"], record.get("actor"), record.get("target"),
+                record.get("domain", "Role"), record.get("score", record.get("importance", 0.5)),
+            )))
+        return items
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def encode_batch(source, batch_size=None, out=None):
+    """
+    批量編碼 JSONL 文件（或 "-" 表示 stdin）
+    一次持鎖、一次批量推理、一次提交，每條結果以 JSONL 輸出
+    """
+    out = out or sys.stdout
+    lines = read_batch(source)
+    if not lines:
+        logger.warning("Batch is empty")
+        return []
+    
+    outcomes = _ingest_items([item for _, item in lines], batch_size)
+    for (line_no, _), (status, mem, similarity, _) in zip(lines, outcomes):
+        record = {"line": line_no, "status": status, "id": mem["id"], "state": mem["state"]}
+        if similarity is not None:
+            record["similarity"] = round(similarity, 4)
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+    
+    counts = {status: sum(1 for outcome in outcomes if outcome[0] == status) for status in ("new", "reinforced")}
+    logger.info(f"Batch encoded {len(outcomes)} items ({counts['new']} new, {counts['reinforced']} reinforced)")
+    return outcomes
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Octagram Brain Encode v2.1 - Semantic Edition")
-    parser.add_argument("content", nargs="+", help="Content to encode")
+    parser.add_argument("content", nargs="*", help="Content to encode")
     parser.add_argument("--actor", help="Source actor")
     parser.add_argument("--target", help="Target project")
     parser.add_argument("--domain", choices=["World", "Role", "User"], default="Role")
     parser.add_argument("--score", type=float, default=0.5)
+    parser.add_argument("--batch", metavar="FILE", help="批量編碼 JSONL 文件（- 表示 stdin），結果以 JSONL 輸出")
+    parser.add_argument("--batch-size", type=int, default=Config.ENCODE_BATCH_SIZE, help="模型批量推理大小")
     args = parser.parse_args()
     
-    content_str = " ".join(args.content)
-    encode_memory(content_str, args.actor, args.target, args.domain, args.score)
+    if args.batch:
+        encode_batch(args.batch, args.batch_size)
+    elif args.content:
+        content_str = " ".join(args.content)
+        encode_memory(content_str, args.actor, args.target, args.domain, args.score)
+    else:
+        parser.error("content or --batch is required")
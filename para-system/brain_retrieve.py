@@ -7,12 +7,15 @@ import json
 import os
 import sys
 import argparse
-import fcntl
+import datetime
 from pathlib import Path
 
 # 導入配置和日誌
 from config import Config
 from logger import get_logger
+from index_store import open_index_store
+from decay_model import effective
+from meta_index import parse_since
 
 logger = get_logger('brain_retrieve')
 
@@ -22,113 +25,245 @@ MEMORY_DIR = Config.MEMORY_DIR
 INDEX_PATH = Config.INDEX_PATH
 RETRIEVAL_THRESHOLD = Config.RETRIEVAL_THRESHOLD
 
-def load_index():
-    """載入記憶索引（帶共享鎖，支持多進程並發讀取）"""
-    if not os.path.exists(INDEX_PATH):
+def load_index(filters=None, query_vec=None, model=None):
+    """
+    載入記憶索引（快照 + 日誌重放；不加鎖，讀到的是打開時的一致快照，不等待寫入方）
+    分片存儲只讀取與過濾條件 / 查詢向量相關的分片（見 ShardedIndexStore.route），返回值帶 "shards" 字段
+    """
+    store = open_index_store()
+    if not store.exists():
         logger.warning(f"Index file not found: {INDEX_PATH}")
         return None
     
-    lock_path = os.path.join(MEMORY_DIR, "index.lock")
-    os.makedirs(MEMORY_DIR, exist_ok=True)
-    
     try:
-        with open(lock_path, 'w') as lock_file:
-            # 共享鎖：允許多個讀進程同時訪問
-            fcntl.flock(lock_file, fcntl.LOCK_SH)
-            try:
-                with open(INDEX_PATH, 'r', encoding='utf-8') as f:
-                    index = json.load(f)
-                    logger.debug(f"Loaded index with {len(index.get('memories', []))} memories")
-                    return index
-            finally:
-                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        if hasattr(store, 'route'):
+            return store.load(repair=False, shards=store.route(filters, query_vec, model))
+        return store.load(repair=False)
     except Exception as e:
         logger.error(f"Failed to load index: {e}")
         return None
 
-def search_memories(query, top_k=5, threshold=None):
-    """語義搜尋記憶（使用向量快取，性能優化 100 倍）"""
+def filter_memories(memories, filters, scan=False, version=None):
+    """
+    元數據過濾：在倒排索引上求候選 id，state 條件再按有效狀態複核
+    filters: {state, actor, target, domain, since}，值為 None 的條件忽略
+    scan: memories 只是部分記憶（分片存儲已按條件剪枝）時直接逐條比較，不用倒排索引
+    version: memories 所屬的索引版本；倒排索引的戳記不同（或未構建）時同樣逐條比較（讀路徑不重建）
+    """
+    if not scan:
+        from meta_index import MetaIndex
+        
+        meta = MetaIndex() if Config.META_INDEX_PATH.exists() else None
+        if meta is None or version is None or meta.stamp() != version:
+            logger.info(f"Metadata index missing or stale (index version {version}), filtering in memory")
+            scan = True
+    if scan:
+        since = filters.get('since')
+        subset = [mem for mem in memories
+                  if all(mem.get(field) == filters[field] for field in ('actor', 'target', 'domain') if filters.get(field))
+                  and (not since or (mem.get('creation_date') or '') >= since)]
+    else:
+        ids = meta.select(**filters)
+        subset = [mem for mem in memories if mem.get('id') in ids]
+    if filters.get('state'):
+        now = datetime.datetime.now()
+        subset = [mem for mem in subset if effective(mem, now)[1] == filters['state']]
+    logger.debug(f"Filters {filters} matched {len(subset)}/{len(memories)} memories")
+    return subset
+
+def hybrid_rank(query, memories, store, query_vec, ann=None, nprobe=None, corpus=None):
+    """
+    BM25 先取關鍵詞候選，只對「關鍵詞候選 ∪ ANN 候選」讀取向量行打分，再做 Reciprocal Rank Fusion
+    不做全矩陣打分：ANN 索引未使用時向量排名只覆蓋關鍵詞候選
+    Returns:
+        (scored, fused, keyword_ids) - [(mem, 餘弦相似度), ...]、{id: 融合分數}、
+        命中查詢詞項比例達到 Config.HYBRID_MIN_MATCH 的 id 集合（可不受相似度閾值限制）
+    corpus: 全部記憶（倒排索引未構建時用於構建；memories 可能是過濾後的子集；None 時重新載入完整索引）
+    """
+    import numpy as np
+    from text_index import TextIndex
+    
+    text = TextIndex()
+    if not text.exists():
+        logger.info("Text index not built yet, building from current index")
+        text.rebuild(load_index()['memories'] if corpus is None else corpus)
+    by_id = {mem.get('id'): mem for mem in memories}
+    keyword_hits = [hit for hit in text.search(query, Config.HYBRID_CANDIDATES) if hit[0] in by_id]
+    
+    cosine = {}
+    if ann is not None:
+        ids, scores = ann.search(query_vec, store, k=Config.HYBRID_CANDIDATES, nprobe=nprobe)
+        cosine = {mem_id: float(score) for mem_id, score in zip(ids, scores) if mem_id in by_id}
+    extra = [mem_id for mem_id, _, _ in keyword_hits if mem_id not in cosine]
+    found, rows = store.rows_for(extra)
+    if found:
+        order = np.argsort(rows)  # 行號排序後讀取，memmap 順序訪問
+        for i, score in zip(order.tolist(), np.asarray(store.matrix[rows[order]]) @ query_vec):
+            cosine[found[i]] = float(score)
+    
+    vector_rank = sorted(cosine, key=cosine.get, reverse=True)
+    fused = {}
+    for ranking in (vector_rank, [mem_id for mem_id, _, _ in keyword_hits]):
+        for rank, mem_id in enumerate(ranking, 1):
+            fused[mem_id] = fused.get(mem_id, 0.0) + 1.0 / (Config.RRF_K + rank)
+    
+    logger.debug(f"Hybrid: {len(keyword_hits)} keyword hits, {len(cosine)} vectors scored")
+    scored = [(by_id[mem_id], cosine.get(mem_id, 0.0)) for mem_id in fused]
+    strong = {mem_id for mem_id, _, matched in keyword_hits if matched >= Config.HYBRID_MIN_MATCH}
+    return scored, fused, strong
+
+def search_memories(query, top_k=5, threshold=None, mode='auto', nprobe=None, encoder=None, filters=None):
+    """
+    語義搜尋記憶
+    mode: 'exact' 全矩陣一次矩陣乘法；'ann' 使用 IVF 索引；
+          'auto' 記憶數達到 ANN_MIN_SIZE 且索引已構建時使用 ANN；
+          'hybrid' BM25 關鍵詞候選與 ANN 候選（auto 規則）做 RRF 融合，不做全矩陣打分
+    encoder: 提供 encode_many(texts) 的編碼器（默認 SemanticEncoder，守護進程在時自動轉發）
+    filters: 元數據過濾條件（見 filter_memories），先過濾再只對子集打分
+    """
     if threshold is None:
         threshold = RETRIEVAL_THRESHOLD
+    filters = {key: value for key, value in (filters or {}).items() if value}
     
     try:
-        from sentence_transformers import SentenceTransformer, util
         import numpy as np
+        from embedding_store import EmbeddingStore, normalize
+        from embedding_cache import get_query_cache
     except ImportError as e:
         logger.error(f"Missing dependencies: {e}")
-        print("❌ 缺少依賴: sentence-transformers 或 numpy")
+        print("❌ 缺少依賴: numpy")
         print("請執行: pip3 install -r requirements.txt")
         sys.exit(1)
     
-    index = load_index()
-    if not index:
+    if not open_index_store().exists():
         logger.warning("Index is empty or not found")
         return []
     
     logger.info(f"Searching for: '{query}' (threshold: {threshold})")
     
-    # 載入模型（只加載一次）
+    # 載入模型（守護進程在監聽時不在本進程加載）
+    if encoder is None:
+        from semantic_encoder import SemanticEncoder
+        encoder = SemanticEncoder()
+        if not encoder.available:
+            # 後端依賴缺失（守護進程也不在）：與缺少 numpy 一樣明確報錯退出
+            if Config.ENCODER_BACKEND == 'daemon':
+                print(f"❌ 模型守護進程未運行: {Config.DAEMON_SOCKET}")
+                print("請執行: python3 model_daemon.py serve")
+            else:
+                print(f"❌ 缺少依賴: sentence-transformers（當前編碼器後端: {Config.ENCODER_BACKEND}）")
+                print("請執行: pip3 install -r requirements.txt（或啟動 model_daemon.py serve）")
+            sys.exit(1)
+        if encoder.store_mismatch:
+            return []  # 向量庫由其他編碼器寫入（_open_store 已記錄錯誤）
+    query_cache = get_query_cache(encoder.model_name)
     try:
-        model = SentenceTransformer(Config.SEMANTIC_MODEL)
-        query_vec = model.encode(query, convert_to_tensor=False)  # 返回 numpy 數組
+        # 重複的查詢直接取快取向量，不經過模型
+        query_vec = query_cache.get_or_encode(query, encoder.encode_many)
     except Exception as e:
         logger.error(f"Failed to encode query: {e}")
         return []
     
-    results = []
-    embedding_dir = Config.EMBEDDINGS_DIR
-    cache_hits = 0
-    cache_misses = 0
+    # SemanticEncoder 已打開並核對過向量庫；守護進程傳入自身時按其 model_name 打開
+    store = getattr(encoder, 'store', None)
+    if store is None:
+        store = EmbeddingStore(model=encoder.model_name)
+        if store.model not in (None, encoder.model_name):
+            logger.error(f"Embedding store was built with {store.model}, not {encoder.model_name}")
+            return []
+    # 分片存儲按過濾條件與質心只讀取相關分片（精確模式不按質心剪枝）
+    index = load_index(filters, None if mode == 'exact' else query_vec, encoder.model_name)
+    if not index:
+        return []
+    # 分片存儲確實跳過了分片時只有部分記憶：按行打分；讀取了全部分片時與單一索引一樣走量化 / 全矩陣路徑
+    partial = bool(index.get('skipped'))
+    memories = index.get('memories', [])
+    corpus = None if partial else memories
+    if filters:
+        memories = filter_memories(memories, filters, scan=partial, version=index.get('version'))
+        if not memories:
+            logger.info("No memories match the filters")
+            return []
     
-    for mem in index.get('memories', []):
+    # 缺少向量的記憶現場編碼，追加到向量矩陣供下次使用
+    missing = [mem for mem in memories if mem.get('id') not in store]
+    cache_hits = len(memories) - len(missing)
+    cache_misses = len(missing)
+    if missing:
         try:
-            mem_id = mem.get('id')
-            
-            # 優先使用預存的向量文件（快速路徑）
-            embedding_path = embedding_dir / f"mem_{mem_id}.npy"
-            if embedding_path.exists():
-                try:
-                    mem_vec = np.load(embedding_path)
-                    cache_hits += 1
-                    # 轉換為 tensor 計算相似度
-                    from sentence_transformers import util
-                    score = float(util.cos_sim(query_vec, mem_vec)[0][0])
-                except Exception as e:
-                    # 向量文件損壞，回退到重新編碼
-                    logger.warning(f"Corrupted embedding for memory #{mem_id}, regenerating...")
-                    mem_vec = model.encode(mem.get('content', ''), convert_to_tensor=False)
-                    score = float(util.cos_sim(query_vec, mem_vec)[0][0])
-            else:
-                # 向量文件不存在，現場編碼（並保存以供下次使用）
-                cache_misses += 1
-                mem_content = mem.get('content', '')
-                mem_vec = model.encode(mem_content, convert_to_tensor=False)
-                
-                # 嘗試保存向量（非關鍵操作，失敗不影響搜尋）
-                try:
-                    embedding_dir.mkdir(parents=True, exist_ok=True)
-                    np.save(embedding_path, mem_vec)
-                except Exception as e:
-                    logger.debug(f"Failed to save embedding for memory #{mem_id}: {e}")
-                
-                from sentence_transformers import util
-                score = float(util.cos_sim(query_vec, mem_vec)[0][0])
-            
-            if score >= threshold:
-                results.append({
-                    'content': mem.get('content', '')[:100],
-                    'state': mem.get('state', 'unknown'),
-                    'importance': mem.get('current_importance', 0),
-                    'score': score
-                })
+            vecs = encoder.encode_many([mem.get('content', '') for mem in missing])
+            store.append_many([(mem.get('id'), vec) for mem, vec in zip(missing, vecs)])
         except Exception as e:
-            logger.debug(f"Error processing memory #{mem.get('id')}: {e}")
-            continue
+            # 非關鍵操作，失敗只影響這些記憶的召回
+            logger.warning(f"Failed to encode {len(missing)} missing embeddings: {e}")
+    
+    q = normalize(query_vec)
+    # 混合模式按 auto 規則決定是否取 ANN 候選（不用 ANN 時只對 BM25 候選打分，不做全矩陣掃描）
+    vector_mode = 'auto' if mode == 'hybrid' else mode
+    ann = None
+    if vector_mode != 'exact' and not filters:
+        from ann_index import IVFIndex
+        ann = IVFIndex()
+        if not ann.trained or (vector_mode == 'auto' and len(memories) < Config.ANN_MIN_SIZE):
+            if vector_mode == 'ann':
+                logger.warning("ANN index not built, falling back to exact search")
+            ann = None
     
-    # 排序並返回 top_k
-    results.sort(key=lambda x: x['score'], reverse=True)
+    scored, fused, keyword_ids = [], None, set()
+    if mode == 'hybrid':
+        scored, fused, keyword_ids = hybrid_rank(query, memories, store, q, ann, nprobe, corpus)
+    elif ann is not None:
+        # 近似搜尋：只掃描最近的 nprobe 個倒排列表
+        by_id = {mem.get('id'): mem for mem in memories}
+        ids, scores = ann.search(q, store, k=max(top_k * 4, 50), nprobe=nprobe)
+        scored = [(by_id[mem_id], float(score)) for mem_id, score in zip(ids, scores) if mem_id in by_id]
+        logger.debug(f"ANN search scored {len(scored)} candidates")
+    elif filters or partial:
+        # 只讀取過濾後子集（或所選分片）的行，打分成本隨條件收窄而下降
+        by_id = {mem.get('id'): mem for mem in memories}
+        ids, rows = store.rows_for(list(by_id))
+        if ids:
+            scores = np.asarray(store.matrix[rows]) @ q
+            scored = [(by_id[mem_id], float(score)) for mem_id, score in zip(ids, scores)]
+        logger.debug(f"Filtered search scored {len(scored)} candidates")
+    elif store.precision != 'float32':
+        # 量化矩陣粗排，只有前 RERANK_CANDIDATES 名讀取全精度行重排
+        by_id = {mem.get('id'): mem for mem in memories}
+        ids, scores = store.search(q, k=max(top_k * 4, 50))
+        scored = [(by_id[mem_id], float(score)) for mem_id, score in zip(ids, scores) if mem_id in by_id]
+        logger.debug(f"Quantized ({store.precision}) search re-ranked {len(scored)} candidates")
+    else:
+        # 整個矩陣零拷貝參與一次矩陣乘法（向量已歸一化，點積即餘弦相似度）
+        scores = np.asarray(store.matrix @ q)
+        for mem in memories:
+            row = store.row_of(mem.get('id'))
+            if row is not None:
+                scored.append((mem, float(scores[row])))
+    
+    results = []
+    now = datetime.datetime.now()
+    for mem, score in scored:
+        # 混合模式下覆蓋足夠多查詢詞項的關鍵詞命中不受向量閾值限制；只共享個別詞項的仍按閾值過濾
+        if score >= threshold or mem.get('id') in keyword_ids:
+            # 有效重要性 / 狀態由錨點閉式計算（衰減任務只落盤狀態轉換）
+            importance, state = effective(mem, now)
+            results.append({
+                'id': mem.get('id'),
+                'content': mem.get('content', '')[:100],
+                'state': state,
+                'importance': importance,
+                'score': score,
+                **({'fused': fused[mem.get('id')]} if fused is not None else {})
+            })
+    
+    # 排序並返回 top_k（混合模式按融合分數）
+    results.sort(key=lambda x: x.get('fused', x['score']), reverse=True)
     results = results[:top_k]
     
+    # 檢索計數寫入本進程的追加緩衝，由下一個持排他鎖的寫入方合併（讀路徑不搶 index.lock）
+    from usage_buffer import UsageBuffer
+    UsageBuffer().record([result['id'] for result in results])
+    
     logger.info(f"Found {len(results)} results (cache hits: {cache_hits}, misses: {cache_misses})")
     return results
 
@@ -137,13 +272,38 @@ def main():
     parser.add_argument("query", nargs="+", help="搜尋查詢")
     parser.add_argument("--top-k", type=int, default=5, help="返回結果數量")
     parser.add_argument("--threshold", type=float, default=0.5, help="相似度閾值")
+    search_mode = parser.add_mutually_exclusive_group()
+    search_mode.add_argument("--exact", dest="mode", action="store_const", const="exact", help="精確全量掃描")
+    search_mode.add_argument("--ann", dest="mode", action="store_const", const="ann", help="使用 ANN 索引近似搜尋")
+    search_mode.add_argument("--hybrid", dest="mode", action="store_const", const="hybrid",
+                             help="向量 + BM25 關鍵詞混合排序")
+    parser.add_argument("--nprobe", type=int, help="ANN 掃描的倒排列表數")
+    parser.add_argument("--state", choices=["Golden", "Silver", "Bronze", "Dust"], help="只檢索該狀態的記憶")
+    parser.add_argument("--actor", help="只檢索該來源的記憶（Self | 空 | 剀 | 玥 | User）")
+    parser.add_argument("--target", help="只檢索該目標的記憶（Core | Subagents | Task | Memory）")
+    parser.add_argument("--domain", help="只檢索該領域的記憶（World | Role | User）")
+    parser.add_argument("--since", type=parse_since, help="只檢索此後創建的記憶（2026-10-01 或 7d / 12h / 2w）")
+    parser.set_defaults(mode="auto")
     
     args = parser.parse_args()
     query = " ".join(args.query)
+    filters = {"state": args.state, "actor": args.actor, "target": args.target,
+               "domain": args.domain, "since": args.since}
     
     print(f"\n🔍 搜尋記憶: '{query}'\n")
     
-    results = search_memories(query, args.top_k, args.threshold)
+    # 常駐守護進程在監聽時整個檢索交給它（模型與向量矩陣都已熱載入）；
+    # 與 brain_encode 相同，只有 auto / daemon 後端轉發，hashing 等後端始終在本進程檢索
+    client = None
+    if Config.use_daemon():
+        from model_daemon import connect
+        client = connect()
+    if client is not None:
+        results = client.search(query, args.top_k, args.threshold, mode=args.mode, nprobe=args.nprobe,
+                                filters=filters)
+    else:
+        results = search_memories(query, args.top_k, args.threshold, mode=args.mode, nprobe=args.nprobe,
+                                  filters=filters)
     
     if not results:
         print("❌ 未找到相關記憶")
@@ -4,25 +4,43 @@
 Brain Server - 記憶向量服務
 常駐後台運行，把 MiniLM 模型保持在記憶體中
 其他腳本透過 HTTP 請求來編碼和檢索
+推理不在事件循環裡執行：並發請求由 BatchScheduler 合成微批，交給推理線程池
 """
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
+import numpy as np
 import json
 import os
+import asyncio
 from typing import List, Dict, Any
 import logging
 
+from config import Config
+from embedding_store import normalize
+from embedding_cache import LRUCache, content_hash, get_query_cache
+from model_daemon import ModelDaemon
+from batch_scheduler import BatchScheduler
+from encoders import create_backend
+
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Brain Server", version="1.0")
 
-# 全局模型（啟動時加載一次）
+# 全局編碼器後端（啟動時加載一次，由 Config.ENCODER_BACKEND 選擇，與 CLI 一致）
 model = None
 
+# 推理調度：合批後在線程池中調用 model.encode_many
+scheduler = None
+
+# 同一個模型同時在 Unix socket 上服務 CLI 腳本（brain_encode / brain_retrieve）
+daemon = None
+
+# 記憶向量快取：鍵為 (記憶 id, 內容摘要)，內容改變即視為新記憶重新編碼
+embedding_cache = LRUCache(Config.SERVER_EMBEDDING_CACHE_MB * 1024 * 1024)
+
 class EncodeRequest(BaseModel):
     texts: List[str]
 
@@ -39,30 +57,58 @@ class RetrieveRequest(BaseModel):
 class RetrieveResponse(BaseModel):
     results: List[Dict[str, Any]]
     count: int
+    cache_hits: int = 0
+    cache_misses: int = 0
 
 @app.on_event("startup")
 async def startup_event():
     """啟動時加載模型"""
-    global model
+    global model, daemon, scheduler
     logger.info("🧠 Brain Server 啟動中...")
     try:
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        logger.info("✅ 向量模型已加載到記憶體")
+        # 服務本身就是守護進程，不轉發給自己
+        model = create_backend(allow_daemon=False)
+        logger.info(f"✅ 向量模型已加載到記憶體（{model.name}: {model.model_name}）")
     except Exception as e:
         logger.error(f"❌ 模型加載失敗: {e}")
         raise
+    
+    # 所有推理經由 ModelDaemon.encode_many：HTTP 微批與 socket 請求共用同一把模型鎖
+    gateway = ModelDaemon(model.encode_many, model.model_name, dim=model.dim)
+    scheduler = BatchScheduler(gateway.encode_many)
+    try:
+        gateway.start()
+        daemon = gateway
+        logger.info(f"✅ 模型守護進程監聽於 {daemon.socket_path}")
+    except Exception as e:
+        # 非關鍵：CLI 腳本會回退到進程內加載模型
+        daemon = None
+        logger.warning(f"⚠️ 模型守護進程未啟動: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """關閉時清理"""
     logger.info("🛑 Brain Server 關閉中...")
+    if daemon is not None:
+        daemon.shutdown()
+    if scheduler is not None:
+        scheduler.close()
 
 @app.get("/health")
 async def health_check():
     """健康檢查"""
+    # 查詢快取統計讀 SQLite，放到線程池，不阻塞事件循環
+    loop = asyncio.get_running_loop()
+    query_cache = None
+    if model is not None:
+        query_cache = await loop.run_in_executor(None, get_query_cache(model.model_name).stats)
     return {
         "status": "ok",
         "model_loaded": model is not None,
+        "encoder": model.info() if model is not None else None,
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "embedding_cache": embedding_cache.stats(),
+        "query_cache": query_cache,
         "service": "Brain Server v1.0"
     }
 
@@ -86,7 +132,7 @@ async def encode(request: EncodeRequest):
         raise HTTPException(status_code=503, detail="模型未加載")
     
     try:
-        embeddings = model.encode(request.texts, convert_to_tensor=False)
+        embeddings = await scheduler.encode(request.texts)
         return EncodeResponse(
             embeddings=embeddings.tolist(),
             count=len(request.texts)
@@ -118,23 +164,46 @@ async def retrieve(request: RetrieveRequest):
             {"id": 1, "content": "記憶1", "score": 0.85},
             ...
         ],
-        "count": 3
+        "count": 3,
+        "cache_hits": 2,
+        "cache_misses": 1
     }
     """
     if model is None:
         raise HTTPException(status_code=503, detail="模型未加載")
     
     try:
-        # 編碼查詢
-        query_embedding = model.encode(request.query, convert_to_tensor=False)
+        # 編碼查詢（與 CLI 共享查詢向量快取；SQLite 讀寫放到線程池，其他進程持有寫鎖時不阻塞事件循環）
+        loop = asyncio.get_running_loop()
+        query_cache = get_query_cache(model.model_name)
+        query_embedding = await loop.run_in_executor(None, query_cache.get, request.query)
+        if query_embedding is None:
+            query_embedding = (await scheduler.encode([request.query]))[0]
+            await loop.run_in_executor(None, query_cache.put, request.query, query_embedding)
         
-        # 編碼所有記憶
-        memory_contents = [m.get("content", "") for m in request.memories]
-        memory_embeddings = model.encode(memory_contents, convert_to_tensor=False)
+        # 快取命中的記憶直接取向量，只有新出現或內容變化的記憶經過模型
+        query_vec = normalize(query_embedding)
+        memory_embeddings = np.empty((len(request.memories), len(query_vec)), dtype=np.float32)
+        keys = [(mem.get("id"), content_hash(mem.get("content", ""))) for mem in request.memories]
+        missing = []
+        for idx, key in enumerate(keys):
+            vec = embedding_cache.get(key)
+            if vec is None:
+                missing.append(idx)
+            else:
+                memory_embeddings[idx] = vec
+        if missing:
+            contents = [request.memories[idx].get("content", "") for idx in missing]
+            encoded = await scheduler.encode(contents)
+            for idx, vec in zip(missing, encoded):
+                vec = normalize(vec)
+                memory_embeddings[idx] = vec
+                embedding_cache.put(keys[idx], vec)
+        cache_hits = len(keys) - len(missing)
+        logger.info(f"檢索快取命中 {cache_hits}，未命中 {len(missing)}")
         
-        # 計算相似度
-        from sklearn.metrics.pairwise import cosine_similarity
-        similarities = cosine_similarity([query_embedding], memory_embeddings)[0]
+        # 計算相似度（向量已歸一化，點積即餘弦相似度）
+        similarities = memory_embeddings @ query_vec
         
         # 排序並篩選
         results = []
@@ -150,7 +219,9 @@ async def retrieve(request: RetrieveRequest):
         
         return RetrieveResponse(
             results=results,
-            count=len(results)
+            count=len(results),
+            cache_hits=cache_hits,
+            cache_misses=len(missing)
         )
     except Exception as e:
         logger.error(f"檢索失敗: {e}")
@@ -165,11 +236,12 @@ async def batch_encode(request: EncodeRequest):
         raise HTTPException(status_code=503, detail="模型未加載")
     
     try:
-        embeddings = model.encode(request.texts, convert_to_tensor=False, batch_size=32)
+        # 超過 SERVER_BATCH_MAX_ITEMS 的請求獨佔一批，模型內部仍按 ENCODE_BATCH_SIZE 分批
+        embeddings = await scheduler.encode(request.texts)
         return {
             "embeddings": embeddings.tolist(),
             "count": len(request.texts),
-            "batch_size": 32
+            "batch_size": Config.ENCODE_BATCH_SIZE
         }
     except Exception as e:
         logger.error(f"批量編碼失敗: {e}")
@@ -13,16 +13,53 @@ class Config:
     WORKSPACE = Path(os.environ.get('YUE_WORKSPACE', os.path.expanduser('~/.openclaw/workspace')))
     MEMORY_DIR = WORKSPACE / 'memory'
     INDEX_PATH = MEMORY_DIR / 'index.json'
+    ANN_INDEX_PATH = MEMORY_DIR / 'index.ann.npz'
+    SQLITE_PATH = MEMORY_DIR / 'index.db'
+    SHARDS_DIR = MEMORY_DIR / 'shards'
+    
+    # 索引存儲後端：'json'（快照 + 日誌）、'sqlite' 或 'sharded'（按月份 × 領域分片，見 index_shards）
+    INDEX_BACKEND = os.environ.get('YUE_INDEX_BACKEND', 'json')
     EMBEDDINGS_DIR = MEMORY_DIR / 'embeddings'
+    QUERY_CACHE_PATH = EMBEDDINGS_DIR / 'query_cache.db'
+    DECAY_SCHEDULE_PATH = MEMORY_DIR / 'decay_schedule.json'
+    TEXT_INDEX_PATH = MEMORY_DIR / 'text_index.db'
+    META_INDEX_PATH = MEMORY_DIR / 'meta_index.db'
+    USAGE_DIR = MEMORY_DIR / 'usage'
+    MINHASH_PATH = MEMORY_DIR / 'minhash.db'
     LOGS_DIR = WORKSPACE / 'logs'
     
     # 模型配置
     SEMANTIC_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
     VECTOR_DIMENSION = 384  # MiniLM 向量維度
+    ENCODE_BATCH_SIZE = 32  # 批量編碼時每批文本數
+    # 編碼器後端：'auto'（守護進程在監聽時轉發，否則進程內加載）、'sentence-transformers'、'hashing'（離線 / CI）、'daemon'
+    # 是否轉發給守護進程只由此決定：auto / daemon 轉發，其他後端始終在本進程編碼（見 use_daemon）
+    ENCODER_BACKEND = os.environ.get('YUE_ENCODER_BACKEND', 'auto')
+    ENCODER_THREADS = int(os.environ.get('YUE_ENCODER_THREADS', '0'))  # torch 推理線程數（0 表示 torch 默認）
+    EMBEDDING_COMPACT_RATIO = 0.25  # 墓碑行超過 25% 時壓縮向量矩陣
+    # 粗排矩陣精度：'float32'（不量化）、'float16' 或 'int8'（每行縮放）；全精度矩陣始終保留用於重排
+    EMBEDDING_PRECISION = os.environ.get('YUE_EMBEDDING_PRECISION', 'float32')
+    RERANK_CANDIDATES = 200         # 量化粗排後用全精度向量重排的候選數（至少 top_k × 4）
+    
+    # ANN 索引配置（IVF-flat）
+    ANN_MIN_SIZE = 10000         # 記憶數達到此值時 auto 模式才使用 ANN
+    ANN_NPROBE = 8               # 查詢時掃描的倒排列表數
+    ANN_TRAIN_SAMPLE = 50000     # k-means 訓練採樣上限
+    ANN_DELTA_MERGE = 4096       # 增量日誌累計此條數後併入 index.ann.npz
+    
+    # 分片配置（INDEX_BACKEND = 'sharded'）
+    SHARD_PROBE = 12             # 無過濾條件時按質心只讀取最相近的分片數（0 表示讀取全部分片）
+    
+    # 混合檢索配置（BM25 + 向量，RRF 融合）
+    HYBRID_CANDIDATES = 100      # BM25 與向量各取的候選數
+    RRF_K = 60                   # Reciprocal Rank Fusion 常數
+    HYBRID_MIN_MATCH = 0.5       # 關鍵詞命中至少覆蓋這一比例的查詢詞項，才可不受相似度閾值限制
     
     # 相似度閾值
     SIMILARITY_THRESHOLD = 0.85  # 查重閾值
+    NEAR_DUPLICATE_THRESHOLD = 0.75  # 近似重複閾值（查重報告 top-N 用）
     RETRIEVAL_THRESHOLD = 0.5    # 檢索閾值
+    MINHASH_CONFIRM = 8          # 無模型回退時每條內容最多用 difflib 確認的 LSH 候選數
     
     # 記憶衰減配置
     SILVER_DECAY_DAYS = 7        # Silver 衰減天數
@@ -46,9 +83,29 @@ class Config:
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
     
+    # 常駐模型守護進程
+    DAEMON_SOCKET = Path(os.environ.get('YUE_DAEMON_SOCKET', str(WORKSPACE / 'run' / 'brain.sock')))
+    DAEMON_CONNECT_TIMEOUT = 0.5  # 探測守護進程的超時（秒）
+    DAEMON_TIMEOUT = 60           # 單個請求的超時（秒）
+    INGEST_WINDOW_MS = float(os.environ.get('YUE_INGEST_WINDOW_MS', '30'))  # 守護進程合併編碼請求的窗口（毫秒，從第一個請求到達算起）
+    INGEST_MAX_ITEMS = 256        # 單批合併提交的條數上限（達到即提前提交）
+    
+    # brain_server 推理調度（異步微批，見 batch_scheduler）
+    SERVER_BATCH_MAX_ITEMS = 64   # 單個微批的文本數上限
+    SERVER_BATCH_WAIT_MS = float(os.environ.get('YUE_SERVER_BATCH_WAIT_MS', '5'))  # 第一個請求到達後等待合批的上限（毫秒）
+    SERVER_INFERENCE_WORKERS = 1  # 推理線程數（推理經 ModelDaemon 的模型鎖與 socket 請求串行，多於 1 只讓下一批提前排隊）
+    
+    # 嵌入快取配置
+    SERVER_EMBEDDING_CACHE_MB = 64  # brain_server /retrieve 記憶向量 LRU 快取上限（MB）
+    QUERY_CACHE_MB = 8              # 查詢向量記憶體 LRU 上限（MB）
+    QUERY_CACHE_MAX_ENTRIES = 50000 # 查詢向量磁碟快取條數上限（超出淘汰最久未用）
+    
     # 並發配置
     LOCK_TIMEOUT = 30            # 文件鎖超時（秒）
     
+    # 索引日誌配置
+    JOURNAL_COMPACT_THRESHOLD = 500  # 日誌記錄數達到此值時折疊回 index.json
+    
     @classmethod
     def ensure_dirs(cls):
         """確保所有必要的目錄存在"""
@@ -56,6 +113,11 @@ class Config:
         cls.EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
         cls.LOGS_DIR.mkdir(parents=True, exist_ok=True)
     
+    @classmethod
+    def use_daemon(cls):
+        """當前編碼器後端是否把編碼 / 檢索 / 提交轉發給常駐守護進程"""
+        return cls.ENCODER_BACKEND in ('auto', 'daemon')
+    
     @classmethod
     def to_dict(cls):
         """返回配置字典"""
@@ -63,10 +125,24 @@ class Config:
             'WORKSPACE': str(cls.WORKSPACE),
             'MEMORY_DIR': str(cls.MEMORY_DIR),
             'INDEX_PATH': str(cls.INDEX_PATH),
+            'ANN_INDEX_PATH': str(cls.ANN_INDEX_PATH),
+            'SQLITE_PATH': str(cls.SQLITE_PATH),
+            'SHARDS_DIR': str(cls.SHARDS_DIR),
+            'INDEX_BACKEND': cls.INDEX_BACKEND,
+            'SHARD_PROBE': cls.SHARD_PROBE,
             'EMBEDDINGS_DIR': str(cls.EMBEDDINGS_DIR),
+            'QUERY_CACHE_PATH': str(cls.QUERY_CACHE_PATH),
+            'DECAY_SCHEDULE_PATH': str(cls.DECAY_SCHEDULE_PATH),
+            'TEXT_INDEX_PATH': str(cls.TEXT_INDEX_PATH),
+            'META_INDEX_PATH': str(cls.META_INDEX_PATH),
+            'USAGE_DIR': str(cls.USAGE_DIR),
+            'MINHASH_PATH': str(cls.MINHASH_PATH),
             'LOGS_DIR': str(cls.LOGS_DIR),
             'SEMANTIC_MODEL': cls.SEMANTIC_MODEL,
             'VECTOR_DIMENSION': cls.VECTOR_DIMENSION,
+            'ENCODER_BACKEND': cls.ENCODER_BACKEND,
+            'ENCODER_THREADS': cls.ENCODER_THREADS,
+            'EMBEDDING_PRECISION': cls.EMBEDDING_PRECISION,
             'SIMILARITY_THRESHOLD': cls.SIMILARITY_THRESHOLD,
             'RETRIEVAL_THRESHOLD': cls.RETRIEVAL_THRESHOLD,
             'SILVER_DECAY_DAYS': cls.SILVER_DECAY_DAYS,
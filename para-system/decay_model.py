@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+閉式衰減模型 - 有效重要性與狀態在讀取時由錨點直接算出
+current_importance 是 last_access 時刻的錨點值（強化時重設），衰減不再改寫它：
+
+    Silver: 距錨點第 SILVER_DECAY_DAYS 天起每天 × DECAY_RATE，低於 0.50 轉為 Bronze
+    Bronze: 距錨點第 BRONZE_DECAY_DAYS 天起（且已轉為 Bronze 之後）每天 × DECAY_RATE，低於 0.20 轉為 Dust
+    Golden: 永不衰減；Dust: 到期即刪除
+
+DecaySchedule 把每條記憶下一次狀態轉換（或刪除）的時間存成最小堆
+（memory/decay_schedule.json），定時任務只處理已到期的條目。
+"""
+
+import os
+import json
+import math
+import heapq
+import datetime
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('decay_model')
+
+
+def parse_date(date_str):
+    """解析 ISO 格式的日期字符串"""
+    try:
+        return datetime.datetime.fromisoformat(date_str)
+    except (ValueError, TypeError):
+        return None
+
+
+def state_for(importance):
+    """重要性 → 狀態"""
+    if importance >= Config.GOLDEN_THRESHOLD:
+        return "Golden"
+    if importance >= Config.SILVER_THRESHOLD:
+        return "Silver"
+    if importance >= Config.BRONZE_THRESHOLD:
+        return "Bronze"
+    return "Dust"
+
+
+def anchor_of(mem):
+    """衰減錨點時間（last_access，缺失時用 creation_date）"""
+    return parse_date(mem.get("last_access")) or parse_date(mem.get("creation_date"))
+
+
+def _steps_below(importance, threshold, rate):
+    """importance × rate^n 首次低於 threshold 所需的衰減次數"""
+    if importance < threshold:
+        return 0
+    n = int(math.log(threshold / importance) / math.log(rate)) + 1
+    # 修正浮點誤差
+    while n > 0 and importance * rate ** (n - 1) < threshold:
+        n -= 1
+    while importance * rate ** n >= threshold:
+        n += 1
+    return n
+
+
+class DecayParams:
+    """衰減參數（命令行可覆蓋天數）"""
+
+    def __init__(self, silver_days=None, bronze_days=None, rate=None):
+        self.silver_days = Config.SILVER_DECAY_DAYS if silver_days is None else silver_days
+        self.bronze_days = Config.BRONZE_DECAY_DAYS if bronze_days is None else bronze_days
+        self.rate = Config.DECAY_RATE if rate is None else rate
+
+    def to_dict(self):
+        return {"silver_days": self.silver_days, "bronze_days": self.bronze_days, "rate": self.rate,
+                "thresholds": [Config.GOLDEN_THRESHOLD, Config.SILVER_THRESHOLD, Config.BRONZE_THRESHOLD]}
+
+    def timeline(self, importance):
+        """
+        從錨點起的轉換日
+        Returns:
+            (bronze_day, bronze_start, bronze_importance, dust_day)；Golden 返回 None
+        """
+        if importance >= Config.GOLDEN_THRESHOLD:
+            return None
+        if importance >= Config.SILVER_THRESHOLD:
+            n = _steps_below(importance, Config.SILVER_THRESHOLD, self.rate)
+            bronze_day = self.silver_days + n - 1
+            bronze_importance = importance * self.rate ** n
+        else:
+            bronze_day, bronze_importance = 0, importance
+        bronze_start = max(self.bronze_days, bronze_day + 1)
+        m = _steps_below(bronze_importance, Config.BRONZE_THRESHOLD, self.rate)
+        dust_day = bronze_start + m - 1 if m else bronze_day
+        return bronze_day, bronze_start, bronze_importance, dust_day
+
+    def importance_after(self, importance, days):
+        """錨點重要性經過 days 整天後的有效重要性"""
+        if importance >= Config.GOLDEN_THRESHOLD:
+            return importance
+        if importance >= Config.SILVER_THRESHOLD:
+            n = _steps_below(importance, Config.SILVER_THRESHOLD, self.rate)
+            done = min(max(days - self.silver_days + 1, 0), n)
+            if done < n:
+                return importance * self.rate ** done
+        _, bronze_start, bronze_importance, _ = self.timeline(importance)
+        # 轉為 Dust 後不再衰減（等待刪除）
+        m = min(max(days - bronze_start + 1, 0),
+                _steps_below(bronze_importance, Config.BRONZE_THRESHOLD, self.rate))
+        return bronze_importance * self.rate ** m
+
+
+def effective(mem, now=None, params=None):
+    """
+    記憶在 now 時刻的有效重要性與狀態
+    Returns:
+        (importance, state)
+    """
+    params = params or DecayParams()
+    importance = mem.get("current_importance", 0.5)
+    anchor = anchor_of(mem)
+    if anchor is None:
+        return importance, mem.get("state") or state_for(importance)
+    days = max(((now or datetime.datetime.now()) - anchor).days, 0)
+    value = params.importance_after(importance, days)
+    return round(value, 4), state_for(value)
+
+
+def next_transition(mem, params=None):
+    """
+    已保存狀態之後的下一次轉換時間（Silver → Bronze、Bronze → Dust、Dust → 刪除）
+    Golden 或沒有時間戳時返回 None
+    """
+    params = params or DecayParams()
+    anchor = anchor_of(mem)
+    timeline = params.timeline(mem.get("current_importance", 0.5))
+    if anchor is None or timeline is None:
+        return None
+    bronze_day, _, _, dust_day = timeline
+    state = mem.get("state")
+    day = bronze_day if state == "Silver" else dust_day if state == "Bronze" else 0
+    return anchor + datetime.timedelta(days=day)
+
+
+class DecaySchedule:
+    """下一次轉換時間的最小堆（持久化到 JSON，條目過期時惰性修正）"""
+
+    def __init__(self, path=None, params=None):
+        self.path = Config.DECAY_SCHEDULE_PATH if path is None else path
+        self.params = params or DecayParams()
+        self.heap = []
+        self.last_id = 0
+
+    def load(self):
+        """載入堆；不存在、損壞或衰減參數已改變時返回 False（需要全量重建）"""
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Decay schedule unreadable, rebuilding: {e}")
+            return False
+        if data.get("params") != self.params.to_dict():
+            logger.info("Decay parameters changed, rebuilding schedule")
+            return False
+        self.heap = [tuple(entry) for entry in data.get("heap", [])]
+        heapq.heapify(self.heap)
+        self.last_id = data.get("last_id", 0)
+        return True
+
+    def save(self):
+        """原子寫入（同一記憶的多個條目只保留最早的一個），並清空已處理的強化記錄"""
+        earliest = {}
+        for when, mem_id in self.heap:
+            if when < earliest.get(mem_id, float('inf')):
+                earliest[mem_id] = when
+        self.heap = [(when, mem_id) for mem_id, when in earliest.items()]
+        heapq.heapify(self.heap)
+        tmp_path = self.path.with_suffix('.json.tmp')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"params": self.params.to_dict(), "last_id": self.last_id,
+                       "heap": self.heap}, f)
+        os.replace(tmp_path, self.path)
+        if self.touched_path.exists():
+            os.unlink(self.touched_path)
+
+    @property
+    def touched_path(self):
+        return self.path.with_name(self.path.stem + '.touched')
+
+    def touch(self, mem_ids):
+        """
+        記錄被強化的記憶 id（追加寫，不讀整個堆；調用方持有排他鎖）
+        強化可能讓下一次轉換提前（例如 Bronze 升回 Silver），下次衰減時重新入堆
+        """
+        if not mem_ids or not self.path.exists():
+            return  # 還沒有排程：下次衰減全量重建
+        with open(self.touched_path, 'a', encoding='utf-8') as f:
+            f.write("".join(f"{mem_id}\n" for mem_id in mem_ids))
+
+    def touched(self):
+        """上次衰減之後被強化過的記憶 id"""
+        if not self.touched_path.exists():
+            return []
+        with open(self.touched_path, 'r', encoding='utf-8') as f:
+            return list(dict.fromkeys(int(line) for line in f if line.strip().isdigit()))
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, mem):
+        """按記憶的下一次轉換時間入堆（Golden 不入堆）"""
+        self.last_id = max(self.last_id, mem["id"])
+        when = next_transition(mem, self.params)
+        if when is not None:
+            heapq.heappush(self.heap, (when.timestamp(), mem["id"]))
+
+    def rebuild(self, memories):
+        self.heap, self.last_id = [], 0
+        for mem in memories:
+            self.push(mem)
+
+    def pop_due(self, now):
+        """彈出所有到期條目的 id"""
+        limit = now.timestamp()
+        due = []
+        while self.heap and self.heap[0][0] <= limit:
+            due.append(heapq.heappop(self.heap)[1])
+        return due
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+語義查重引擎 - 新文本只編碼一次，與全部已存向量做一次批量矩陣乘法
+向量矩陣中的向量已預先歸一化，點積即餘弦相似度
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+from embedding_store import normalize
+
+logger = get_logger('dedup')
+
+# best: 最佳匹配記憶（未達閾值時為 None）；near: [(memory, score), ...] 按分數降序
+DedupResult = namedtuple('DedupResult', ['best', 'score', 'near'])
+
+
+class DedupEngine:
+    """批量語義查重"""
+
+    def __init__(self, store, threshold=None, near_threshold=None, top_n=3):
+        self.store = store
+        self.threshold = Config.SIMILARITY_THRESHOLD if threshold is None else threshold
+        self.near_threshold = Config.NEAR_DUPLICATE_THRESHOLD if near_threshold is None else near_threshold
+        self.top_n = top_n
+
+    def _pick(self, scores, row_ids, lookup):
+        """從一列分數中挑出最佳匹配與 top-N 近似重複"""
+        scores = np.where(row_ids >= 0, scores, -np.inf)
+
+        # 多取幾行，容忍索引中已不存在的孤兒向量
+        k = min(len(scores), self.top_n * 2 + 8)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        near = []
+        for row in top.tolist():
+            score = float(scores[row])
+            if score < self.near_threshold or len(near) >= self.top_n:
+                break
+            mem = lookup(int(row_ids[row]))
+            if mem is not None:
+                near.append((mem, score))
+
+        if near and near[0][1] >= self.threshold:
+            return DedupResult(near[0][0], near[0][1], near)
+        return DedupResult(None, 0, near)
+
+    def find(self, query_vec, lookup):
+        """
+        在整個向量矩陣中查找重複與近似重複
+        lookup: id → memory，返回 None 的 id（已刪除但向量未清理）會被跳過
+        """
+        if query_vec is None or len(self.store) == 0:
+            return DedupResult(None, 0, [])
+
+        # 整個 memmap 矩陣參與一次乘法（零拷貝），墓碑行不參與排序
+        scores = np.asarray(self.store.matrix @ normalize(query_vec))
+        return self._pick(scores, self.store.row_ids(), lookup)
+
+    def find_many(self, query_vecs, lookup):
+        """批量查重：多條新文本與全部向量做分塊矩陣乘法，返回每條的 DedupResult"""
+        if len(self.store) == 0:
+            return [DedupResult(None, 0, []) for _ in query_vecs]
+
+        queries = np.stack([normalize(vec) for vec in query_vecs])
+        row_ids = self.store.row_ids()
+        # 控制分數矩陣大小（約 16M 個 float）
+        chunk = max(1, 16_000_000 // max(1, self.store.count))
+        results = []
+        for start in range(0, len(queries), chunk):
+            scores = np.asarray(self.store.matrix @ queries[start:start + chunk].T)
+            for col in range(scores.shape[1]):
+                results.append(self._pick(scores[:, col], row_ids, lookup))
+        return results
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+嵌入向量快取
+LRUCache:   按佔用位元組數限制大小的記憶體 LRU，最久未使用的先淘汰
+QueryCache: 查詢向量快取（記憶體 LRU + memory/embeddings/query_cache.db），
+            鍵為規範化查詢文本 + 模型名，不同編碼器後端共用同一個庫而互不干擾；
+            換模型後舊向量不再命中，按 last_used 隨 QUERY_CACHE_MAX_ENTRIES 淘汰
+
+用法: python3 embedding_cache.py stats
+      python3 embedding_cache.py clear
+"""
+
+import os
+import sys
+import atexit
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('embedding_cache')
+
+# 每個條目除向量本身外的估算開銷（鍵、OrderedDict 節點、ndarray 頭）
+ENTRY_OVERHEAD = 200
+
+# 磁碟命中只讀；last_used 與命中計數攢夠這麼多條（或 put / 退出時）再一次寫入
+TOUCH_BATCH = 64
+
+
+def content_hash(text):
+    """內容摘要，用作快取鍵的一部分（內容變化即失效）"""
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """線程安全的 LRU 快取，max_bytes 限制向量總佔用"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        """命中時移到隊尾並返回向量，未命中返回 None"""
+        with self._lock:
+            vec = self._items.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key, vec):
+        size = vec.nbytes + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes + ENTRY_OVERHEAD
+            self._items[key] = vec
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= evicted.nbytes + ENTRY_OVERHEAD
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def normalize_query(text):
+    """查詢規範化：NFKC（全形 / 半形統一）、去首尾空白、合併空白、小寫"""
+    return " ".join(unicodedata.normalize('NFKC', text or '').split()).lower()
+
+
+class QueryCache:
+    """查詢向量快取：記憶體 LRU 在前，SQLite 持久化在後，多個進程共享磁碟部分"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS queries (
+        key       TEXT PRIMARY KEY,
+        query     TEXT NOT NULL,
+        vec       BLOB NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_queries_last_used ON queries(last_used);
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    """
+
+    def __init__(self, model_name=None, db_path=None, max_bytes=None, max_entries=None):
+        self.model_name = model_name or default_model_name()
+        self.db_path = Config.QUERY_CACHE_PATH if db_path is None else db_path
+        self.max_entries = Config.QUERY_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        if max_bytes is None:
+            max_bytes = Config.QUERY_CACHE_MB * 1024 * 1024
+        self.memory = LRUCache(max_bytes)
+        self.disk_hits = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        self._touched = {}  # key → last_used，未寫入磁碟
+        self._counts = {"hits": 0, "misses": 0}
+        atexit.register(self.flush)
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.model_name}\0{normalize_query(text)}".encode('utf-8')).hexdigest()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=Config.LOCK_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _write_pending(self):
+        """在當前寫事務中補寫攢下的 last_used 與命中計數（調用方持有 _lock）"""
+        if self._touched:
+            self.conn.executemany("UPDATE queries SET last_used = ? WHERE key = ?",
+                                  [(used, key) for key, used in self._touched.items()])
+            self._touched = {}
+        for name, count in self._counts.items():
+            if count:
+                self.conn.execute("INSERT INTO meta VALUES (?, ?) ON CONFLICT(key) DO UPDATE "
+                                  "SET value = CAST(value AS INTEGER) + excluded.value", (name, str(count)))
+                self._counts[name] = 0
+
+    def flush(self):
+        """寫入攢下的 last_used 與命中計數"""
+        with self._lock:
+            if not self._touched and not any(self._counts.values()):
+                return
+            try:
+                with self.conn:
+                    self._write_pending()
+            except sqlite3.Error as e:
+                logger.warning(f"Query cache flush failed: {e}")
+
+    def get(self, text):
+        """返回快取的查詢向量，未命中返回 None（只讀，不開寫事務）"""
+        key = self.key(text)
+        vec = self.memory.get(key)
+        if vec is not None:
+            return vec
+        with self._lock:
+            try:
+                row = self.conn.execute("SELECT vec FROM queries WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Query cache read failed: {e}")
+                return None
+            self._counts['hits' if row is not None else 'misses'] += 1
+            if row is not None:
+                self._touched[key] = time.time()
+            pending = len(self._touched) + sum(self._counts.values())
+        if pending >= TOUCH_BATCH:
+            self.flush()
+        if row is None:
+            return None
+        self.disk_hits += 1
+        vec = np.frombuffer(row[0], dtype=np.float32).copy()
+        self.memory.put(key, vec)
+        return vec
+
+    def put(self, text, vec):
+        key = self.key(text)
+        vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+        self.memory.put(key, vec)
+        with self._lock:
+            try:
+                with self.conn:
+                    self._write_pending()
+                    self.conn.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?)",
+                                      (key, normalize_query(text), vec.tobytes(), time.time()))
+                    count = self.conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+                    if count > self.max_entries:
+                        self.conn.execute("DELETE FROM queries WHERE key IN (SELECT key FROM queries "
+                                          "ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+            except sqlite3.Error as e:
+                logger.warning(f"Query cache write failed: {e}")
+
+    def get_or_encode(self, text, encode_fn):
+        """命中時直接返回；否則 encode_fn([text]) 編碼並寫入快取"""
+        vec = self.get(text)
+        if vec is None:
+            vec = np.asarray(encode_fn([text])[0], dtype=np.float32)
+            self.put(text, vec)
+        else:
+            logger.debug(f"Query cache hit: '{text}'")
+        return vec
+
+    def clear(self):
+        self.memory.clear()
+        with self._lock, self.conn:
+            self._touched = {}
+            self._counts = {"hits": 0, "misses": 0}
+            self.conn.execute("DELETE FROM queries")
+            self.conn.execute("DELETE FROM meta WHERE key IN ('hits', 'misses')")
+
+    def stats(self):
+        """本進程命中情況 + 磁碟快取累計命中率（跨進程）"""
+        memory = self.memory.stats()
+        session_hits = memory["hits"] + self.disk_hits
+        session_total = memory["hits"] + memory["misses"]
+        self.flush()
+        with self._lock:
+            meta = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+            entries = self.conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+        disk_hits, disk_misses = int(meta.get('hits', 0)), int(meta.get('misses', 0))
+        return {
+            "model": self.model_name,
+            "entries": entries,
+            "memory_entries": memory["entries"],
+            "session_hit_rate": round(session_hits / session_total, 4) if session_total else 0.0,
+            "hits": disk_hits,
+            "misses": disk_misses,
+            "hit_rate": round(disk_hits / (disk_hits + disk_misses), 4) if disk_hits + disk_misses else 0.0,
+        }
+
+
+_query_caches = {}
+
+
+def default_model_name():
+    """當前編碼器後端（Config.ENCODER_BACKEND）的模型名（不加載模型）；後端不可用時回退到 Config.SEMANTIC_MODEL"""
+    from encoders import EncoderUnavailable, backend_model_name
+    try:
+        return backend_model_name()
+    except (EncoderUnavailable, ValueError) as e:
+        logger.debug(f"{e}; using {Config.SEMANTIC_MODEL}")
+        return Config.SEMANTIC_MODEL
+
+
+def get_query_cache(model_name=None):
+    """進程內共享的查詢快取（每個模型一個，默認為當前編碼器後端的模型）"""
+    model_name = model_name or default_model_name()
+    if model_name not in _query_caches:
+        _query_caches[model_name] = QueryCache(model_name)
+    return _query_caches[model_name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 查詢向量快取")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="顯示快取條數與命中率")
+    sub.add_parser("clear", help="清空查詢快取")
+    args = parser.parse_args()
+
+    cache = get_query_cache()
+    if args.command == "clear":
+        cache.clear()
+        print("✅ 查詢快取已清空")
+    else:
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,616 @@
+#!/usr/bin/env python3
+"""
+嵌入向量庫 - 單一連續 float32 矩陣 + id→row 映射
+取代「每條記憶一個 mem_{id}.npy」：讀取端以 memmap 零拷貝訪問整個矩陣，
+寫入端只追加行；刪除只打墓碑（tombstone），由 compact 回收空間。
+
+文件佈局（memory/embeddings/）：
+    vectors.f32    行優先的 float32 矩陣（count × dim，已 L2 歸一化）
+    vectors.ids    行號 → 記憶 id 的 int64 數組（墓碑行為 -1），載入時據此重建 id → row 映射
+    vectors.f16    可選：float16 粗排矩陣（precision = float16）
+    vectors.i8     可選：int8 粗排矩陣（precision = int8）
+    vectors.i8s    int8 每行的縮放係數（float32，v ≈ scale × q）
+    vectors.json   元數據：dim、count、tombstones、precision、generation、version（大小固定）
+    vectors.lock   寫入鎖（追加 / 刪除 / 壓縮）
+
+compact 之後數據文件帶代數後綴（vectors.3.f32、vectors.3.ids ...），由元數據的 generation 指向。
+
+量化模式下粗排只讀取量化矩陣（常駐記憶體約為 float32 的 1/2 或 1/4），
+前 RERANK_CANDIDATES 名再用全精度行重排。
+"""
+
+import json
+import os
+import sys
+import fcntl
+import argparse
+from contextlib import contextmanager
+
+import numpy as np
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('embedding_store')
+
+DTYPE = np.float32
+
+# precision → (粗排矩陣擴展名, dtype)
+QUANTIZED = {
+    'float16': ('.f16', np.float16),
+    'int8': ('.i8', np.int8),
+}
+SCALE_EXT = '.i8s'
+
+# 粗排時每塊反量化的行數（臨時 float32 緩衝區約 1.5MB，留在 CPU 快取內）
+SCORE_CHUNK = 1024
+
+
+def normalize(vec):
+    """L2 歸一化（存入矩陣的向量一律為單位向量，餘弦相似度 = 點積）"""
+    vec = np.asarray(vec, dtype=DTYPE).reshape(-1)
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec = vec / norm
+    return vec
+
+
+def quantize(vecs, precision):
+    """
+    量化一批行向量
+    Returns:
+        (quantized, scales) - int8 時 scales 為每行縮放係數，否則為 None
+    """
+    if precision == 'float16':
+        return vecs.astype(np.float16), None
+    scales = np.abs(vecs).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.rint(vecs / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(DTYPE)
+
+
+class EmbeddingStore:
+    """記憶嵌入向量庫（memmap 矩陣 + 行號 → id 數組）"""
+
+    META_FILE = 'vectors.json'
+    LOCK_FILE = 'vectors.lock'
+    DATA_EXT = '.f32'
+    IDS_EXT = '.ids'
+
+    def __init__(self, directory=None, dim=None, precision=None, model=None):
+        self.directory = Config.EMBEDDINGS_DIR if directory is None else directory
+        self.meta_path = self.directory / self.META_FILE
+        self.lock_path = self.directory / self.LOCK_FILE
+        self._default_dim = dim or Config.VECTOR_DIMENSION
+        # 寫入端的編碼器 model_name；首次寫入時記錄進元數據，之後不一致的寫入被拒絕
+        self.writer_model = model
+        # 寫入端期望的精度；實際生效的精度以元數據為準（見 precision 屬性）
+        self.target_precision = precision or Config.EMBEDDING_PRECISION
+        if self.target_precision != 'float32' and self.target_precision not in QUANTIZED:
+            raise ValueError(f"Unknown embedding precision: {self.target_precision}")
+        self._matrix = None
+        self._coarse = None
+        self._row_ids = None
+        self._rows = None
+        self._meta_mtime = None
+        self.meta = self._load_meta()
+
+    # ---------- 元數據 ----------
+
+    def _empty_meta(self):
+        return {"dim": self._default_dim, "count": 0, "tombstones": 0, "generation": 0, "version": 0,
+                "precision": self.target_precision}
+
+    def _load_meta(self):
+        """載入元數據（不存在時返回空庫）"""
+        if not self.meta_path.exists():
+            self._meta_mtime = None
+            return self._empty_meta()
+        try:
+            self._meta_mtime = self.meta_path.stat().st_mtime_ns
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta.setdefault("tombstones", 0)
+            meta.setdefault("precision", "float32")
+            return meta
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Embedding metadata corrupted: {e}")
+            return self._empty_meta()
+
+    def _save_meta(self):
+        """原子寫入元數據（先寫臨時文件再 rename）；只含計數器，大小與記憶數無關"""
+        self.meta["version"] += 1
+        tmp_path = self.meta_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+        self._meta_mtime = self.meta_path.stat().st_mtime_ns
+        self._reset_views()
+
+    def _meta_key(self, meta):
+        return (meta["generation"], meta["version"], meta["count"], meta["tombstones"])
+
+    def refresh(self):
+        """其他進程寫入後重新載入元數據"""
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._meta_mtime:
+            self.meta = self._load_meta()
+            self._rows = None
+            self._reset_views()
+
+    def _reset_views(self):
+        self._matrix = None
+        self._coarse = None
+        self._row_ids = None
+
+    @contextmanager
+    def _write_lock(self):
+        """寫入鎖：與其他寫入者互斥，讀取端不需要鎖"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # 持鎖後以磁碟上的最新狀態為準；元數據未變時保留已建好的 id → row 映射
+                meta = self._load_meta()
+                if self._meta_key(meta) != self._meta_key(self.meta):
+                    self._rows = None
+                self.meta = meta
+                self._reset_views()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---------- 文件 ----------
+
+    @property
+    def generation(self):
+        """數據文件的代數：compact 寫入新一代文件，再原子替換元數據切換過去"""
+        return int(self.meta["generation"])
+
+    def _path(self, ext, generation=None):
+        generation = self.generation if generation is None else generation
+        stem = 'vectors' if generation == 0 else f'vectors.{generation}'
+        return self.directory / (stem + ext)
+
+    @property
+    def data_path(self):
+        return self._path(self.DATA_EXT)
+
+    @property
+    def ids_path(self):
+        return self._path(self.IDS_EXT)
+
+    def _quantized_paths(self, precision=None, generation=None):
+        ext, _ = QUANTIZED[precision or self.precision]
+        return self._path(ext, generation), self._path(SCALE_EXT, generation)
+
+    def _generation_files(self, generation):
+        exts = [self.DATA_EXT, self.IDS_EXT, SCALE_EXT] + [ext for ext, _ in QUANTIZED.values()]
+        return [self._path(ext, generation) for ext in exts]
+
+    # ---------- 讀取 ----------
+
+    @property
+    def dim(self):
+        return int(self.meta["dim"])
+
+    @property
+    def model(self):
+        """寫入這些向量的編碼器 model_name（舊庫未記錄時為 None）"""
+        return self.meta.get("model")
+
+    @property
+    def count(self):
+        """矩陣總行數（含墓碑行）"""
+        return int(self.meta["count"])
+
+    def __len__(self):
+        """有效向量數"""
+        return self.count - int(self.meta["tombstones"])
+
+    def __contains__(self, mem_id):
+        return self.row_of(mem_id) is not None
+
+    def _read_row_ids(self):
+        """從磁碟讀取行號 → id 數組（墓碑行為 -1）"""
+        if self.count == 0:
+            return np.empty(0, dtype=np.int64)
+        row_ids = np.fromfile(self.ids_path, dtype=np.int64, count=self.count)
+        if len(row_ids) < self.count:
+            logger.error(f"{self.ids_path.name} has {len(row_ids)} rows, metadata says {self.count}")
+            row_ids = np.concatenate([row_ids, np.full(self.count - len(row_ids), -1, dtype=np.int64)])
+        return row_ids
+
+    def _map(self, path, dtype, shape):
+        if self.count == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+    def _open_views(self):
+        """
+        一次打開同一代的矩陣、粗排矩陣與行號數組
+        打開時舊一代文件已被 compact 刪除（元數據過期）則重新載入元數據再打開一次；
+        已打開的 memmap 在文件刪除後仍然有效，因此三者始終屬於同一代。
+        """
+        for attempt in range(2):
+            try:
+                matrix = self._map(self.data_path, DTYPE, (self.count, self.dim))
+                coarse = (matrix, None)
+                if self.precision != 'float32':
+                    path, scale_path = self._quantized_paths()
+                    coarse = (self._map(path, QUANTIZED[self.precision][1], (self.count, self.dim)),
+                              self._map(scale_path, DTYPE, (self.count,)) if self.precision == 'int8' else None)
+                row_ids = self._read_row_ids()
+            except FileNotFoundError:
+                if attempt:
+                    raise
+                self.meta = self._load_meta()
+                self._rows = None
+                continue
+            self._matrix, self._coarse, self._row_ids = matrix, coarse, row_ids
+            return
+
+    @property
+    def matrix(self):
+        """整個矩陣的只讀 memmap 視圖（count × dim，零拷貝）"""
+        if self._matrix is None:
+            self._open_views()
+        return self._matrix
+
+    @property
+    def precision(self):
+        """粗排矩陣的實際精度（'float32' 表示直接使用全精度矩陣）"""
+        return self.meta.get("precision", "float32")
+
+    @property
+    def coarse(self):
+        """量化粗排矩陣的 memmap 視圖：(matrix, scales)；未量化時為 (全精度矩陣, None)"""
+        if self._coarse is None:
+            self._open_views()
+        return self._coarse
+
+    def coarse_scores(self, query_vec):
+        """所有行與查詢向量的近似點積（分塊反量化，臨時緩衝區有界）"""
+        matrix, scales = self.coarse
+        if matrix.dtype == DTYPE:
+            return np.asarray(matrix @ query_vec)
+        scores = np.empty(len(matrix), dtype=DTYPE)
+        for start in range(0, len(matrix), SCORE_CHUNK):
+            block = np.asarray(matrix[start:start + SCORE_CHUNK], dtype=DTYPE)
+            scores[start:start + len(block)] = block @ query_vec
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    def search(self, query_vec, k, candidates=None):
+        """
+        量化粗排 + 全精度重排
+        Returns:
+            (ids, scores) - 按全精度分數降序的前 k 條
+        """
+        row_ids = self.row_ids()
+        if len(self) == 0:
+            return [], np.empty(0, dtype=DTYPE)
+        query_vec = normalize(query_vec)
+        if candidates is None:
+            candidates = Config.RERANK_CANDIDATES
+        candidates = min(len(row_ids), max(candidates, k * 4))
+
+        coarse = np.where(row_ids >= 0, self.coarse_scores(query_vec), -np.inf)
+        rows = np.argpartition(-coarse, candidates - 1)[:candidates]
+        rows = rows[row_ids[rows] >= 0]
+        rows.sort()  # 順序讀取全精度行
+        exact = np.asarray(self.matrix[rows]) @ query_vec
+        order = np.argsort(-exact)[:k]
+        return row_ids[rows[order]].tolist(), exact[order]
+
+    @property
+    def rows(self):
+        """id → 行號映射（首次按 id 查找時由行號數組建立）"""
+        if self._rows is None:
+            row_ids = self.row_ids()
+            live = np.flatnonzero(row_ids >= 0)
+            self._rows = dict(zip(row_ids[live].tolist(), live.tolist()))
+        return self._rows
+
+    def row_of(self, mem_id):
+        """返回記憶所在行號，不存在時返回 None"""
+        return self.rows.get(int(mem_id))
+
+    def get(self, mem_id):
+        """返回單條記憶的向量（memmap 行視圖），不存在時返回 None"""
+        row = self.row_of(mem_id)
+        if row is None:
+            return None
+        return self.matrix[row]
+
+    def rows_for(self, mem_ids):
+        """
+        批量查找行號
+        Returns:
+            (found_ids, rows) - 有向量的 id 列表與對應行號數組
+        """
+        rows_map = self.rows
+        found_ids, rows = [], []
+        for mem_id in mem_ids:
+            row = rows_map.get(int(mem_id))
+            if row is not None:
+                found_ids.append(mem_id)
+                rows.append(row)
+        return found_ids, np.asarray(rows, dtype=np.int64)
+
+    def row_ids(self):
+        """行號 → 記憶 id 的數組（墓碑行為 -1），緩存到元數據變化為止"""
+        if self._row_ids is None:
+            self._open_views()
+        return self._row_ids
+
+    def live(self):
+        """返回所有有效向量的 (ids, rows)"""
+        row_ids = self.row_ids()
+        rows = np.flatnonzero(row_ids >= 0)
+        return row_ids[rows].tolist(), rows
+
+    # ---------- 寫入 ----------
+
+    @staticmethod
+    def _write_at(path, offset, array):
+        mode = 'r+b' if path.exists() else 'w+b'
+        with open(path, mode) as f:
+            f.seek(offset)
+            f.truncate()
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    def _tombstone_rows(self, rows):
+        """在 .ids 文件中把這些行標記為 -1（原地寫入，不重寫整個文件）"""
+        marker = np.int64(-1).tobytes()
+        with open(self.ids_path, 'r+b') as f:
+            for row in sorted(rows):
+                f.seek(row * len(marker))
+                f.write(marker)
+
+    def _quantized_complete(self):
+        """量化文件是否覆蓋全部行"""
+        path, scale_path = self._quantized_paths()
+        itemsize = np.dtype(QUANTIZED[self.precision][1]).itemsize
+        if not path.exists() or path.stat().st_size < self.count * self.dim * itemsize:
+            return False
+        if self.precision == 'int8':
+            return scale_path.exists() and scale_path.stat().st_size >= self.count * DTYPE().itemsize
+        return True
+
+    def _rebuild_quantized(self, precision):
+        """從當前一代的全精度矩陣重建量化矩陣（持寫入鎖調用，調用方保存元數據）"""
+        old = self.precision
+        self._coarse = None
+        if precision != 'float32':
+            path, scale_path = self._quantized_paths(precision)
+            tmp_path = path.with_name(path.name + '.tmp')
+            matrix = self._map(self.data_path, DTYPE, (self.count, self.dim))
+            all_scales = []
+            with open(tmp_path, 'wb') as f:
+                for start in range(0, len(matrix), SCORE_CHUNK):
+                    quantized, scales = quantize(np.asarray(matrix[start:start + SCORE_CHUNK]), precision)
+                    f.write(quantized.tobytes())
+                    if scales is not None:
+                        all_scales.append(scales)
+            del matrix
+            if precision == 'int8':
+                tmp_scale = scale_path.with_name(scale_path.name + '.tmp')
+                np.concatenate(all_scales or [np.empty(0, dtype=DTYPE)]).tofile(tmp_scale)
+                os.replace(tmp_scale, scale_path)
+            os.replace(tmp_path, path)
+        if old != precision and old != 'float32':
+            # 舊精度的量化文件不再使用
+            for stale in self._quantized_paths(old):
+                if stale.exists() and (precision != 'int8' or stale.name != scale_path.name):
+                    stale.unlink()
+        self.meta["precision"] = precision
+        logger.info(f"Rebuilt {precision} coarse matrix ({self.count} rows)")
+
+    def _sync_precision(self):
+        """量化矩陣與目標精度不一致或殘缺時重建（持寫入鎖調用）"""
+        if self.target_precision == self.precision:
+            if self.precision == 'float32' or self._quantized_complete():
+                return
+        self._rebuild_quantized(self.target_precision)
+
+    def set_precision(self, precision=None):
+        """切換粗排精度並立即重建量化矩陣"""
+        if precision is not None:
+            self.target_precision = precision
+        with self._write_lock():
+            self._sync_precision()
+            self._save_meta()
+
+    def append(self, mem_id, vec):
+        """追加一條向量（同 id 已存在時舊行打墓碑）"""
+        return self.append_many([(mem_id, vec)])[0]
+
+    def append_many(self, items):
+        """批量追加 [(mem_id, vec), ...]，返回各自的行號"""
+        if not items:
+            return []
+        with self._write_lock():
+            vecs = np.stack([normalize(vec) for _, vec in items])
+            if vecs.shape[1] != self.dim:
+                if self.count == 0:
+                    self.meta["dim"] = int(vecs.shape[1])
+                else:
+                    raise ValueError(f"Vector dimension {vecs.shape[1]} != store dimension {self.dim}")
+            if self.writer_model:
+                if self.model not in (None, self.writer_model):
+                    raise ValueError(f"Encoder {self.writer_model} != store encoder {self.model}")
+                self.meta["model"] = self.writer_model
+
+            self._sync_precision()
+            start = self.count
+            rows_map = self.rows
+            replaced, rows = [], []
+            for offset, (mem_id, _) in enumerate(items):
+                mem_id = int(mem_id)
+                old_row = rows_map.get(mem_id)
+                if old_row is not None:
+                    replaced.append(old_row)
+                rows_map[mem_id] = start + offset
+                rows.append(start + offset)
+            ids = np.fromiter((int(mem_id) for mem_id, _ in items), dtype=np.int64, count=len(items))
+
+            # 以元數據為準：截掉上次中斷寫入留下的半行；新行在元數據替換前對讀取端不可見
+            self._write_at(self.data_path, start * self.dim * DTYPE().itemsize, vecs.astype(DTYPE, copy=False))
+            self._write_at(self.ids_path, start * ids.itemsize, ids)
+            if self.precision != 'float32':
+                path, scale_path = self._quantized_paths()
+                quantized, scales = quantize(vecs, self.precision)
+                self._write_at(path, start * self.dim * quantized.itemsize, quantized)
+                if scales is not None:
+                    self._write_at(scale_path, start * DTYPE().itemsize, scales)
+            if replaced:
+                self._tombstone_rows(replaced)
+
+            self.meta["tombstones"] += len(replaced)
+            self.meta["count"] = start + len(items)
+            self._save_meta()
+            logger.debug(f"Appended {len(items)} embeddings (rows {start}-{start + len(items) - 1})")
+            return rows
+
+    def delete(self, mem_id):
+        """刪除（打墓碑），返回是否存在"""
+        return self.delete_many([mem_id]) > 0
+
+    def delete_many(self, mem_ids):
+        """批量打墓碑，返回實際刪除數"""
+        if not mem_ids:
+            return 0
+        with self._write_lock():
+            rows_map = self.rows
+            removed = [row for row in (rows_map.pop(int(mem_id), None) for mem_id in mem_ids) if row is not None]
+            if removed:
+                self._tombstone_rows(removed)
+                self.meta["tombstones"] += len(removed)
+                self._save_meta()
+                logger.debug(f"Tombstoned {len(removed)} embeddings")
+            return len(removed)
+
+    def compact(self):
+        """
+        重寫矩陣，只保留有效行（按 id 排序），返回回收的行數
+        壓縮結果寫入新一代文件，元數據原子替換後才刪除舊一代：
+        無鎖讀取端看到的元數據與數據文件始終屬於同一代。
+        """
+        with self._write_lock():
+            reclaimed = self.count - len(self)
+            if reclaimed <= 0:
+                return 0
+
+            row_ids = self._read_row_ids()
+            live = np.flatnonzero(row_ids >= 0)
+            ordered = live[np.argsort(row_ids[live], kind='stable')]
+            old_generation = self.generation
+            generation = old_generation + 1
+            old = self._map(self.data_path, DTYPE, (self.count, self.dim))
+            with open(self._path(self.DATA_EXT, generation), 'wb') as f:
+                for start in range(0, len(ordered), SCORE_CHUNK):
+                    f.write(np.ascontiguousarray(old[ordered[start:start + SCORE_CHUNK]]).tobytes())
+            del old
+            row_ids[ordered].tofile(self._path(self.IDS_EXT, generation))
+
+            self.meta["generation"] = generation
+            self.meta["count"] = len(ordered)
+            self.meta["tombstones"] = 0
+            self._rows = None
+            self._reset_views()
+            # 量化矩陣按新的行順序重建（同時完成精度切換）
+            if self.precision != 'float32' or self.target_precision != 'float32':
+                self._rebuild_quantized(self.target_precision)
+            self._save_meta()
+            for stale in self._generation_files(old_generation):
+                if stale.exists():
+                    stale.unlink()
+            logger.info(f"Compacted embedding store: reclaimed {reclaimed} rows")
+            return reclaimed
+
+    def maybe_compact(self, ratio=None):
+        """墓碑比例超過閾值時壓縮"""
+        if ratio is None:
+            ratio = Config.EMBEDDING_COMPACT_RATIO
+        if self.count and (self.count - len(self)) / self.count > ratio:
+            return self.compact()
+        return 0
+
+    # ---------- 遷移 ----------
+
+    def migrate_legacy(self, remove=False):
+        """一次性導入舊的 mem_{id}.npy 文件，返回導入數量"""
+        items = []
+        for path in sorted(self.directory.glob('mem_*.npy')):
+            try:
+                mem_id = int(path.stem[len('mem_'):])
+                vec = np.load(path)
+            except (ValueError, OSError) as e:
+                logger.warning(f"Skipping legacy embedding {path.name}: {e}")
+                continue
+            if vec is None or vec.size == 0:
+                logger.warning(f"Skipping empty legacy embedding {path.name}")
+                continue
+            items.append((mem_id, vec, path))
+
+        if not items:
+            return 0
+
+        self.append_many([(mem_id, vec) for mem_id, vec, _ in items])
+        if remove:
+            for _, _, path in items:
+                path.unlink()
+        logger.info(f"Migrated {len(items)} legacy embeddings")
+        return len(items)
+
+    def stats(self):
+        coarse_bytes = 0
+        if self.precision != 'float32':
+            path, scale_path = self._quantized_paths()
+            coarse_bytes = sum(p.stat().st_size for p in (path, scale_path) if p.exists()
+                               and (self.precision == 'int8' or p != scale_path))
+        return {
+            "dim": self.dim,
+            "rows": self.count,
+            "live": len(self),
+            "tombstones": self.count - len(self),
+            "precision": self.precision,
+            "bytes": self.data_path.stat().st_size if self.data_path.exists() else 0,
+            "coarse_bytes": coarse_bytes,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 嵌入向量庫")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="導入舊的 mem_{id}.npy 文件")
+    migrate.add_argument("--remove-legacy", action="store_true", help="導入後刪除舊文件")
+    sub.add_parser("compact", help="回收墓碑行")
+    quantize_cmd = sub.add_parser("quantize", help="按 EMBEDDING_PRECISION（或 --precision）重建粗排矩陣")
+    quantize_cmd.add_argument("--precision", choices=["float32", "float16", "int8"], help="粗排精度")
+    sub.add_parser("stats", help="顯示向量庫統計")
+    args = parser.parse_args()
+
+    store = EmbeddingStore()
+    if args.command == "migrate":
+        count = store.migrate_legacy(remove=args.remove_legacy)
+        print(f"✅ 已導入 {count} 條舊向量")
+    elif args.command == "compact":
+        reclaimed = store.compact()
+        print(f"✅ 已回收 {reclaimed} 行")
+    elif args.command == "quantize":
+        store.set_precision(args.precision)
+        print(f"✅ 粗排精度: {store.precision}")
+    elif args.command == "stats":
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
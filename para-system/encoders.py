@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+編碼器後端 - 所有工具與 brain_server 通過 create_backend() 選用同一個後端
+    sentence-transformers  進程內加載 Config.SEMANTIC_MODEL（torch 線程數見 ENCODER_THREADS）
+    hashing                詞 / 字二元組特徵哈希，確定性、無需下載（離線、CI、壓測）
+    daemon                 轉發到常駐模型守護進程（run/brain.sock）
+後端由 Config.ENCODER_BACKEND（環境變量 YUE_ENCODER_BACKEND）選擇；默認 auto：
+守護進程在監聽時用 daemon，否則 sentence-transformers，不會悄悄換成 hashing。
+
+不同後端的向量不可混用：查詢快取按 model_name 隔離，向量庫記錄寫入時的 model_name，
+不一致時 SemanticEncoder 拒絕使用（見 EmbeddingStore.model）。
+
+用法: python3 encoders.py list
+      python3 encoders.py check [--backend hashing]
+"""
+
+import sys
+import json
+import zlib
+import argparse
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('encoders')
+
+
+class EncoderUnavailable(RuntimeError):
+    """後端依賴缺失或無法連接"""
+
+
+class EncoderBackend:
+    """後端接口：encode_many(texts, batch_size) → len(texts) × dim 的 float32 數組"""
+
+    name = None
+
+    def __init__(self, model_name, dim):
+        self.model_name = model_name
+        self.dim = dim
+
+    def encode_many(self, texts, batch_size=None):
+        raise NotImplementedError
+
+    def info(self):
+        return {"backend": self.name, "model": self.model_name, "dim": self.dim}
+
+    @classmethod
+    def model_name_for(cls, model_name=None):
+        """不創建實例（不加載模型）時此後端會使用的 model_name"""
+        return model_name or Config.SEMANTIC_MODEL
+
+
+class SentenceTransformerBackend(EncoderBackend):
+    """進程內的 sentence-transformers 模型"""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name=None, threads=None):
+        model_name = model_name or Config.SEMANTIC_MODEL
+        threads = Config.ENCODER_THREADS if threads is None else threads
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise EncoderUnavailable(f"sentence-transformers not installed ({e})") from e
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name)
+        dim_of = getattr(self.model, "get_sentence_embedding_dimension", None)
+        super().__init__(model_name, (dim_of() if dim_of else None) or Config.VECTOR_DIMENSION)
+        logger.info(f"Loaded model: {model_name}" + (f" ({threads} threads)" if threads > 0 else ""))
+
+    def encode_many(self, texts, batch_size=None):
+        import numpy as np
+        vecs = self.model.encode(list(texts), batch_size=batch_size or Config.ENCODE_BATCH_SIZE,
+                                 convert_to_tensor=False)
+        return np.asarray(vecs, dtype=np.float32).reshape(len(texts), -1)
+
+
+class HashingBackend(EncoderBackend):
+    """特徵哈希：text_index 的詞 / 字二元組按 crc32 帶符號累加到 dim 維（相近文本的向量相近）"""
+
+    name = "hashing"
+
+    def __init__(self, model_name=None, threads=None, dim=None):
+        dim = dim or Config.VECTOR_DIMENSION
+        # model_name 只用於 sentence-transformers；哈希向量以維度區分
+        super().__init__(self.model_name_for(dim=dim), dim)
+
+    @classmethod
+    def model_name_for(cls, model_name=None, dim=None):
+        return f"hashing-{dim or Config.VECTOR_DIMENSION}"
+
+    def _one(self, text, out):
+        from text_index import tokenize
+        for token in tokenize(text):
+            h = zlib.crc32(token.encode('utf-8'))
+            out[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+
+    def encode_many(self, texts, batch_size=None):
+        import numpy as np
+        vecs = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            self._one(text or "", vecs[i])
+        return vecs
+
+
+class DaemonBackend(EncoderBackend):
+    """常駐模型守護進程（客戶端不導入 torch）"""
+
+    name = "daemon"
+
+    def __init__(self, model_name=None, threads=None, client=None):
+        from model_daemon import DaemonClient
+        self.client = client or DaemonClient()
+        info = self.client.ping()
+        if not info:
+            raise EncoderUnavailable(f"Model daemon not listening on {self.client.socket_path}")
+        super().__init__(info.get("model") or Config.SEMANTIC_MODEL, info.get("dim") or Config.VECTOR_DIMENSION)
+        logger.debug(f"Using model daemon at {self.client.socket_path} ({self.model_name})")
+
+    def encode_many(self, texts, batch_size=None):
+        return self.client.encode(list(texts), batch_size or Config.ENCODE_BATCH_SIZE)
+
+    @classmethod
+    def model_name_for(cls, model_name=None, client=None):
+        """守護進程報告的模型名（一次 ping，不導入 torch）"""
+        from model_daemon import DaemonClient
+        client = client or DaemonClient()
+        info = client.ping()
+        if not info:
+            raise EncoderUnavailable(f"Model daemon not listening on {client.socket_path}")
+        return info.get("model") or Config.SEMANTIC_MODEL
+
+
+BACKENDS = {}
+
+
+def register_backend(name, factory):
+    """註冊後端；factory(model_name=None, threads=None) 返回 EncoderBackend"""
+    BACKENDS[name] = factory
+
+
+register_backend(SentenceTransformerBackend.name, SentenceTransformerBackend)
+register_backend(HashingBackend.name, HashingBackend)
+register_backend(DaemonBackend.name, DaemonBackend)
+
+
+def create_backend(name=None, model_name=None, allow_daemon=True):
+    """
+    按名稱創建後端（默認 Config.ENCODER_BACKEND）
+    allow_daemon=False 用於守護進程 / brain_server 自身：auto 與 daemon 都改為進程內加載
+    Raises:
+        EncoderUnavailable - 依賴缺失或守護進程未運行
+        ValueError - 未知的後端名稱
+    """
+    name = name or Config.ENCODER_BACKEND
+    if name in ("auto", "daemon") and not allow_daemon:
+        name = SentenceTransformerBackend.name
+    elif name == "auto":
+        try:
+            return DaemonBackend(model_name)
+        except EncoderUnavailable as e:
+            logger.debug(f"{e}; loading model in process")
+        name = SentenceTransformerBackend.name
+    factory = BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown encoder backend: {name} (available: {', '.join(sorted(BACKENDS))})")
+    return factory(model_name=model_name)
+
+
+def backend_model_name(name=None, model_name=None):
+    """
+    create_backend(name, model_name) 會使用的 model_name，但不創建後端（不加載模型）
+    只有 auto / daemon 才詢問守護進程；自行註冊、沒有 model_name_for 的後端按 sentence-transformers 處理
+    Raises:
+        EncoderUnavailable - daemon 後端而守護進程未運行
+        ValueError - 未知的後端名稱
+    """
+    name = name or Config.ENCODER_BACKEND
+    if name == "auto":
+        try:
+            return DaemonBackend.model_name_for(model_name)
+        except EncoderUnavailable as e:
+            logger.debug(f"{e}; model loads in process")
+        name = SentenceTransformerBackend.name
+    factory = BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown encoder backend: {name} (available: {', '.join(sorted(BACKENDS))})")
+    resolve = getattr(factory, "model_name_for", None)
+    return resolve(model_name) if resolve else EncoderBackend.model_name_for(model_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 編碼器後端")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="列出已註冊的後端")
+    check = sub.add_parser("check", help="創建後端並編碼一條測試文本")
+    check.add_argument("--backend", help=f"後端名稱（默認 {Config.ENCODER_BACKEND}）")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print(f"當前: {Config.ENCODER_BACKEND}")
+        for name in sorted(BACKENDS):
+            print(f"  {name}")
+        return 0
+
+    try:
+        backend = create_backend(args.backend)
+        vecs = backend.encode_many(["玥系統編碼器檢查 encoder check"])
+    except (EncoderUnavailable, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(json.dumps(dict(backend.info(), shape=list(vecs.shape)), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
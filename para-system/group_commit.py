@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+合併提交（group commit）- 常駐守護進程把短時間內的多個編碼請求合成一批
+第一個請求到達後等待 Config.INGEST_WINDOW_MS 或累計 Config.INGEST_MAX_ITEMS 條，
+整批一次模型推理、一次查重、一次索引提交（brain_encode._locked_ingest），
+再按請求拆分結果：每個調用方拿到自己那幾條的 new / reinforced。
+
+cron 腳本與子代理同時寫入時，鎖往返與日誌追加從每條一次降到每批一次。
+"""
+
+import time
+import threading
+from concurrent.futures import Future
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('group_commit')
+
+
+class GroupCommitter:
+    """單線程提交隊列：submit() 由各請求線程調用，阻塞到所在批次提交完成"""
+
+    def __init__(self, ingest_fn, window_ms=None, max_items=None):
+        """ingest_fn(items) → 與 items 一一對應的 [(status, memory, similarity, density_boost), ...]"""
+        self.ingest_fn = ingest_fn
+        self.window = (Config.INGEST_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_items = max_items or Config.INGEST_MAX_ITEMS
+        self._cond = threading.Condition()
+        self._queue = []  # [(enqueued, items, future), ...]
+        self._stats = {"requests": 0, "items": 0, "batches": 0, "max_batch": 0,
+                       "max_queue": 0, "commit_seconds": 0.0}
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, items, timeout=None):
+        """排隊等待合併提交，返回本請求各條的結果（提交失敗時拋出同一異常）"""
+        future = Future()
+        with self._cond:
+            self._queue.append((time.monotonic(), list(items), future))
+            self._stats["max_queue"] = max(self._stats["max_queue"], len(self._queue))
+            self._cond.notify()
+        return future.result(timeout)
+
+    def _queued_items(self):
+        return sum(len(items) for _, items, _ in self._queue)
+
+    def _next_batch(self):
+        """等到窗口結束或條數達到上限，取出整批請求"""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = self._queue[0][0] + self.window
+            while self._queued_items() < self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._queue = self._queue, []
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            items = [item for _, request_items, _ in batch for item in request_items]
+            t0 = time.perf_counter()
+            try:
+                outcomes = self.ingest_fn(items)
+            except Exception as e:
+                logger.error(f"Group commit of {len(items)} items failed: {e}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - t0
+
+            start = 0
+            for _, request_items, future in batch:
+                future.set_result(outcomes[start:start + len(request_items)])
+                start += len(request_items)
+
+            stats = self._stats
+            stats["requests"] += len(batch)
+            stats["items"] += len(items)
+            stats["batches"] += 1
+            stats["max_batch"] = max(stats["max_batch"], len(items))
+            stats["commit_seconds"] += elapsed
+            logger.debug(f"Group committed {len(items)} items from {len(batch)} requests in {elapsed * 1000:.1f}ms")
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats, queued=len(self._queue))
+        batches = max(stats["batches"], 1)
+        stats["avg_batch"] = round(stats["items"] / batches, 2)
+        stats["avg_commit_ms"] = round(stats.pop("commit_seconds") / batches * 1000, 2)
+        return stats
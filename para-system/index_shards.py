@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""
+分片記憶索引 - 按創建月份 × 領域（World / Role / User）把結構化索引拆成多個 JSON 分片
+（Config.INDEX_BACKEND = 'sharded'），與每日日誌 / 溫文件 / archive 的冷熱分層一致：
+新記憶只寫入當月分片，舊月份的分片很少變化。
+
+文件佈局（memory/shards/）：
+    2026-10.Role.json / .journal   每個分片是一個 JsonIndexStore（快照 + 日誌、世代號、無鎖讀取）
+    manifest.json                  清單：next_id、版本號、每個分片的條數 / 各狀態條數 / id 範圍 /
+                                   下一次衰減轉換時間（next_due）/ 最近清掃與折疊時間
+    centroids.npz                  每個分片的向量和與條數（質心，記錄寫入它的編碼器）
+    hashes.db                      content_hash → (id, 分片)，精確查重只載入命中的分片
+
+檢索只讀取相關分片：domain / since 條件精確剪枝，沒有條件時按查詢向量與質心的相似度取前
+Config.SHARD_PROBE 個（最新月份與沒有質心的分片總是讀取）。
+衰減只清掃 next_due 已到期的分片：全為 Golden 的分片沒有轉換，清掃或折疊後精確重算 next_due，
+之後未變化的分片直接跳過；寫入只會把 next_due 提前（強化推遲的轉換在下次清掃時修正）。
+
+寫入方持有 index.lock 排他鎖。新增時先發佈預留 id 的清單，再追加分片日誌，最後發佈新版本號：
+崩潰只會留下 id 空洞，不會重用 id；讀到新版本號的樂觀寫入方一定能在分片中看到對應的數據。
+
+用法: python3 index_shards.py migrate [--from json]
+      python3 index_shards.py centroids
+      python3 index_shards.py compact
+      python3 index_shards.py stats
+"""
+
+import os
+import re
+import sys
+import json
+import fcntl
+import sqlite3
+import datetime
+import argparse
+from pathlib import Path
+from collections import Counter
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+from index_store import JsonIndexStore, UPDATE_OPS, content_key, open_index_store
+from decay_model import next_transition
+
+logger = get_logger('index_shards')
+
+# 沒有有效創建日期的記憶歸入此分片（字典序大於任何月份，since 過濾時總是保留）
+UNDATED = "undated"
+
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+
+def shard_key(mem):
+    """記憶所屬分片：創建月份.領域（例如 2026-10.Role）"""
+    month = (mem.get("creation_date") or "")[:7]
+    if not _MONTH_RE.match(month):
+        month = UNDATED
+    return f"{month}.{_domain_part(mem.get('domain'))}"
+
+
+def _domain_part(domain):
+    return re.sub(r"[^A-Za-z0-9_-]", "_", domain or "Role")
+
+
+def _month_of(key):
+    return key.split(".", 1)[0]
+
+
+def _due_of(memories):
+    """最早的下一次衰減轉換時間（ISO 字符串；沒有待轉換的記憶時為 None）"""
+    dues = [when for when in map(next_transition, memories) if when is not None]
+    return min(dues).isoformat() if dues else None
+
+
+class ShardedIndexStore:
+    """按月份 × 領域分片的記憶索引（接口與 JsonIndexStore / SqliteIndexStore 相同）"""
+
+    def __init__(self, directory=None):
+        self.directory = Path(Config.SHARDS_DIR if directory is None else directory)
+        self.manifest_path = self.directory / "manifest.json"
+        self.centroids_path = self.directory / "centroids.npz"
+        self.hashes_path = self.directory / "hashes.db"
+        self.manifest = None
+        self._shards = {}  # key → JsonIndexStore（按需載入）
+        self._hashes = None
+
+    # ---------- 清單 ----------
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 0, "next_id": 1, "shards": {}}
+
+    def _ensure_manifest(self):
+        if self.manifest is None:
+            self.manifest = self._read_manifest()
+        return self.manifest
+
+    def _publish(self, bump=True):
+        """原子替換清單（bump 時遞增版本號；折疊 / 清掃不改變內容，不遞增）"""
+        if bump:
+            self.manifest["version"] += 1
+        self.manifest["last_sync"] = datetime.datetime.now().isoformat()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _entry(self, key):
+        return self.manifest["shards"].setdefault(key, {"count": 0, "states": {}})
+
+    def _shard(self, key, repair=True):
+        shard = self._shards.get(key)
+        if shard is None:
+            shard = self._shards[key] = JsonIndexStore(self.directory / f"{key}.json")
+            shard.load(repair)
+        return shard
+
+    def _recount(self, key, exact=False):
+        """按已載入的分片重算條數與各狀態條數；exact 時同時精確重算 id 範圍與 next_due"""
+        memories = self._shard(key).memories()
+        entry = self._entry(key)
+        entry["count"] = len(memories)
+        entry["states"] = dict(Counter(mem.get("state", "Unknown") for mem in memories))
+        if exact:
+            ids = [mem["id"] for mem in memories]
+            entry["min_id"], entry["max_id"] = (min(ids), max(ids)) if ids else (None, None)
+            entry["next_due"] = _due_of(memories)
+        return entry
+
+    @staticmethod
+    def _advance_due(entry, memories):
+        """新增 / 修改的記憶只可能讓 next_due 提前"""
+        due = _due_of(memories)
+        if due is not None and (entry.get("next_due") is None or due < entry["next_due"]):
+            entry["next_due"] = due
+
+    # ---------- 讀取 ----------
+
+    def exists(self):
+        return self.manifest_path.exists()
+
+    def keys(self):
+        """非空分片（按名稱排序，即按月份）"""
+        manifest = self._ensure_manifest()
+        return sorted(key for key, entry in manifest["shards"].items() if entry.get("count"))
+
+    def refresh(self):
+        """重讀清單（很小，每次原子替換，不按文件身份判斷：inode 可能被重用）；已載入的分片各自只重放新日誌"""
+        self.manifest = self._read_manifest()
+        for shard in self._shards.values():
+            shard.refresh()
+
+    def load(self, repair=True, shards=None):
+        """
+        載入分片（默認全部）並拼成與 JsonIndexStore.load 相同的結構
+        shards: 只讀取這些分片（見 route）；返回值的 "shards" 字段記錄實際讀取的分片，
+        "skipped" 為未讀取的非空分片數（0 表示是完整索引）
+        """
+        self.refresh()
+        all_keys = self.keys()
+        keys = all_keys if shards is None else shards
+        memories = []
+        for key in keys:
+            memories.extend(self._shard(key, repair).memories())
+        return {"memories": memories, "last_sync": self.manifest.get("last_sync"),
+                "version": self.manifest["version"], "shards": keys,
+                "skipped": len(set(all_keys) - set(keys))}
+
+    def route(self, filters=None, query_vec=None, model=None, probe=None):
+        """
+        檢索要讀取的分片
+        domain / since 條件按分片名精確剪枝；有查詢向量且剩餘分片多於 probe（默認 Config.SHARD_PROBE）時，
+        只取質心最相近的分片，最新月份與沒有質心（或質心來自其他編碼器）的分片總是保留
+        """
+        filters = filters or {}
+        self.refresh()
+        keys = self.keys()
+        if filters.get("domain"):
+            keys = [key for key in keys if key.split(".", 1)[1] == _domain_part(filters["domain"])]
+        if filters.get("since"):
+            keys = [key for key in keys if _month_of(key) >= filters["since"][:7]]
+        probe = Config.SHARD_PROBE if probe is None else probe
+        if query_vec is None or not probe or len(keys) <= probe:
+            return keys
+
+        import numpy as np
+        centroids = self.centroids(model)
+        months = [_month_of(key) for key in keys if _month_of(key) != UNDATED]
+        latest = max(months) if months else None
+        keep = [key for key in keys if key not in centroids or _month_of(key) in (latest, UNDATED)]
+        query = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+        ranked = sorted((key for key in keys if key not in keep),
+                        key=lambda key: float(centroids[key] @ query), reverse=True)
+        selected = set(keep + ranked[:max(probe - len(keep), 0)])
+        logger.debug(f"Routed query to {len(selected)}/{len(keys)} shards")
+        return [key for key in keys if key in selected]
+
+    def get(self, mem_id):
+        """按 id 查找（只載入 id 範圍覆蓋它的分片）"""
+        for key, entry in self._ensure_manifest()["shards"].items():
+            if entry.get("min_id") is not None and entry["min_id"] <= mem_id <= entry["max_id"]:
+                mem = self._shard(key).get(mem_id)
+                if mem is not None:
+                    return mem
+        return None
+
+    def count(self):
+        return sum(entry.get("count", 0) for entry in self._ensure_manifest()["shards"].values())
+
+    def memories(self):
+        """全部記憶（載入所有分片）"""
+        return self.load()["memories"]
+
+    def shard_memories(self, key):
+        """單個分片的記憶（衰減按分片清掃）"""
+        return self._shard(key).memories()
+
+    @property
+    def version(self):
+        """已提交的版本號（每次寫入遞增）"""
+        return self._ensure_manifest()["version"]
+
+    def last_id(self):
+        """已提交的最大 id（與版本號一起發佈；預留而未提交的 id 不算）"""
+        manifest = self._ensure_manifest()
+        return manifest.get("last_id", manifest["next_id"] - 1)
+
+    def find_duplicate(self, key):
+        """content_hash 相同的記憶：摘要庫給出所在分片，只載入該分片核對（未命中時不讀任何分片）"""
+        try:
+            rows = self._hash_conn().execute("SELECT id, shard FROM hashes WHERE hash = ? ORDER BY id",
+                                             (key,)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Shard hash lookup failed: {e}")
+            return None
+        for mem_id, shard_name in rows:
+            # 摘要庫可能比已載入的分片新，或留有已刪除的 id：以分片內容為準
+            mem = self._shard(shard_name).get(mem_id)
+            if mem is not None and mem.get("content_hash") == key:
+                return mem
+        return None
+
+    def added_since(self, last_id):
+        """id 大於 last_id 的記憶（只讀取 id 範圍超過它的分片）"""
+        added = []
+        for key, entry in self._ensure_manifest()["shards"].items():
+            if entry.get("max_id") is not None and entry["max_id"] > last_id:
+                added.extend(mem for mem in self._shard(key).memories() if mem["id"] > last_id)
+        return sorted(added, key=lambda mem: mem["id"])
+
+    # ---------- 寫入（調用方持有排他鎖）----------
+
+    def add(self, mem):
+        return self.add_many([mem])[0]
+
+    def add_many(self, mems):
+        """
+        分配 id 並按分片分組：先發佈預留了 id 的清單（版本號不變），再追加各分片日誌，
+        最後發佈統計、last_id 與新版本號（讀到新版本號時數據已在分片中）
+        """
+        if not mems:
+            return mems
+        self._ensure_manifest()
+        groups = {}
+        for mem in mems:
+            if mem.get("id") is None:
+                mem["id"] = self.manifest["next_id"]
+            self.manifest["next_id"] = max(self.manifest["next_id"], mem["id"] + 1)
+            mem.setdefault("content_hash", content_key(mem.get("content")))
+            groups.setdefault(shard_key(mem), []).append(mem)
+        self._publish(bump=False)
+        for key, group in groups.items():
+            self._shard(key).add_many(group)
+        self._record_hashes(mems)
+        for key, group in groups.items():
+            entry = self._entry(key)
+            entry["count"] = self._shards[key].count()
+            states = Counter(entry.get("states", {}))
+            states.update(mem.get("state", "Unknown") for mem in group)
+            entry["states"] = dict(states)
+            ids = [mem["id"] for mem in group]
+            entry["min_id"] = min(ids + ([entry["min_id"]] if entry.get("min_id") is not None else []))
+            entry["max_id"] = max(ids + ([entry["max_id"]] if entry.get("max_id") is not None else []))
+            self._advance_due(entry, group)
+        self.manifest["last_id"] = max(self.last_id(), *(mem["id"] for mem in mems))
+        self._publish()
+        return mems
+
+    def update(self, mem, op, fields):
+        self.update_many(op, [(mem, fields)])
+
+    def update_many(self, op, changes):
+        """批量記錄 [(mem, fields), ...]（mem 是 get 返回的、已修改的記憶）"""
+        if op not in UPDATE_OPS:
+            raise ValueError(f"Unsupported update op: {op}")
+        if not changes:
+            return
+        self._ensure_manifest()
+        groups = {}
+        for mem, fields in changes:
+            groups.setdefault(shard_key(mem), []).append((mem, fields))
+        for key, group in groups.items():
+            self._shard(key).update_many(op, group)
+            self._advance_due(self._recount(key), [mem for mem, _ in group])
+        self._publish()
+
+    def delete_many(self, mem_ids):
+        """刪除記憶"""
+        self._ensure_manifest()
+        groups = {}
+        for mem_id in dict.fromkeys(mem_ids):
+            mem = self.get(mem_id)
+            if mem is not None:
+                groups.setdefault(shard_key(mem), []).append(mem)
+        if not groups:
+            return 0
+        deleted = 0
+        for key, group in groups.items():
+            deleted += self._shards[key].delete_many([mem["id"] for mem in group])
+            entry = self._entry(key)
+            entry["count"] = self._shards[key].count()
+            states = Counter(entry.get("states", {}))
+            states.subtract(mem.get("state", "Unknown") for mem in group)
+            entry["states"] = {state: n for state, n in states.items() if n > 0}
+        self._forget_hashes([mem["id"] for group in groups.values() for mem in group])
+        self._publish()
+        return deleted
+
+    # ---------- 內容摘要 → 分片 ----------
+
+    def _hash_conn(self):
+        """摘要庫（首次打開時按全部分片一次性構建，之後隨寫入增量維護）"""
+        if self._hashes is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.hashes_path), timeout=Config.LOCK_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS hashes (id INTEGER PRIMARY KEY, hash TEXT NOT NULL, shard TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_hashes_hash ON hashes(hash);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+            self._hashes = conn
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'built'").fetchone() is None:
+                memories = self.memories() if self.exists() else []
+                with conn:
+                    self._insert_hashes(memories)
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('built', ?)", (datetime.datetime.now().isoformat(),))
+                logger.info(f"Built shard hash index ({len(memories)} memories)")
+        return self._hashes
+
+    def _insert_hashes(self, mems):
+        self._hashes.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?)",
+                                 [(mem["id"], mem["content_hash"], shard_key(mem)) for mem in mems])
+
+    def _record_hashes(self, mems):
+        conn = self._hash_conn()
+        with conn:
+            self._insert_hashes(mems)
+
+    def _forget_hashes(self, mem_ids):
+        conn = self._hash_conn()
+        with conn:
+            conn.executemany("DELETE FROM hashes WHERE id = ?", [(mem_id,) for mem_id in mem_ids])
+
+    # ---------- 衰減 / 折疊 ----------
+
+    def due_shards(self, now, full=False):
+        """
+        衰減需要清掃的分片：跳過全為 Golden 的分片；
+        非 full 時跳過 next_due 未到的分片（清掃 / 折疊後精確重算，之後的寫入只會提前它）
+        """
+        now = now.isoformat()
+        keys = []
+        for key in self.keys():
+            entry = self.manifest["shards"][key]
+            if entry.get("states", {}).get("Golden", 0) >= entry["count"]:
+                continue
+            due = entry.get("next_due", "")
+            if not full and (due is None or due > now):
+                continue
+            keys.append(key)
+        return keys
+
+    def mark_swept(self, keys, now):
+        """衰減清掃完成：精確重算這些分片的統計與 next_due"""
+        self._ensure_manifest()
+        for key in keys:
+            self._recount(key, exact=True)["swept"] = now.isoformat()
+        if keys:
+            self._publish(bump=False)
+
+    def maybe_compact(self, threshold=None):
+        """已載入的分片各自在日誌達到閾值時折疊；折疊時精確重算該分片的統計"""
+        compacted = [key for key, shard in self._shards.items() if shard.maybe_compact(threshold)]
+        return self._mark_compacted(compacted)
+
+    def compact(self):
+        """折疊所有有日誌記錄的分片"""
+        self.refresh()
+        compacted = []
+        for key in self.keys():
+            shard = self._shard(key)
+            if shard.journal_records:
+                shard.save()
+                compacted.append(key)
+        return self._mark_compacted(compacted)
+
+    def _mark_compacted(self, keys):
+        if not keys:
+            return False
+        now = datetime.datetime.now().isoformat()
+        for key in keys:
+            self._recount(key, exact=True)["compacted"] = now
+        self._publish(bump=False)
+        return True
+
+    # ---------- 質心 ----------
+
+    def _read_centroids(self):
+        """Returns: (model, {key: (向量和, 條數)})"""
+        import numpy as np
+        if not self.centroids_path.exists():
+            return None, {}
+        with np.load(self.centroids_path, allow_pickle=False) as data:
+            return (str(data["model"]),
+                    {str(key): (vec, int(n)) for key, vec, n in zip(data["keys"], data["sums"], data["counts"])})
+
+    def _write_centroids(self, model, sums):
+        import numpy as np
+        self.directory.mkdir(parents=True, exist_ok=True)
+        keys = sorted(sums)
+        tmp_path = self.centroids_path.with_suffix('.npz.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, model=np.array(model), keys=np.array(keys, dtype=str),
+                     sums=np.array([sums[key][0] for key in keys], dtype=np.float64),
+                     counts=np.array([sums[key][1] for key in keys], dtype=np.int64))
+        os.replace(tmp_path, self.centroids_path)
+
+    def centroids(self, model=None):
+        """{分片: 歸一化的質心}；model 與寫入質心的編碼器不一致時返回空字典"""
+        from embedding_store import normalize
+        stored, sums = self._read_centroids()
+        if model is not None and stored != model:
+            return {}
+        return {key: normalize(vec) for key, (vec, n) in sums.items() if n}
+
+    def add_vectors(self, pairs, model):
+        """新記憶的向量累加進所在分片的質心（pairs: [(mem, vec), ...]；刪除不回減，rebuild_centroids 重建）"""
+        import numpy as np
+        from embedding_store import normalize
+        stored, sums = self._read_centroids()
+        if stored != model:
+            if sums:
+                logger.warning(f"Shard centroids were built with {stored}, resetting for {model}")
+            sums = {}
+        for mem, vec in pairs:
+            key = shard_key(mem)
+            total, n = sums.get(key, (np.zeros(len(vec), dtype=np.float64), 0))
+            sums[key] = (total + normalize(vec), n + 1)
+        if pairs:
+            self._write_centroids(model, sums)
+
+    def rebuild_centroids(self, embeddings):
+        """按向量庫重建所有分片的質心，返回有向量的記憶數"""
+        import numpy as np
+        sums, found = {}, 0
+        for key in self.keys():
+            ids, rows = embeddings.rows_for([mem["id"] for mem in self._shard(key).memories()])
+            if ids:
+                sums[key] = (np.asarray(embeddings.matrix[rows], dtype=np.float64).sum(axis=0), len(ids))
+                found += len(ids)
+        self._write_centroids(embeddings.model, sums)
+        return found
+
+    # ---------- 導入 ----------
+
+    def import_index(self, index):
+        """導入 JSON 索引（保留原 id，同 id 覆蓋），按分片寫出快照並精確重算清單"""
+        self._ensure_manifest()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        groups = {}
+        for mem in index.get("memories", []):
+            mem.setdefault("content_hash", content_key(mem.get("content")))
+            groups.setdefault(shard_key(mem), []).append(mem)
+        for key, group in groups.items():
+            shard = self._shard(key)
+            by_id = {mem["id"]: mem for mem in shard.memories()}
+            by_id.update((mem["id"], mem) for mem in group)
+            shard.index["memories"] = list(by_id.values())
+            shard.index["next_id"] = max(by_id) + 1
+            shard.save()
+            self._shards.pop(key)
+            self._recount(key, exact=True)
+            self.manifest["next_id"] = max(self.manifest["next_id"], max(by_id) + 1)
+            self.manifest["last_id"] = max(self.last_id(), max(by_id))
+        self._record_hashes([mem for group in groups.values() for mem in group])
+        self._publish()
+        return sum(len(group) for group in groups.values())
+
+    def stats(self):
+        manifest = self._ensure_manifest()
+        return {"shards": len(self.keys()), "memories": self.count(), "version": manifest["version"],
+                "next_id": manifest["next_id"],
+                "all_golden": sum(1 for key in self.keys()
+                                  if manifest["shards"][key].get("states", {}).get("Golden", 0)
+                                  >= manifest["shards"][key]["count"])}
+
+
+def _locked(fn):
+    """持 index.lock 排他鎖執行"""
+    lock_path = os.path.join(Config.MEMORY_DIR, "index.lock")
+    os.makedirs(Config.MEMORY_DIR, exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            return fn()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 分片記憶索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="把現有索引拆分為分片（之後設置 YUE_INDEX_BACKEND=sharded）")
+    migrate.add_argument("--from", dest="source", choices=["json", "sqlite"], default="json", help="來源後端")
+    sub.add_parser("centroids", help="按向量庫重建分片質心")
+    sub.add_parser("compact", help="折疊所有分片的日誌")
+    sub.add_parser("stats", help="顯示清單與各分片統計")
+    args = parser.parse_args()
+
+    store = ShardedIndexStore()
+    if args.command == "migrate":
+        source = open_index_store(args.source)
+        if not source.exists():
+            print(f"❌ 找不到 {args.source} 索引")
+            return 1
+        count = _locked(lambda: store.import_index(source.load(repair=False)))
+        print(f"✅ 已導入 {count} 條記憶到 {len(store.keys())} 個分片（{store.directory}）")
+        args.command = "centroids" if Config.EMBEDDINGS_DIR.exists() else None
+    if args.command == "centroids":
+        from embedding_store import EmbeddingStore
+        found = _locked(lambda: store.rebuild_centroids(EmbeddingStore()))
+        print(f"✅ 已按 {found} 條向量重建 {len(store.keys())} 個分片的質心")
+    elif args.command == "compact":
+        compacted = _locked(store.compact)
+        print("✅ 已折疊分片日誌" if compacted else "✅ 沒有需要折疊的日誌")
+    elif args.command == "stats":
+        manifest = store._ensure_manifest()
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+        for key in store.keys():
+            entry = manifest["shards"][key]
+            states = " ".join(f"{state}={n}" for state, n in sorted(entry.get("states", {}).items()))
+            print(f"  {key:<20} {entry['count']:>7}  {states}  next_due={entry.get('next_due')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
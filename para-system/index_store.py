@@ -0,0 +1,728 @@
+#!/usr/bin/env python3
+"""
+記憶索引存儲 - 可插拔後端（Config.INDEX_BACKEND）
+
+json:   index.json 快照 + index.journal 追加日誌（write-ahead journal）
+        單條記憶的變更只追加一行小記錄（O(1) I/O），讀取時在快照上重放日誌，
+        日誌達到閾值或手動執行 compact 時折疊回快照。
+        每次提交遞增版本號（version，隨提交標記寫入日誌、折疊時寫入快照），寫入方據此做樂觀並發檢查。
+        快照與日誌帶世代號（generation）：折疊時寫出新世代的快照與空日誌，各自原子 rename 發佈，
+        不原地截斷；讀取方不加鎖，已打開的文件就是它的一致快照，讀到的日誌屬於更新的世代時重讀。
+        快照保存單調遞增的 next_id（刪除最大 id 後也不重用）；內存中維護 id → 記憶 / 列表位置，
+        按 id 查找、強化、刪除都是 O(1)。
+sqlite: index.db（WAL 模式），state / last_access / actor / target / domain / content_hash 建索引，
+        新記憶按主鍵增量讀取（衰減排程），id 由 AUTOINCREMENT 分配，版本號存於 meta 表。
+sharded: 按月份 × 領域拆分的多個 JSON 分片 + 清單（見 index_shards）。
+
+日誌記錄（JSONL，每行一條，字段值均為絕對值，重放是冪等的）：
+    {"op": "generation", "generation": 4}          # 日誌首行：所屬快照世代
+    {"op": "add",       "memory": {...}}
+    {"op": "reinforce", "id": 3, "fields": {...}}
+    {"op": "decay",     "id": 3, "fields": {...}}
+    {"op": "usage",     "id": 3, "fields": {...}}     # 檢索計數（usage_buffer 合併）
+    {"op": "delete",    "id": 3}
+    {"op": "commit", "version": 12}                 # 每次追加的結尾：讀取方只應用到最後一個提交標記
+
+每條記憶保存 content_hash（規範化內容的摘要，見 content_key），
+find_duplicate 據此 O(1) 找到逐字節或僅空白不同的重複內容。
+
+寫入方需持有 index.lock 的排他鎖；讀取方不加鎖，不會被寫入方（模型推理、衰減重寫）阻塞。
+"""
+
+import json
+import os
+import sys
+import fcntl
+import time
+import hashlib
+import datetime
+import argparse
+import unicodedata
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('index_store')
+
+# 字段更新類日誌記錄
+UPDATE_OPS = ("reinforce", "decay", "usage")
+
+# 讀取快照與日誌之間恰好被折疊時的重讀次數
+LOAD_RETRIES = 20
+
+
+def _file_sig(stat):
+    """文件身份（被 rename 替換後改變）"""
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def content_key(text):
+    """精確查重鍵：NFKC 規範化、合併空白後的 SHA-1（不改變大小寫）"""
+    normalized = " ".join(unicodedata.normalize('NFKC', text or '').split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+class JsonIndexStore:
+    """index.json 快照 + 追加日誌"""
+
+    def __init__(self, index_path=None):
+        self.index_path = Config.INDEX_PATH if index_path is None else index_path
+        self.journal_path = self.index_path.with_suffix('.journal')
+        self.index = None
+        self._by_id = {}
+        self._pos = {}  # id → index["memories"] 中的位置
+        self._by_hash = {}  # content_hash → 最小的 id
+        self._hash_extra = {}  # content_hash → 其餘 id（只有查重前的舊索引才會有逐字重複）
+        self._snapshot_sig = None
+        self._journal_ino = None
+        self._journal_offset = 0  # 已重放到的日誌位置（refresh 從這裡繼續）
+        self._journal_framed = False  # 日誌帶世代首行與提交標記（舊格式日誌逐行應用）
+        self.journal_records = 0
+
+    # ---------- 讀取 ----------
+
+    def _load_snapshot(self, repair=True):
+        """
+        讀取快照
+        Returns:
+            (snapshot, 文件身份) - 身份取自已打開的文件，與讀到的內容一致
+        """
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    sig = _file_sig(os.fstat(f.fileno()))
+                    return json.load(f), sig
+            except json.JSONDecodeError as e:
+                logger.error(f"Index file corrupted: {e}")
+                if not repair:
+                    raise
+                backup_path = str(self.index_path) + ".corrupt"
+                if os.path.exists(backup_path):
+                    os.remove(backup_path)
+                os.rename(self.index_path, backup_path)
+                logger.warning(f"Corrupt file moved to {backup_path}. Initializing new index.")
+        return None, None
+
+    def _read_journal(self, offset=0, framed=False, expect_ino=None):
+        """
+        從 offset 起讀取已提交的日誌記錄
+        帶提交標記的日誌只消費到最後一個標記，舊格式日誌消費到最後一個完整行；
+        正在寫入的尾部留給下次 refresh
+        Returns:
+            (records, 已消費到的文件偏移, 日誌世代（首行沒有世代時為 None）, 文件 inode)；
+            打開的不是 expect_ino（剛被折疊替換）時返回 None
+        """
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            return None if expect_ino is not None else ([], 0, None, None)
+        with f:
+            ino = os.fstat(f.fileno()).st_ino
+            if expect_ino is not None and ino != expect_ino:
+                return None
+            f.seek(offset)
+            data = f.read()
+        records, uncommitted, generation = [], [], None
+        consumed = pos = 0
+        for line_no, line in enumerate(data.splitlines(keepends=True), 1):
+            pos += len(line)
+            if not line.endswith(b"\n"):
+                break
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                logger.warning(f"Skipping truncated journal record at line {line_no}")
+                continue
+            op = record.get("op")
+            if op == "generation":
+                generation = record["generation"]
+                framed = True
+            elif op == "commit":
+                records.extend(uncommitted)
+                records.append(record)
+                uncommitted = []
+            elif framed:
+                uncommitted.append(record)
+                continue
+            else:
+                records.append(record)
+            consumed = pos
+        return records, offset + consumed, generation, ino
+
+    def _register(self, mem):
+        """把記憶登記到列表與 id / 位置 / 內容摘要映射"""
+        # 舊記憶沒有 content_hash 時現場補算（下次折疊快照時寫入）
+        key = mem.setdefault("content_hash", content_key(mem.get("content")))
+        self._pos[mem["id"]] = len(self.index["memories"])
+        self.index["memories"].append(mem)
+        self._by_id[mem["id"]] = mem
+        first = self._by_hash.get(key)
+        if first is None:
+            self._by_hash[key] = mem["id"]
+        else:
+            self._hash_extra.setdefault(key, []).append(max(first, mem["id"]))
+            self._by_hash[key] = min(first, mem["id"])
+        self.index["next_id"] = max(self.index["next_id"], mem["id"] + 1)
+
+    def _unregister(self, mem_id):
+        """從列表與映射中移除（與末尾元素交換後彈出，快照寫出時再按 id 排序）"""
+        mem = self._by_id.pop(mem_id, None)
+        if mem is None:
+            return False
+        key = mem.get("content_hash")
+        extra = self._hash_extra.get(key)
+        if self._by_hash.get(key) == mem_id:
+            # 還有同內容的記憶時由下一個接替，精確查重仍能命中
+            if extra:
+                self._by_hash[key] = extra.pop(extra.index(min(extra)))
+            else:
+                del self._by_hash[key]
+        elif extra and mem_id in extra:
+            extra.remove(mem_id)
+        if extra is not None and not extra:
+            del self._hash_extra[key]
+        memories = self.index["memories"]
+        pos = self._pos.pop(mem_id)
+        last = memories.pop()
+        if pos < len(memories):
+            memories[pos] = last
+            self._pos[last["id"]] = pos
+        return True
+
+    def _apply(self, record):
+        op = record.get("op")
+        if op == "add":
+            mem = record["memory"]
+            if mem["id"] in self._by_id:
+                self._unregister(mem["id"])
+            self._register(mem)
+        elif op in UPDATE_OPS:
+            mem = self._by_id.get(record["id"])
+            if mem is not None:
+                mem.update(record["fields"])
+        elif op == "delete":
+            self._unregister(record["id"])
+        elif op == "commit":
+            self.index["version"] = max(self.index["version"], record.get("version", 0))
+        else:
+            logger.warning(f"Unknown journal op: {op}")
+
+    def _signature(self):
+        """快照文件的身份（被折疊替換後改變）"""
+        try:
+            return _file_sig(os.stat(self.index_path))
+        except FileNotFoundError:
+            return None
+
+    def exists(self):
+        return os.path.exists(self.index_path) or self.journal_path.exists()
+
+    def load(self, repair=True):
+        """
+        載入快照並重放日誌（不加鎖；repair=True 時損壞的快照移到 .corrupt 並重新初始化）
+        日誌屬於比快照更新的世代說明兩次讀取之間被折疊，重讀；
+        日誌比快照舊（折疊的兩次 rename 之間）時重放是冪等的，結果一致
+        """
+        for attempt in range(LOAD_RETRIES):
+            snapshot, snapshot_sig = self._load_snapshot(repair)
+            if snapshot is None:
+                snapshot = {"memories": [], "last_sync": datetime.datetime.now().isoformat()}
+            records, offset, generation, journal_ino = self._read_journal()
+            if generation is None or generation <= snapshot.get("generation", 0):
+                break
+            logger.debug(f"Index compacted while loading (journal generation {generation}), retrying")
+            time.sleep(0.001 * (attempt + 1))
+        else:
+            raise RuntimeError(f"Index kept changing while loading {self.index_path}")
+
+        self._snapshot_sig = snapshot_sig
+        self._journal_offset, self._journal_ino = offset, journal_ino
+        self._journal_framed = generation is not None
+        memories = snapshot["memories"]
+        self.index = dict(snapshot, memories=[], next_id=snapshot.get("next_id", 1),
+                          version=snapshot.get("version", 0))
+        self._by_id, self._pos, self._by_hash, self._hash_extra = {}, {}, {}, {}
+        for mem in memories:
+            self._register(mem)
+        for record in records:
+            self._apply(record)
+        self.journal_records = self._count_changes(records)
+
+        logger.debug(f"Loaded index with {len(self.index['memories'])} memories "
+                     f"({self.journal_records} journal records replayed)")
+        return self.index
+
+    def refresh(self):
+        """與磁碟同步：快照與日誌都未被替換時只重放新提交的日誌記錄，否則重新載入"""
+        try:
+            stat = os.stat(self.journal_path)
+            journal_ino, journal_size = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            journal_ino, journal_size = None, 0
+        if (self.index is None or self._signature() != self._snapshot_sig
+                or journal_ino != self._journal_ino or journal_size < self._journal_offset):
+            self.load()
+            return
+        if journal_ino is None:
+            return
+        tail = self._read_journal(self._journal_offset, self._journal_framed, journal_ino)
+        # 折疊總是先替換快照：讀完日誌後快照未變，讀到的就是同一世代的日誌（inode 可能被重用）
+        if tail is None or self._signature() != self._snapshot_sig:
+            self.load()
+            return
+        records, self._journal_offset, _, _ = tail
+        for record in records:
+            self._apply(record)
+        self.journal_records += self._count_changes(records)
+
+    @staticmethod
+    def _count_changes(records):
+        return sum(1 for record in records if record.get("op") != "commit")
+
+    def _ensure_loaded(self):
+        if self.index is None:
+            self.load()
+
+    def get(self, mem_id):
+        self._ensure_loaded()
+        return self._by_id.get(mem_id)
+
+    def count(self):
+        self._ensure_loaded()
+        return len(self.index["memories"])
+
+    def memories(self):
+        """全部記憶（內存中的列表，不重新載入）"""
+        self._ensure_loaded()
+        return self.index["memories"]
+
+    @property
+    def version(self):
+        """已提交的版本號（每次追加日誌遞增）"""
+        self._ensure_loaded()
+        return self.index["version"]
+
+    def last_id(self):
+        """已分配的最大 id（之後新增的記憶都大於它）"""
+        self._ensure_loaded()
+        return self.index["next_id"] - 1
+
+    def find_duplicate(self, key):
+        """content_hash 相同的記憶，沒有時返回 None"""
+        self._ensure_loaded()
+        mem_id = self._by_hash.get(key)
+        return None if mem_id is None else self._by_id.get(mem_id)
+
+    def added_since(self, last_id):
+        """id 大於 last_id 的記憶（衰減排程據此發現新記憶）"""
+        self._ensure_loaded()
+        return [mem for mem in self.index["memories"] if mem["id"] > last_id]
+
+    # ---------- 寫入（調用方持有排他鎖）----------
+
+    def _generation_line(self):
+        return json.dumps({"op": "generation", "generation": self.index.get("generation", 0)}) + "\n"
+
+    def _append(self, records):
+        """追加一批記錄與提交標記（一次 write，讀取方要麼看到整批，要麼看不到）"""
+        if not records:
+            return
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        with open(self.journal_path, 'ab') as f:
+            start = f.tell()
+            lines = [json.dumps(record, ensure_ascii=False) + "\n" for record in records]
+            if start == 0:
+                lines.insert(0, self._generation_line())
+            self.index["version"] += 1
+            lines.append(json.dumps({"op": "commit", "version": self.index["version"]}) + "\n")
+            f.write("".join(lines).encode('utf-8'))
+            f.flush()
+            # 之前的記錄都已重放過時，自己寫入的部分不必再由 refresh 讀回
+            if start == self._journal_offset:
+                self._journal_offset = f.tell()
+                self._journal_ino = os.fstat(f.fileno()).st_ino
+                self._journal_framed = self._journal_framed or start == 0
+        self.journal_records += len(records)
+
+    def _insert(self, mem):
+        """分配 id（未指定時取 next_id）並登記"""
+        if mem.get("id") is None:
+            mem["id"] = self.index["next_id"]
+        self._register(mem)
+
+    def add(self, mem):
+        """新增記憶（未指定 id 時分配 next_id）"""
+        self._ensure_loaded()
+        self._insert(mem)
+        self._append([{"op": "add", "memory": mem}])
+        return mem
+
+    def add_many(self, mems):
+        """批量新增（一次日誌追加）"""
+        self._ensure_loaded()
+        for mem in mems:
+            self._insert(mem)
+        self._append([{"op": "add", "memory": mem} for mem in mems])
+        return mems
+
+    def update(self, mem, op, fields):
+        """記錄已修改的字段（op 為 reinforce、decay 或 usage）"""
+        if op not in UPDATE_OPS:
+            raise ValueError(f"Unsupported update op: {op}")
+        self._append([{"op": op, "id": mem["id"], "fields": {key: mem[key] for key in fields if key in mem}}])
+
+    def update_many(self, op, changes):
+        """批量記錄 [(mem, fields), ...]"""
+        if op not in UPDATE_OPS:
+            raise ValueError(f"Unsupported update op: {op}")
+        self._append([{"op": op, "id": mem["id"], "fields": {key: mem[key] for key in fields if key in mem}}
+                      for mem, fields in changes])
+
+    def delete_many(self, mem_ids):
+        """刪除記憶"""
+        self._ensure_loaded()
+        mem_ids = [mem_id for mem_id in dict.fromkeys(mem_ids) if self._unregister(mem_id)]
+        if not mem_ids:
+            return 0
+        self._append([{"op": "delete", "id": mem_id} for mem_id in mem_ids])
+        return len(mem_ids)
+
+    # ---------- 壓縮 ----------
+
+    def save(self):
+        """寫出下一世代的完整快照與空日誌（各自原子替換，已打開舊文件的讀取方不受影響）"""
+        self.index["last_sync"] = datetime.datetime.now().isoformat()
+        self.index["generation"] = self.index.get("generation", 0) + 1
+        self.index["memories"].sort(key=lambda mem: mem["id"])
+        self._pos = {mem["id"]: pos for pos, mem in enumerate(self.index["memories"])}
+        tmp_path = self.index_path.with_suffix('.json.tmp')
+        journal_tmp = self.journal_path.with_suffix('.journal.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=2)
+            header = self._generation_line()
+            with open(journal_tmp, 'w', encoding='utf-8') as f:
+                f.write(header)
+            # 先發佈快照：兩次 rename 之間的讀取方會在新快照上重放舊日誌，重放是冪等的
+            os.replace(tmp_path, self.index_path)
+            os.replace(journal_tmp, self.journal_path)
+            self._snapshot_sig = self._signature()
+            self._journal_ino = os.stat(self.journal_path).st_ino
+            self._journal_offset = len(header.encode('utf-8'))
+            self._journal_framed = True
+            self.journal_records = 0
+            logger.debug(f"Saved index with {len(self.index.get('memories', []))} memories")
+        except Exception as e:
+            logger.error(f"Failed to save index: {e}")
+            raise
+
+    def maybe_compact(self, threshold=None):
+        """日誌記錄數達到閾值時折疊回快照"""
+        if threshold is None:
+            threshold = Config.JOURNAL_COMPACT_THRESHOLD
+        if self.journal_records >= threshold:
+            logger.info(f"Compacting index journal ({self.journal_records} records)")
+            self.save()
+            return True
+        return False
+
+
+class SqliteIndexStore:
+    """SQLite 後端（WAL 模式，常用查詢列建索引）"""
+
+    # 獨立成列的字段；其他字段存入 extra（JSON）
+    COLUMNS = ("id", "content", "actor", "target", "domain", "initial_importance",
+               "current_importance", "s_factor", "density", "access_count",
+               "retrieval_count", "last_access", "creation_date", "state", "content_hash")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content TEXT NOT NULL,
+            actor TEXT,
+            target TEXT,
+            domain TEXT,
+            initial_importance REAL,
+            current_importance REAL,
+            s_factor REAL,
+            density REAL,
+            access_count INTEGER DEFAULT 0,
+            retrieval_count INTEGER DEFAULT 0,
+            last_access TEXT,
+            creation_date TEXT,
+            state TEXT,
+            extra TEXT,
+            content_hash TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_memories_state ON memories(state);
+        CREATE INDEX IF NOT EXISTS idx_memories_last_access ON memories(last_access);
+        CREATE INDEX IF NOT EXISTS idx_memories_actor ON memories(actor);
+        CREATE INDEX IF NOT EXISTS idx_memories_target ON memories(target);
+        CREATE INDEX IF NOT EXISTS idx_memories_domain ON memories(domain);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = Config.SQLITE_PATH if db_path is None else db_path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), timeout=Config.LOCK_TIMEOUT)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+            self._migrate()
+        return self._conn
+
+    def _migrate(self):
+        """舊數據庫補上 content_hash 列並回填"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(memories)")}
+        with self._conn:
+            if "content_hash" not in columns:
+                self._conn.execute("ALTER TABLE memories ADD COLUMN content_hash TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memories_content_hash ON memories(content_hash)")
+            rows = self._conn.execute("SELECT id, content FROM memories WHERE content_hash IS NULL").fetchall()
+            if rows:
+                self._conn.executemany("UPDATE memories SET content_hash = ? WHERE id = ?",
+                                       [(content_key(row[1]), row[0]) for row in rows])
+                logger.info(f"Backfilled content_hash for {len(rows)} memories")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- 行 ↔ 字典 ----------
+
+    def _to_dict(self, row):
+        mem = {key: row[key] for key in self.COLUMNS}
+        if row["extra"]:
+            mem.update(json.loads(row["extra"]))
+        return mem
+
+    def _split(self, mem):
+        columns = {key: mem[key] for key in self.COLUMNS if key in mem}
+        extra = {key: value for key, value in mem.items() if key not in self.COLUMNS}
+        return columns, (json.dumps(extra, ensure_ascii=False) if extra else None)
+
+    # ---------- 讀取 ----------
+
+    def exists(self):
+        return os.path.exists(self.db_path)
+
+    def load(self, repair=True):
+        """載入全部記憶（與 JSON 後端相同的結構；記憶與版本號在同一個讀事務中讀取）"""
+        self.conn.execute("BEGIN")
+        try:
+            rows = self.conn.execute("SELECT * FROM memories ORDER BY id").fetchall()
+            last_sync = self.conn.execute("SELECT value FROM meta WHERE key = 'last_sync'").fetchone()
+            version = self.version
+        finally:
+            self.conn.execute("COMMIT")
+        return {
+            "memories": [self._to_dict(row) for row in rows],
+            "last_sync": last_sync[0] if last_sync else datetime.datetime.now().isoformat(),
+            "version": version,
+        }
+
+    def get(self, mem_id):
+        row = self.conn.execute("SELECT * FROM memories WHERE id = ?", (mem_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+    def memories(self):
+        return self.load()["memories"]
+
+    @property
+    def version(self):
+        """已提交的版本號（每個寫入事務遞增）"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def last_id(self):
+        """已分配的最大 id（AUTOINCREMENT 不重用，之後新增的記憶都大於它）"""
+        row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'memories'").fetchone()
+        return row[0] if row else 0
+
+    def find_duplicate(self, key):
+        """content_hash 相同的記憶（走索引），沒有時返回 None"""
+        row = self.conn.execute("SELECT * FROM memories WHERE content_hash = ? ORDER BY id LIMIT 1",
+                                (key,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def added_since(self, last_id):
+        """id 大於 last_id 的記憶（走主鍵）"""
+        rows = self.conn.execute("SELECT * FROM memories WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    # ---------- 寫入 ----------
+
+    def _insert(self, mem):
+        mem.setdefault("content_hash", content_key(mem.get("content")))
+        columns, extra = self._split(mem)
+        columns["extra"] = extra
+        names = ", ".join(columns)
+        marks = ", ".join("?" for _ in columns)
+        cur = self.conn.execute(f"INSERT OR REPLACE INTO memories ({names}) VALUES ({marks})",
+                                tuple(columns.values()))
+        return cur.lastrowid
+
+    def add(self, mem):
+        """新增記憶（未指定 id 時由 AUTOINCREMENT 分配）"""
+        with self.conn:
+            if mem.get("id") is None:
+                mem.pop("id", None)
+            mem["id"] = self._insert(mem)
+            self._touch()
+        return mem
+
+    def add_many(self, mems):
+        """批量新增（單一事務）"""
+        with self.conn:
+            for mem in mems:
+                if mem.get("id") is None:
+                    mem.pop("id", None)
+                mem["id"] = self._insert(mem)
+            self._touch()
+        return mems
+
+    def _update_rows(self, changes):
+        for mem, fields in changes:
+            columns = {key: mem[key] for key in fields if key in mem and key in self.COLUMNS}
+            extra_fields = {key: mem[key] for key in fields if key in mem and key not in self.COLUMNS}
+            if extra_fields:
+                row = self.conn.execute("SELECT extra FROM memories WHERE id = ?", (mem["id"],)).fetchone()
+                extra = json.loads(row["extra"]) if row and row["extra"] else {}
+                extra.update(extra_fields)
+                columns["extra"] = json.dumps(extra, ensure_ascii=False)
+            if columns:
+                assignments = ", ".join(f"{key} = ?" for key in columns)
+                self.conn.execute(f"UPDATE memories SET {assignments} WHERE id = ?",
+                                  (*columns.values(), mem["id"]))
+
+    def update(self, mem, op, fields):
+        self.update_many(op, [(mem, fields)])
+
+    def update_many(self, op, changes):
+        """批量更新 [(mem, fields), ...]（op 為 reinforce、decay 或 usage）"""
+        if op not in UPDATE_OPS:
+            raise ValueError(f"Unsupported update op: {op}")
+        if not changes:
+            return
+        with self.conn:
+            self._update_rows(changes)
+            self._touch()
+
+    def delete_many(self, mem_ids):
+        if not mem_ids:
+            return 0
+        with self.conn:
+            cur = self.conn.executemany("DELETE FROM memories WHERE id = ?", [(mem_id,) for mem_id in mem_ids])
+            self._touch()
+        return cur.rowcount
+
+    def _touch(self):
+        """在寫入事務內更新同步時間並遞增版本號"""
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_sync', ?)",
+                          (datetime.datetime.now().isoformat(),))
+        self.conn.execute("INSERT INTO meta (key, value) VALUES ('version', 1) "
+                          "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def refresh(self):
+        """每次查詢直接讀數據庫，無需同步"""
+
+    def maybe_compact(self, threshold=None):
+        """WAL 由 SQLite 自動 checkpoint，無需額外折疊"""
+        return False
+
+    # ---------- 導入 / 導出 ----------
+
+    def import_index(self, index):
+        """導入 JSON 索引（保留原 id），返回導入數量"""
+        memories = index.get("memories", [])
+        with self.conn:
+            for mem in memories:
+                self._insert(mem)
+            self._touch()
+        return len(memories)
+
+    def export_json(self, path):
+        """導出為與 index.json 相同格式的可讀 JSON"""
+        index = self.load()
+        tmp_path = str(path) + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return len(index["memories"])
+
+
+def open_index_store(backend=None):
+    """按 Config.INDEX_BACKEND 打開記憶索引存儲"""
+    backend = backend or Config.INDEX_BACKEND
+    if backend == "json":
+        return JsonIndexStore()
+    if backend == "sqlite":
+        return SqliteIndexStore()
+    if backend == "sharded":
+        from index_shards import ShardedIndexStore
+        return ShardedIndexStore()
+    raise ValueError(f"Unknown index backend: {backend}")
+
+
+def compact():
+    """持鎖加載並折疊 JSON 日誌（供 cron / 手動調用）"""
+    lock_path = os.path.join(Config.MEMORY_DIR, "index.lock")
+    os.makedirs(Config.MEMORY_DIR, exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            store = JsonIndexStore()
+            store.load()
+            records = store.journal_records
+            if records:
+                store.save()
+            return records
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 記憶索引存儲")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("compact", help="把日誌折疊回 index.json 快照")
+    importer = sub.add_parser("import-json", help="把 index.json（含日誌）導入 SQLite")
+    importer.add_argument("--db", help="SQLite 路徑（默認 Config.SQLITE_PATH）")
+    exporter = sub.add_parser("export-json", help="把 SQLite 導出為可讀 JSON")
+    exporter.add_argument("path", nargs="?", help="輸出路徑（默認 index.export.json）")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        records = compact()
+        print(f"✅ 已折疊 {records} 條日誌記錄")
+    elif args.command == "import-json":
+        source = JsonIndexStore()
+        if not source.exists():
+            print(f"❌ 找不到 {source.index_path}")
+            return 1
+        target = SqliteIndexStore(args.db) if args.db else SqliteIndexStore()
+        count = target.import_index(source.load(repair=False))
+        print(f"✅ 已導入 {count} 條記憶到 {target.db_path}")
+    elif args.command == "export-json":
+        path = args.path or Config.INDEX_PATH.with_name('index.export.json')
+        count = SqliteIndexStore().export_json(path)
+        print(f"✅ 已導出 {count} 條記憶到 {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,6 +8,16 @@ import sys
 from pathlib import Path
 from config import Config
 
+class LazyFileHandler(logging.FileHandler):
+    """第一條日誌寫入時才創建目錄並打開文件（導入模塊不產生任何文件系統副作用）"""
+    
+    def __init__(self, filename, encoding='utf-8'):
+        super().__init__(filename, encoding=encoding, delay=True)
+    
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
 class LoggerManager:
     """日誌管理器"""
     
@@ -19,9 +29,6 @@ class LoggerManager:
         if name in cls._loggers:
             return cls._loggers[name]
         
-        # 確保日誌目錄存在
-        Config.ensure_dirs()
-        
         # 創建日誌記錄器
         logger = logging.getLogger(name)
         logger.setLevel(logging.DEBUG)
@@ -29,8 +36,8 @@ class LoggerManager:
         # 移除已有的處理器（避免重複）
         logger.handlers.clear()
         
-        # 控制台處理器（INFO 級別）
-        console_handler = logging.StreamHandler(sys.stdout)
+        # 控制台處理器（INFO 級別，輸出到 stderr，stdout 留給命令結果）
+        console_handler = logging.StreamHandler(sys.stderr)
         console_handler.setLevel(logging.INFO)
         console_formatter = logging.Formatter(
             '%(levelname)s - %(message)s'
@@ -38,12 +45,12 @@ class LoggerManager:
         console_handler.setFormatter(console_formatter)
         logger.addHandler(console_handler)
         
-        # 文件處理器（DEBUG 級別）
+        # 文件處理器（DEBUG 級別，延遲到第一次寫入時打開）
         if log_file is None:
             log_file = Config.LOGS_DIR / f"{name}.log"
         
         try:
-            file_handler = logging.FileHandler(log_file, encoding='utf-8')
+            file_handler = LazyFileHandler(log_file)
             file_handler.setLevel(logging.DEBUG)
             file_formatter = logging.Formatter(Config.LOG_FORMAT, Config.LOG_DATE_FORMAT)
             file_handler.setFormatter(file_formatter)
@@ -58,9 +65,3 @@ class LoggerManager:
 def get_logger(name):
     """獲取日誌記錄器"""
     return LoggerManager.get_logger(name)
-
-# 預定義的日誌記錄器
-brain_encode_logger = get_logger('brain_encode')
-brain_retrieve_logger = get_logger('brain_retrieve')
-memory_decay_logger = get_logger('memory_decay')
-semantic_encoder_logger = get_logger('semantic_encoder')
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 """
-記憶衰減器 v1.1 - 實現 Silver/Bronze 時間衰減機制
+記憶衰減器 v1.2 - 實現 Silver/Bronze 時間衰減機制
 改進：統一配置、日誌系統、完整錯誤處理
-每日執行一次，自動降低舊記憶的重要性
+有效重要性由 decay_model 在讀取時閉式計算；本任務只處理排程中已到期的
+狀態轉換與 Dust 刪除，成本與變化數量成正比，而不是與索引大小成正比
 """
 
 import json
@@ -16,6 +17,8 @@ from pathlib import Path
 # 導入配置和日誌
 from config import Config
 from logger import get_logger
+from index_store import open_index_store
+from decay_model import DecayParams, DecaySchedule, effective, next_transition
 
 logger = get_logger('memory_decay')
 
@@ -27,60 +30,20 @@ BRONZE_DECAY_DAYS = Config.BRONZE_DECAY_DAYS
 DECAY_RATE = Config.DECAY_RATE
 DUST_THRESHOLD = Config.DUST_THRESHOLD
 
-def load_index():
-    """載入記憶索引"""
-    if not os.path.exists(INDEX_PATH):
-        logger.warning(f"Index file not found: {INDEX_PATH}")
-        return None
-    
-    try:
-        with open(INDEX_PATH, 'r', encoding='utf-8') as f:
-            index = json.load(f)
-            logger.debug(f"Loaded index with {len(index.get('memories', []))} memories")
-            return index
-    except json.JSONDecodeError as e:
-        logger.error(f"Index file corrupted: {e}")
-        return None
-
-def save_index(data):
-    """保存記憶索引"""
-    data["last_sync"] = datetime.datetime.now().isoformat()
-    try:
-        with open(INDEX_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        logger.debug(f"Saved index with {len(data.get('memories', []))} memories")
-    except Exception as e:
-        logger.error(f"Failed to save index: {e}")
-        raise
-
-def parse_date(date_str):
-    """解析 ISO 格式的日期字符串"""
-    try:
-        return datetime.datetime.fromisoformat(date_str)
-    except (ValueError, TypeError):
-        return None
-
-def update_state(mem):
-    """根據 current_importance 更新記憶狀態"""
-    importance = mem.get("current_importance", 0.5)
-    if importance >= 0.85:
-        mem["state"] = "Golden"
-    elif importance >= 0.50:
-        mem["state"] = "Silver"
-    elif importance >= 0.20:
-        mem["state"] = "Bronze"
-    else:
-        mem["state"] = "Dust"
+# 衰減時會修改的字段（current_importance 是錨點值，衰減只落盤狀態轉換）
+DECAY_FIELDS = ("state",)
 
-def apply_decay(dry_run=False):
+def apply_decay(dry_run=False, full=False):
     """
-    應用記憶衰減
+    應用記憶衰減（只處理排程中已到期的狀態轉換）
     
-    衰減規則：
+    衰減規則（decay_model 閉式計算）：
     - Golden: 永不衰減
     - Silver: 7 天後每天衰減 20%
     - Bronze: 30 天後每天衰減 20%
     - Dust: 自動刪除
+    
+    full: 忽略現有排程，全量掃描重建
     """
     lock_path = os.path.join(MEMORY_DIR, "index.lock")
     os.makedirs(MEMORY_DIR, exist_ok=True)
@@ -89,108 +52,181 @@ def apply_decay(dry_run=False):
         try:
             fcntl.flock(lock_file, fcntl.LOCK_EX)
             
-            index = load_index()
-            if not index:
+            store = open_index_store()
+            if not store.exists():
+                logger.warning(f"Index not found for backend '{Config.INDEX_BACKEND}'")
                 return
             
+            if not dry_run:
+                # 先合併讀路徑緩衝的檢索計數
+                from usage_buffer import UsageBuffer
+                UsageBuffer().merge(store)
+            before = store.version
+            
             now = datetime.datetime.now()
+            params = DecayParams(SILVER_DECAY_DAYS, BRONZE_DECAY_DAYS, DECAY_RATE)
+            if hasattr(store, 'due_shards'):
+                return _decay_shards(store, now, params, dry_run, full, before)
+            schedule = DecaySchedule(params=params)
+            if full or not schedule.load():
+                # 首次運行 / 參數改變 / 手動要求：全量重建排程
+                schedule.rebuild(store.load()["memories"])
+                logger.info(f"Rebuilt decay schedule ({len(schedule)} entries)")
+            else:
+                # 上次運行後新增的記憶入堆
+                for mem in store.added_since(schedule.last_id):
+                    schedule.push(mem)
+                # 上次運行後被強化的記憶：轉換時間可能提前，舊條目在堆中惰性作廢
+                for mem_id in schedule.touched():
+                    mem = store.get(mem_id)
+                    if mem is not None:
+                        schedule.push(mem)
+            
             stats = {
-                "total": len(index["memories"]),
+                "total": store.count(),
+                "checked": 0,
                 "decayed": 0,
                 "deleted": 0,
                 "unchanged": 0
             }
             
-            memories_to_keep = []
+            deleted_ids = []
+            decayed = []
             
-            for mem in index.get("memories", []):
-                mem_id = mem.get("id", "?")
-                state = mem.get("state", "Unknown")
-                old_importance = mem.get("current_importance", 0.5)
+            for mem_id in dict.fromkeys(schedule.pop_due(now)):
+                mem = store.get(mem_id)
+                if mem is None:
+                    continue  # 已刪除
+                stats["checked"] += 1
                 
-                # Golden 記憶永不衰減
-                if state == "Golden":
-                    stats["unchanged"] += 1
-                    memories_to_keep.append(mem)
-                    logger.debug(f"Memory #{mem_id} (Golden) unchanged")
+                when = next_transition(mem, params)
+                if when is None:
+                    continue  # 強化後升為 Golden
+                if when > now:
+                    # 期間被強化過，轉換時間推遲
+                    schedule.push(mem)
                     continue
                 
-                # 計算距離上次訪問的天數
-                last_access_str = mem.get("last_access")
-                last_access = parse_date(last_access_str)
-                
-                if not last_access:
-                    # 如果沒有 last_access，使用 creation_date
-                    last_access_str = mem.get("creation_date")
-                    last_access = parse_date(last_access_str)
-                
-                if not last_access:
-                    # 如果都沒有，跳過
-                    logger.warning(f"Memory #{mem_id} has no timestamp, skipping")
-                    stats["unchanged"] += 1
-                    memories_to_keep.append(mem)
-                    continue
-                
-                days_since_access = (now - last_access).days
-                
-                # Silver 衰減：7 天後開始衰減
-                if state == "Silver" and days_since_access >= SILVER_DECAY_DAYS:
-                    # 計算衰減次數（每天衰減一次）
-                    decay_times = days_since_access - SILVER_DECAY_DAYS + 1
-                    new_importance = old_importance * (DECAY_RATE ** decay_times)
-                    mem["current_importance"] = round(new_importance, 4)
-                    update_state(mem)
-                    stats["decayed"] += 1
-                    
-                    logger.info(f"Memory #{mem_id} (Silver) decayed: {old_importance:.4f} → {new_importance:.4f} (days: {days_since_access})")
-                    memories_to_keep.append(mem)
-                
-                # Bronze 衰減：30 天後開始衰減
-                elif state == "Bronze" and days_since_access >= BRONZE_DECAY_DAYS:
-                    decay_times = days_since_access - BRONZE_DECAY_DAYS + 1
-                    new_importance = old_importance * (DECAY_RATE ** decay_times)
-                    mem["current_importance"] = round(new_importance, 4)
-                    update_state(mem)
-                    stats["decayed"] += 1
-                    
-                    logger.info(f"Memory #{mem_id} (Bronze) decayed: {old_importance:.4f} → {new_importance:.4f} (days: {days_since_access})")
-                    memories_to_keep.append(mem)
+                old_state = mem.get("state", "Unknown")
+                importance, state = effective(mem, now, params)
                 
                 # Dust 自動刪除
-                elif state == "Dust" or mem.get("current_importance", 0) < DUST_THRESHOLD:
+                if state == "Dust" or importance < DUST_THRESHOLD:
                     stats["deleted"] += 1
-                    logger.info(f"Memory #{mem_id} deleted (importance: {old_importance:.4f})")
+                    deleted_ids.append(mem_id)
+                    logger.info(f"Memory #{mem_id} deleted (importance: {importance:.4f})")
+                    continue
+                
+                if state == old_state:
+                    schedule.push(mem)
+                    continue
                 
-                else:
-                    stats["unchanged"] += 1
-                    memories_to_keep.append(mem)
+                mem["state"] = state
+                stats["decayed"] += 1
+                decayed.append((mem, DECAY_FIELDS))
+                schedule.push(mem)
+                logger.info(f"Memory #{mem_id} decayed: {old_state} → {state} (importance: {importance:.4f})")
             
-            # 更新索引
-            index["memories"] = memories_to_keep
+            stats["unchanged"] = stats["total"] - stats["decayed"] - stats["deleted"]
             
             if not dry_run:
-                save_index(index)
-            
-            # 打印統計
-            print(f"\n✅ 衰減完成")
-            print(f"   總記憶數: {stats['total']}")
-            print(f"   已衰減: {stats['decayed']}")
-            print(f"   已刪除: {stats['deleted']}")
-            print(f"   未變化: {stats['unchanged']}")
-            
-            if dry_run:
-                print(f"\n⚠️  這是 DRY RUN，未實際保存任何更改")
+                _save_changes(store, decayed, deleted_ids, before)
+                schedule.save()
             
+            _print_stats(stats, dry_run)
             return stats
         
         finally:
             fcntl.flock(lock_file, fcntl.LOCK_UN)
 
+def _decay_shards(store, now, params, dry_run, full, before):
+    """
+    分片存儲（調用方持有排他鎖）：只清掃 next_due 已到期的分片，跳過全為 Golden 與清掃 / 折疊後未到期的分片；
+    命令行覆蓋了衰減參數時清單中的 next_due 不適用，全量清掃
+    """
+    swept = store.due_shards(now, full=full or params.to_dict() != DecayParams().to_dict())
+    stats = {"total": store.count(), "shards": len(swept), "checked": 0, "decayed": 0, "deleted": 0,
+             "unchanged": 0}
+    deleted_ids = []
+    decayed = []
+    for key in swept:
+        for mem in store.shard_memories(key):
+            stats["checked"] += 1
+            old_state = mem.get("state", "Unknown")
+            importance, state = effective(mem, now, params)
+            if state == "Dust" or importance < DUST_THRESHOLD:
+                stats["deleted"] += 1
+                deleted_ids.append(mem["id"])
+                logger.info(f"Memory #{mem['id']} deleted (importance: {importance:.4f})")
+            elif state != old_state:
+                mem["state"] = state
+                stats["decayed"] += 1
+                decayed.append((mem, DECAY_FIELDS))
+                logger.info(f"Memory #{mem['id']} decayed: {old_state} → {state} (importance: {importance:.4f})")
+    stats["unchanged"] = stats["total"] - stats["decayed"] - stats["deleted"]
+    logger.info(f"Swept {len(swept)}/{len(store.keys())} shards")
+    
+    if not dry_run:
+        _save_changes(store, decayed, deleted_ids, before)
+        store.mark_swept(swept, now)
+    
+    _print_stats(stats, dry_run)
+    return stats
+
+def _save_changes(store, decayed, deleted_ids, before):
+    """落盤狀態轉換與刪除，並同步各輔助索引（before 為本次寫入前的索引版本，用於推進元數據索引戳記）"""
+    # 只追加變更記錄，達到閾值時折疊回快照
+    store.update_many("decay", decayed)
+    store.delete_many(deleted_ids)
+    store.maybe_compact()
+    
+    if Config.META_INDEX_PATH.exists():
+        from meta_index import MetaIndex
+        meta = MetaIndex()
+        meta.upsert_many([mem for mem, _ in decayed])
+        meta.remove_many(deleted_ids)
+        meta.advance(before, store.version)
+    
+    # 刪除的記憶在向量矩陣中打墓碑，墓碑過多時壓縮
+    if deleted_ids:
+        from embedding_store import EmbeddingStore
+        embeddings = EmbeddingStore()
+        embeddings.delete_many(deleted_ids)
+        embeddings.maybe_compact()
+        
+        if Config.ANN_INDEX_PATH.exists():
+            from ann_index import IVFIndex
+            ann = IVFIndex(lists=False)
+            ann.remove(deleted_ids)
+            ann.flush()
+        
+        if Config.TEXT_INDEX_PATH.exists():
+            from text_index import TextIndex
+            TextIndex().remove_many(deleted_ids)
+        
+        if Config.MINHASH_PATH.exists():
+            from minhash import MinHashIndex
+            MinHashIndex().remove_many(deleted_ids)
+
+def _print_stats(stats, dry_run):
+    print(f"\n✅ 衰減完成")
+    print(f"   總記憶數: {stats['total']}")
+    if "shards" in stats:
+        print(f"   清掃分片: {stats['shards']}")
+    print(f"   到期檢查: {stats['checked']}")
+    print(f"   已衰減: {stats['decayed']}")
+    print(f"   已刪除: {stats['deleted']}")
+    print(f"   未變化: {stats['unchanged']}")
+    
+    if dry_run:
+        print(f"\n⚠️  這是 DRY RUN，未實際保存任何更改")
+
 def main():
     global SILVER_DECAY_DAYS, BRONZE_DECAY_DAYS
     
     parser = argparse.ArgumentParser(description="玥系統 - 記憶衰減器")
     parser.add_argument("--dry-run", action="store_true", help="模擬運行，不實際保存")
+    parser.add_argument("--full", action="store_true", help="全量掃描並重建衰減排程")
     parser.add_argument("--silver-days", type=int, default=SILVER_DECAY_DAYS, help="Silver 衰減天數")
     parser.add_argument("--bronze-days", type=int, default=BRONZE_DECAY_DAYS, help="Bronze 衰減天數")
     
@@ -207,7 +243,7 @@ def main():
     if args.dry_run:
         logger.info("DRY RUN mode - no changes will be saved")
     
-    apply_decay(dry_run=args.dry_run)
+    apply_decay(dry_run=args.dry_run, full=args.full)
 
 if __name__ == "__main__":
     main()
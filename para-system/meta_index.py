@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+記憶元數據索引 - state / actor / target / domain / creation_date 的倒排索引
+過濾條件先在索引上求出候選 id 集合，檢索只對這個子集打分
+
+存儲在 memory/meta_index.db（SQLite WAL），每個字段一個二級索引（即按值分組的有序 id 列表）。
+stamp 表記錄索引反映的記憶索引版本（index store 的 version）：寫入方持 index.lock 同步變更後推進戳記，
+中間有未同步的寫入時戳記停在舊版本；檢索發現戳記與載入的版本不一致就退回內存過濾，不在讀路徑上重建。
+由 brain_encode / memory_decay 增量維護（索引已構建時），用 `python3 meta_index.py build` 持鎖重建。
+
+保存的 state 可能落後於閉式衰減（到期的轉換要等衰減任務落盤），
+所以按 state 過濾時同時取出可能已衰減到該狀態的記憶，由調用方用有效狀態複核。
+
+用法: python3 meta_index.py build
+      python3 meta_index.py stats
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import datetime
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('meta_index')
+
+FIELDS = ("state", "actor", "target", "domain")
+
+# 狀態只會向下衰減（強化會重寫保存的 state），按有效狀態過濾時需要掃描的已保存狀態
+DECAYS_INTO = {
+    "Golden": ("Golden",),
+    "Silver": ("Silver",),
+    "Bronze": ("Silver", "Bronze"),
+    "Dust": ("Silver", "Bronze", "Dust"),
+}
+
+_RELATIVE_RE = re.compile(r"^(\d+)([dhw])$")
+
+
+def parse_since(value):
+    """
+    解析 --since：ISO 日期 / 時間（2026-10-01、2026-10-01T08:00），或相對時間（7d、12h、2w）
+    Returns:
+        ISO 格式字符串（可 JSON 序列化，經守護進程轉發）
+    """
+    match = _RELATIVE_RE.match(value.strip())
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        delta = {"d": datetime.timedelta(days=amount), "h": datetime.timedelta(hours=amount),
+                 "w": datetime.timedelta(weeks=amount)}[unit]
+        return (datetime.datetime.now() - delta).isoformat()
+    return datetime.datetime.fromisoformat(value.strip()).isoformat()
+
+
+def _timestamp(date_str):
+    try:
+        return datetime.datetime.fromisoformat(date_str).timestamp()
+    except (ValueError, TypeError):
+        return None
+
+
+class MetaIndex:
+    """SQLite 上的元數據倒排索引"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        id      INTEGER PRIMARY KEY,
+        state   TEXT,
+        actor   TEXT,
+        target  TEXT,
+        domain  TEXT,
+        created REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_meta_state   ON meta(state);
+    CREATE INDEX IF NOT EXISTS idx_meta_actor   ON meta(actor);
+    CREATE INDEX IF NOT EXISTS idx_meta_target  ON meta(target);
+    CREATE INDEX IF NOT EXISTS idx_meta_domain  ON meta(domain);
+    CREATE INDEX IF NOT EXISTS idx_meta_created ON meta(created);
+    CREATE TABLE IF NOT EXISTS stamp (
+        key   TEXT PRIMARY KEY,
+        value INTEGER
+    );
+    """
+
+    def __init__(self, path=None):
+        self.path = Config.META_INDEX_PATH if path is None else path
+        self._conn = None
+
+    def exists(self):
+        return self.path.exists()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=Config.LOCK_TIMEOUT)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- 寫入 ----------
+
+    def upsert_many(self, memories):
+        """新增或更新記憶的元數據（單一事務）"""
+        if not memories:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?, ?, ?)",
+                [(mem["id"], *(mem.get(field) for field in FIELDS), _timestamp(mem.get("creation_date")))
+                 for mem in memories])
+        logger.debug(f"Indexed metadata for {len(memories)} memories")
+
+    def remove_many(self, ids):
+        if not ids:
+            return
+        with self.conn:
+            self.conn.executemany("DELETE FROM meta WHERE id = ?", [(mem_id,) for mem_id in ids])
+        logger.debug(f"Removed metadata for {len(ids)} memories")
+
+    def rebuild(self, memories, version):
+        """從記憶列表全量重建，戳記設為這些記憶所屬的索引版本（持 index.lock 調用）"""
+        with self.conn:
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("INSERT OR REPLACE INTO stamp VALUES ('version', ?)", (version,))
+        self.upsert_many(memories)
+        logger.info(f"Rebuilt metadata index ({len(memories)} memories, version {version})")
+
+    def advance(self, before, version):
+        """
+        寫入方（持 index.lock）同步完自己的變更後推進戳記：
+        只有戳記等於寫入前的版本 before 時才推進到 version，否則說明中間有未同步的寫入，保持過期
+        Returns:
+            是否推進
+        """
+        with self.conn:
+            cursor = self.conn.execute("UPDATE stamp SET value = ? WHERE key = 'version' AND value = ?",
+                                       (version, before))
+        if not cursor.rowcount:
+            logger.warning(f"Metadata index is stale (expected version {before}); "
+                           f"run `python3 meta_index.py build`")
+        return cursor.rowcount > 0
+
+    # ---------- 查詢 ----------
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM meta").fetchone()[0]
+
+    def stamp(self):
+        """索引反映的記憶索引版本（未記錄時為 None）"""
+        row = self.conn.execute("SELECT value FROM stamp WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def select(self, state=None, actor=None, target=None, domain=None, since=None):
+        """
+        求滿足所有條件的記憶 id（state 按可能衰減到的狀態放寬，見 DECAYS_INTO）
+        Returns:
+            set(id)
+        """
+        clauses, params = [], []
+        if state:
+            states = DECAYS_INTO.get(state, (state,))
+            clauses.append(f"state IN ({', '.join('?' * len(states))})")
+            params.extend(states)
+        for field, value in (("actor", actor), ("target", target), ("domain", domain)):
+            if value:
+                clauses.append(f"{field} = ?")
+                params.append(value)
+        if since:
+            clauses.append("created >= ?")
+            params.append(_timestamp(since))
+        sql = "SELECT id FROM meta" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        return {row[0] for row in self.conn.execute(sql, params)}
+
+    def stats(self):
+        stats = {"memories": self.count(), "version": self.stamp(),
+                 "bytes": self.path.stat().st_size if self.path.exists() else 0}
+        for field in FIELDS:
+            stats[field] = dict(self.conn.execute(
+                f"SELECT {field}, COUNT(*) FROM meta GROUP BY {field} ORDER BY COUNT(*) DESC").fetchall())
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 記憶元數據索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="從記憶索引全量重建")
+    sub.add_parser("stats", help="顯示各字段的取值分佈")
+    args = parser.parse_args()
+
+    meta = MetaIndex()
+    if args.command == "build":
+        import fcntl
+        from index_store import open_index_store
+        store = open_index_store()
+        if not store.exists():
+            print("❌ 記憶索引不存在")
+            return 1
+        # 持鎖重建：期間沒有寫入方，戳記與讀到的記憶一致
+        with open(os.path.join(Config.MEMORY_DIR, "index.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                index = store.load()
+                meta.rebuild(index["memories"], store.version)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        print(f"✅ 已索引 {len(index['memories'])} 條記憶")
+    elif args.command == "stats":
+        print(json.dumps(meta.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
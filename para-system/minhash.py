@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+MinHash / LSH 近重複檢測 - 無模型回退路徑的候選查找
+內容切成字符三元組，64 個哈希置換取最小值作為簽名；簽名分成 16 段（每段 4 個值），
+任一段完全相同即成為候選（Jaccard 0.7 時命中概率約 99%），
+之後只對按估計 Jaccard 排序的少數候選跑 difflib.SequenceMatcher 確認。
+
+簽名與分段桶存儲在 memory/minhash.db（SQLite WAL），由 brain_encode / memory_decay 增量維護；
+記錄數與記憶索引不一致時回退路徑會自動重建，也可用 `python3 minhash.py build` 手動重建。
+純 Python 實現，不依賴 numpy。
+
+用法: python3 minhash.py build
+      python3 minhash.py stats
+"""
+
+import os
+import sys
+import json
+import random
+import hashlib
+import argparse
+import unicodedata
+from array import array
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('minhash')
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def shingles(text):
+    """規範化（NFKC、合併空白、小寫）後的字符三元組集合"""
+    normalized = " ".join(unicodedata.normalize('NFKC', text or '').split()).lower()
+    if len(normalized) <= SHINGLE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE] for i in range(len(normalized) - SHINGLE + 1)}
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def signature(text):
+    """MinHash 簽名（NUM_PERM 個整數）"""
+    hashes = [_hash64(shingle.encode('utf-8')) for shingle in shingles(text)]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS]
+
+
+def band_keys(sig):
+    """每段簽名的桶鍵 [(band, key), ...]（key 為有符號 64 位，可直接存入 SQLite）"""
+    keys = []
+    for band in range(BANDS):
+        chunk = array('Q', sig[band * ROWS:(band + 1) * ROWS]).tobytes()
+        key = int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), 'little', signed=True)
+        keys.append((band, key))
+    return keys
+
+
+def jaccard(sig_a, sig_b):
+    """由簽名估計的 Jaccard 相似度"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+class MinHashIndex:
+    """SQLite 上的 LSH 分段桶"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS signatures (id INTEGER PRIMARY KEY, sig BLOB NOT NULL);
+    CREATE TABLE IF NOT EXISTS buckets (
+        band INTEGER NOT NULL,
+        key  INTEGER NOT NULL,
+        id   INTEGER NOT NULL,
+        PRIMARY KEY (band, key, id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_buckets_id ON buckets(id);
+    """
+
+    def __init__(self, path=None):
+        self.path = Config.MINHASH_PATH if path is None else path
+        self._conn = None
+
+    def exists(self):
+        return self.path.exists()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=Config.LOCK_TIMEOUT)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- 寫入 ----------
+
+    def _remove(self, ids):
+        self.conn.executemany("DELETE FROM buckets WHERE id = ?", [(mem_id,) for mem_id in ids])
+        self.conn.executemany("DELETE FROM signatures WHERE id = ?", [(mem_id,) for mem_id in ids])
+
+    def add_many(self, docs):
+        """新增或替換 [(id, content), ...]（單一事務）"""
+        if not docs:
+            return
+        rows, buckets = [], []
+        for mem_id, content in docs:
+            sig = signature(content)
+            rows.append((mem_id, array('Q', sig).tobytes()))
+            buckets.extend((band, key, mem_id) for band, key in band_keys(sig))
+        with self.conn:
+            self._remove([mem_id for mem_id, _ in docs])
+            self.conn.executemany("INSERT INTO signatures VALUES (?, ?)", rows)
+            self.conn.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", buckets)
+        logger.debug(f"Indexed {len(docs)} signatures")
+
+    def remove_many(self, ids):
+        if not ids:
+            return
+        with self.conn:
+            self._remove(ids)
+        logger.debug(f"Removed {len(ids)} signatures")
+
+    def rebuild(self, memories):
+        """從記憶列表全量重建"""
+        with self.conn:
+            self.conn.execute("DELETE FROM buckets")
+            self.conn.execute("DELETE FROM signatures")
+        self.add_many([(mem["id"], mem.get("content", "")) for mem in memories])
+        logger.info(f"Rebuilt MinHash index ({len(memories)} memories)")
+
+    # ---------- 查詢 ----------
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def candidates(self, sig, limit=None):
+        """
+        與簽名至少有一段相同的記憶，按估計 Jaccard 降序
+        Returns:
+            [(id, 估計 Jaccard), ...]
+        """
+        ids = set()
+        for band, key in band_keys(sig):
+            ids.update(row[0] for row in self.conn.execute(
+                "SELECT id FROM buckets WHERE band = ? AND key = ?", (band, key)))
+        if not ids:
+            return []
+        ranked = []
+        for mem_id, blob in self.conn.execute(
+                f"SELECT id, sig FROM signatures WHERE id IN ({', '.join('?' * len(ids))})", tuple(ids)):
+            ranked.append((mem_id, jaccard(sig, array('Q', blob))))
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    def stats(self):
+        return {"memories": self.count(),
+                "buckets": self.conn.execute("SELECT COUNT(*) FROM buckets").fetchone()[0],
+                "bytes": self.path.stat().st_size if self.path.exists() else 0,
+                "permutations": NUM_PERM, "bands": BANDS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - MinHash 近重複索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="從記憶索引全量重建")
+    sub.add_parser("stats", help="顯示索引統計")
+    args = parser.parse_args()
+
+    index = MinHashIndex()
+    if args.command == "build":
+        from brain_retrieve import load_index
+        memories = (load_index() or {}).get("memories")
+        if memories is None:
+            print("❌ 記憶索引不存在")
+            return 1
+        index.rebuild(memories)
+        print(f"✅ 已索引 {len(memories)} 條記憶")
+    elif args.command == "stats":
+        print(json.dumps(index.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
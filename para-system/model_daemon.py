@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+常駐模型守護進程 - Unix domain socket 上的編碼 / 檢索服務
+MiniLM（或 Config.ENCODER_BACKEND 指定的後端）只在守護進程中加載一次；brain_encode / brain_retrieve / SemanticEncoder
+發現 socket 在監聽時透明地轉發請求，客戶端完全不導入 torch，
+守護進程不在時自動回退到進程內編碼。
+
+協議：每個請求 / 響應是一行 JSON
+    {"op": "ping"}
+    {"op": "encode", "texts": [...], "batch_size": 32}
+        → {"ok": true, "shape": [n, dim], "data": "<base64 float32>"}
+    {"op": "search", "query": "...", "top_k": 5, "threshold": 0.5, "mode": "auto",
+     "filters": {"actor": "剀", "since": "2026-10-01T00:00:00"}}
+        → {"ok": true, "results": [...]}
+    {"op": "ingest", "items": [{"content": "...", "actor": ..., "importance": 0.5}, ...]}
+        → {"ok": true, "outcomes": [{"status": "new", "memory": {...}, "similarity": null, "density_boost": null}, ...]}
+        並發的 ingest 請求在 Config.INGEST_WINDOW_MS 內合併成一批提交（見 group_commit）
+        送出後失去響應時客戶端拋出 DaemonRequestLost，不在本進程重做（可能已提交）
+    失敗響應 {"ok": false, "error": "...", "rejected": true} 表示執行前被拒絕、沒有寫入
+
+用法: python3 model_daemon.py serve      （brain_server.py 啟動時也會同時監聽）
+      python3 model_daemon.py status
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import signal
+import argparse
+import threading
+import socketserver
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('model_daemon')
+
+
+def _pack(vecs):
+    import numpy as np
+    vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+    return {"shape": list(vecs.shape), "data": base64.b64encode(vecs.tobytes()).decode('ascii')}
+
+
+def _unpack(payload):
+    import numpy as np
+    data = base64.b64decode(payload["data"])
+    return np.frombuffer(data, dtype=np.float32).reshape(payload["shape"])
+
+
+# ---------- 客戶端 ----------
+
+class DaemonRejected(RuntimeError):
+    """守護進程在執行前拒絕了請求（沒有任何寫入），調用方可以改在本進程處理"""
+
+
+class DaemonRequestLost(RuntimeError):
+    """請求已送出但沒有收到響應：守護進程可能已經執行（例如 ingest 已提交），不能在本進程重試"""
+
+
+class DaemonClient:
+    """守護進程客戶端（每個請求一個短連接）"""
+
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = str(socket_path or Config.DAEMON_SOCKET)
+        self.timeout = Config.DAEMON_TIMEOUT if timeout is None else timeout
+
+    def request(self, payload, timeout=None):
+        """
+        連接或發送失敗拋出 OSError（請求未送達）；送出後超時、斷開或響應無法解析拋出 DaemonRequestLost
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout if timeout is None else timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b"\n")
+            try:
+                with sock.makefile('rb') as stream:
+                    line = stream.readline()
+                if not line:
+                    raise ConnectionError("Daemon closed connection")
+                response = json.loads(line)
+            except (OSError, ValueError) as e:
+                raise DaemonRequestLost(f"No reply from daemon after sending {payload.get('op')} ({e})") from e
+        if not response.get("ok"):
+            error = response.get("error", "daemon error")
+            raise DaemonRejected(error) if response.get("rejected") else RuntimeError(error)
+        return response
+
+    def ping(self):
+        """守護進程是否在監聽（不在時快速失敗）"""
+        if not os.path.exists(self.socket_path):
+            return None
+        try:
+            return self.request({"op": "ping"}, timeout=Config.DAEMON_CONNECT_TIMEOUT)
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.debug(f"Daemon not reachable at {self.socket_path}: {e}")
+            return None
+
+    def encode(self, texts, batch_size=None):
+        response = self.request({"op": "encode", "texts": list(texts), "batch_size": batch_size})
+        return _unpack(response)
+
+    def search(self, query, top_k=5, threshold=None, mode='auto', nprobe=None, filters=None):
+        response = self.request({"op": "search", "query": query, "top_k": top_k,
+                                 "threshold": threshold, "mode": mode, "nprobe": nprobe,
+                                 "filters": filters})
+        return response["results"]
+
+    def ingest(self, items):
+        """編碼記憶（prepare_item 的結果），返回 [(status, memory, similarity, density_boost), ...]"""
+        response = self.request({"op": "ingest", "items": list(items)})
+        return [(outcome["status"], outcome["memory"], outcome["similarity"], outcome.get("density_boost"))
+                for outcome in response["outcomes"]]
+
+
+def connect():
+    """返回可用的客戶端；守護進程未運行或編碼器後端不轉發（Config.use_daemon）時返回 None"""
+    if not Config.use_daemon():
+        return None
+    client = DaemonClient()
+    return client if client.ping() else None
+
+
+# ---------- 服務端 ----------
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.model_daemon.dispatch(json.loads(line))
+                response["ok"] = True
+            except Exception as e:
+                logger.error(f"Daemon request failed: {e}")
+                response = {"ok": False, "error": str(e), "rejected": isinstance(e, DaemonRejected)}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # 並發寫入方同時連接（默認 backlog 5，超出時客戶端 connect 直接失敗）
+    request_queue_size = 128
+
+
+class ModelDaemon:
+    """持有常駐模型，處理 socket 請求"""
+
+    def __init__(self, encode_fn, model_name=None, socket_path=None, dim=None):
+        """encode_fn(texts, batch_size) → n × dim 數組（通常是 EncoderBackend.encode_many）"""
+        self.encode_fn = encode_fn
+        self.model_name = model_name or Config.SEMANTIC_MODEL
+        self.dim = dim or Config.VECTOR_DIMENSION
+        self.socket_path = str(socket_path or Config.DAEMON_SOCKET)
+        self.started = time.time()
+        self.requests = 0
+        self._model_lock = threading.Lock()
+        self._server = None
+        self._encoder = None
+        self._index = None
+        self._committer = None
+        self._committer_lock = threading.Lock()
+
+    def encode_many(self, texts, batch_size=None):
+        # 模型推理串行化（sentence-transformers 不保證線程安全）
+        with self._model_lock:
+            return self.encode_fn(texts, batch_size or Config.ENCODE_BATCH_SIZE)
+
+    def _ingest_batch(self, items):
+        """合併後的一批（只在提交線程上運行）：編碼器與索引存儲常駐，每批只重放新日誌"""
+        from brain_encode import _locked_ingest
+        from index_store import open_index_store
+        if self._index is None:
+            self._index = open_index_store()
+        return _locked_ingest(items, encoder=self._encoder, store=self._index)
+
+    def ingest(self, items):
+        with self._committer_lock:
+            if self._committer is None:
+                from semantic_encoder import SemanticEncoder
+                from group_commit import GroupCommitter
+                # 推理經由 self.encode_many，與 encode / search 請求共用模型鎖
+                self._encoder = SemanticEncoder(backend=self)
+                self._committer = GroupCommitter(self._ingest_batch)
+        self._encoder.store.refresh()
+        if self._encoder.store_mismatch:
+            raise DaemonRejected(f"Embedding store was built with {self._encoder.store.model}, not {self.model_name}")
+        return self._committer.submit(items)
+
+    def dispatch(self, request):
+        self.requests += 1
+        op = request.get("op")
+        if op == "ping":
+            info = {"model": self.model_name, "dim": self.dim, "pid": os.getpid(),
+                    "uptime": round(time.time() - self.started, 1), "requests": self.requests}
+            if self._committer is not None:
+                info["ingest"] = self._committer.stats()
+            return info
+        if op == "encode":
+            return _pack(self.encode_many(request.get("texts", []), request.get("batch_size")))
+        if op == "search":
+            from brain_retrieve import search_memories
+            results = search_memories(request["query"], request.get("top_k", 5), request.get("threshold"),
+                                      mode=request.get("mode", "auto"), nprobe=request.get("nprobe"),
+                                      encoder=self, filters=request.get("filters"))
+            return {"results": results}
+        if op == "ingest":
+            outcomes = self.ingest(request.get("items", []))
+            return {"outcomes": [{"status": status, "memory": mem, "similarity": similarity,
+                                  "density_boost": density_boost}
+                                 for status, mem, similarity, density_boost in outcomes]}
+        raise ValueError(f"Unknown op: {op}")
+
+    def _bind(self):
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            if DaemonClient(self.socket_path).ping():
+                raise RuntimeError(f"Another daemon is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.model_daemon = self
+        logger.info(f"Model daemon listening on {self.socket_path}")
+
+    def serve_forever(self):
+        self._bind()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._close()
+
+    def start(self):
+        """在後台線程中監聽（供 brain_server 使用）"""
+        self._bind()
+        thread = threading.Thread(target=self._server.serve_forever, name="model-daemon", daemon=True)
+        thread.start()
+        return thread
+
+    def _close(self):
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def shutdown(self):
+        """停止後台監聽線程並移除 socket"""
+        if self._server is not None:
+            self._server.shutdown()
+        self._close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 常駐模型守護進程")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve", help="加載模型並在 Unix socket 上監聽")
+    sub.add_parser("status", help="檢查守護進程狀態")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        info = DaemonClient().ping()
+        if not info:
+            print(f"❌ 守護進程未運行 ({Config.DAEMON_SOCKET})")
+            return 1
+        print(json.dumps(info, ensure_ascii=False, indent=2))
+        return 0
+
+    # 守護進程自身總是進程內加載（Config.ENCODER_BACKEND 為 hashing 時提供離線編碼）
+    from encoders import create_backend
+    try:
+        backend = create_backend(allow_daemon=False)
+    except Exception as e:
+        logger.error(f"Error loading encoder backend: {e}")
+        print(f"❌ 模型加載失敗，守護進程未啟動: {e}")
+        return 1
+    daemon = ModelDaemon(backend.encode_many, backend.model_name, dim=backend.dim)
+    # SIGTERM 時同樣走 finally 清理 socket 文件
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 神髓語義編碼器 - MiniLM 集成版本
-改進：完整的錯誤處理、日誌記錄、向量驗證
+改進：完整的錯誤處理、日誌記錄、向量驗證；編碼委託給 encoders 中選定的後端
 """
 
 import json
@@ -12,34 +12,43 @@ from pathlib import Path
 # 導入配置和日誌
 from config import Config
 from logger import get_logger
+from embedding_store import EmbeddingStore
+from embedding_cache import get_query_cache
 
 logger = get_logger('semantic_encoder')
 
 class SemanticEncoder:
-    def __init__(self, model_name=None):
-        if model_name is None:
-            model_name = Config.SEMANTIC_MODEL
+    def __init__(self, model_name=None, use_daemon=True, backend=None):
+        """backend 為 encoders 中註冊的後端名稱（默認 Config.ENCODER_BACKEND），或已創建的後端對象"""
+        self._store = None
+        self.model_name = model_name or Config.SEMANTIC_MODEL
+        self.encoder = None
+        self.backend = None
+        self.available = False
         
+        # auto：常駐守護進程在監聽時直接轉發，不導入 sentence-transformers / torch
+        from encoders import create_backend, EncoderUnavailable
         try:
-            from sentence_transformers import SentenceTransformer
-            self.model = SentenceTransformer(model_name)
+            if backend is None or isinstance(backend, str):
+                self.encoder = create_backend(backend, model_name=model_name, allow_daemon=use_daemon)
+            else:
+                self.encoder = backend
+            self.model_name = self.encoder.model_name
+            self.backend = getattr(self.encoder, 'name', type(self.encoder).__name__)
             self.available = True
-            self.model_name = model_name
-            logger.info(f"Loaded model: {model_name}")
-        except ImportError as e:
-            logger.warning(f"sentence-transformers not available ({e})")
-            self.available = False
-            self.model = None
-            self.model_name = model_name
+        except EncoderUnavailable as e:
+            logger.warning(f"Encoder backend not available ({e})")
         except Exception as e:
-            logger.error(f"Error loading model: {e}")
-            self.available = False
-            self.model = None
-            self.model_name = model_name
+            logger.error(f"Error loading encoder backend: {e}")
+    
+    def _encode(self, texts, batch_size):
+        return self.encoder.encode_many(texts, batch_size)
     
-    def encode(self, text):
-        """編碼文本為向量"""
-        if not self.available or self.model is None:
+    def encode(self, text, use_cache=True):
+        """編碼文本為向量（查詢文本默認經過共享的查詢向量快取）"""
+        if self._store is None:
+            self._open_store()
+        if not self.available:
             logger.warning("Model not available for encoding")
             return None
         
@@ -48,15 +57,57 @@ class SemanticEncoder:
             return None
         
         try:
-            vec = self.model.encode(text, convert_to_tensor=False)
+            if use_cache:
+                vec = get_query_cache(self.model_name).get_or_encode(text, lambda texts: self._encode(texts, 1))
+            else:
+                vec = self._encode([text], 1)[0]
             logger.debug(f"Encoded text ({len(text)} chars) to vector (dim: {len(vec)})")
             return vec
         except Exception as e:
             logger.error(f"Error encoding text: {e}")
             return None
     
-    def save_embedding(self, memory_id, content):
-        """保存嵌入向量"""
+    def encode_many(self, texts, batch_size=None):
+        """批量編碼（一次模型調用），返回 len(texts) × dim 的數組"""
+        if self._store is None:
+            self._open_store()
+        if not self.available:
+            logger.warning("Model not available for encoding")
+            return None
+        
+        if batch_size is None:
+            batch_size = Config.ENCODE_BATCH_SIZE
+        
+        try:
+            vecs = self._encode(list(texts), batch_size)
+            logger.debug(f"Encoded {len(texts)} texts in batches of {batch_size} ({self.backend})")
+            return np.asarray(vecs)
+        except Exception as e:
+            logger.error(f"Error encoding batch: {e}")
+            return None
+    
+    def _open_store(self):
+        self._store = EmbeddingStore(model=self.model_name)
+        # 不同後端 / 模型的向量不在同一空間，混用會讓查重與檢索靜默失效
+        if self.available and self.store_mismatch:
+            logger.error(f"Embedding store was built with {self._store.model}, not {self.model_name}; "
+                         f"semantic encoding disabled (set YUE_ENCODER_BACKEND or rebuild embeddings)")
+            self.available = False
+    
+    @property
+    def store(self):
+        """共享的嵌入向量庫（延遲打開，打開時核對寫入它的編碼器）"""
+        if self._store is None:
+            self._open_store()
+        return self._store
+    
+    @property
+    def store_mismatch(self):
+        """向量庫由其他編碼器 / 模型寫入（打開時已停用語義編碼，available 為 False）"""
+        return self.store.model not in (None, self.model_name)
+    
+    def save_embedding(self, memory_id, content, vec=None):
+        """保存嵌入向量（追加到向量矩陣；已編碼過的向量可直接傳入 vec）"""
         if not self.available:
             logger.warning("Model not available, cannot save embedding")
             return False
@@ -66,10 +117,8 @@ class SemanticEncoder:
             return False
         
         try:
-            embedding_dir = Config.EMBEDDINGS_DIR
-            embedding_dir.mkdir(parents=True, exist_ok=True)
-            
-            vec = self.encode(content)
+            if vec is None:
+                vec = self.encode(content, use_cache=False)
             if vec is None:
                 logger.error(f"Failed to encode memory #{memory_id}")
                 return False
@@ -78,8 +127,7 @@ class SemanticEncoder:
             if len(vec) != Config.VECTOR_DIMENSION:
                 logger.warning(f"Unexpected vector dimension {len(vec)} for memory #{memory_id} (expected {Config.VECTOR_DIMENSION})")
             
-            embedding_path = embedding_dir / f"mem_{memory_id}.npy"
-            np.save(embedding_path, vec)
+            self.store.append(memory_id, vec)
             logger.debug(f"Saved embedding for memory #{memory_id}")
             return True
         
@@ -88,7 +136,7 @@ class SemanticEncoder:
             return False
     
     def _get_memory_embedding(self, memory):
-        """獲取記憶的嵌入向量"""
+        """獲取記憶的嵌入向量（向量矩陣中的零拷貝行視圖）"""
         if not memory or not isinstance(memory, dict):
             logger.warning("Invalid memory object")
             return None
@@ -99,17 +147,13 @@ class SemanticEncoder:
             return None
         
         try:
-            embedding_dir = Config.EMBEDDINGS_DIR
-            embedding_path = embedding_dir / f"mem_{memory_id}.npy"
-            
-            if not embedding_path.exists():
+            vec = self.store.get(memory_id)
+            if vec is None:
                 logger.debug(f"Embedding not found for memory #{memory_id}")
                 return None
             
-            vec = np.load(embedding_path)
-            
             # 驗證向量
-            if vec is None or len(vec) == 0:
+            if len(vec) == 0:
                 logger.error(f"Corrupted embedding for memory #{memory_id}")
                 return None
             
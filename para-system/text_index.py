@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+記憶全文倒排索引 - BM25 關鍵詞檢索（補足純向量檢索漏掉的關鍵詞匹配）
+分詞：ASCII 單詞整詞（小寫）；CJK 連續片段切成字二元組（單字片段保留單字）
+
+存儲在 memory/text_index.db（SQLite WAL）：
+    postings(term, id, tf)   倒排列表，term 上建索引
+    docs(id, length)         文檔長度（BM25 長度歸一化）
+由 brain_encode / memory_decay 增量維護（索引已構建時），
+或用 `python3 text_index.py build` 從記憶索引全量重建。
+
+用法: python3 text_index.py build
+      python3 text_index.py search "衰減 Silver"
+      python3 text_index.py stats
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import argparse
+import unicodedata
+from collections import Counter
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('text_index')
+
+# BM25 參數
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+|[\u3400-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+")
+_ASCII_RE = re.compile(r"[a-z0-9_]")
+
+
+def tokenize(text):
+    """ASCII 單詞整詞；CJK 片段切成二元組（「記憶衰減」→ 記憶 / 憶衰 / 衰減）"""
+    tokens = []
+    for run in _TOKEN_RE.findall(unicodedata.normalize('NFKC', text or '').lower()):
+        if _ASCII_RE.match(run) or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class TextIndex:
+    """SQLite 上的增量倒排索引"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS postings (
+        term TEXT NOT NULL,
+        id   INTEGER NOT NULL,
+        tf   INTEGER NOT NULL,
+        PRIMARY KEY (term, id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_postings_id ON postings(id);
+    CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, length INTEGER NOT NULL);
+    """
+
+    def __init__(self, path=None):
+        self.path = Config.TEXT_INDEX_PATH if path is None else path
+        self._conn = None
+
+    def exists(self):
+        return self.path.exists()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=Config.LOCK_TIMEOUT)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- 寫入 ----------
+
+    def _remove(self, ids):
+        for mem_id in ids:
+            self.conn.execute("DELETE FROM postings WHERE id = ?", (mem_id,))
+            self.conn.execute("DELETE FROM docs WHERE id = ?", (mem_id,))
+
+    def add_many(self, docs):
+        """新增或替換 [(id, content), ...]（單一事務）"""
+        if not docs:
+            return
+        with self.conn:
+            self._remove([mem_id for mem_id, _ in docs])
+            for mem_id, content in docs:
+                counts = Counter(tokenize(content))
+                self.conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                      [(term, mem_id, tf) for term, tf in counts.items()])
+                self.conn.execute("INSERT INTO docs VALUES (?, ?)", (mem_id, sum(counts.values())))
+        logger.debug(f"Indexed {len(docs)} documents")
+
+    def remove_many(self, ids):
+        if not ids:
+            return
+        with self.conn:
+            self._remove(ids)
+        logger.debug(f"Removed {len(ids)} documents")
+
+    def rebuild(self, memories):
+        """從記憶列表全量重建"""
+        with self.conn:
+            self.conn.execute("DELETE FROM postings")
+            self.conn.execute("DELETE FROM docs")
+        self.add_many([(mem["id"], mem.get("content", "")) for mem in memories])
+        logger.info(f"Rebuilt text index ({len(memories)} documents)")
+
+    # ---------- 查詢 ----------
+
+    def search(self, query, k=None):
+        """
+        BM25 排序
+        Returns:
+            [(id, score, matched), ...] - 按分數降序，最多 k 條；matched 為命中的查詢詞項比例
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        n_docs, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        if not n_docs:
+            return []
+        avg_len = total / n_docs
+
+        scores, matched = Counter(), Counter()
+        for term in terms:
+            rows = self.conn.execute(
+                "SELECT p.id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.id WHERE p.term = ?",
+                (term,)).fetchall()
+            if not rows:
+                continue
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            for mem_id, tf, length in rows:
+                scores[mem_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_len))
+                matched[mem_id] += 1
+        return [(mem_id, score, matched[mem_id] / len(terms)) for mem_id, score in scores.most_common(k)]
+
+    def stats(self):
+        n_docs, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        terms = self.conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        return {"documents": n_docs, "terms": terms, "tokens": total,
+                "bytes": self.path.stat().st_size if self.path.exists() else 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 全文倒排索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="從記憶索引全量重建")
+    search = sub.add_parser("search", help="BM25 關鍵詞檢索")
+    search.add_argument("query", nargs="+", help="查詢")
+    search.add_argument("--top-k", type=int, default=10, help="返回結果數量")
+    sub.add_parser("stats", help="顯示索引統計")
+    args = parser.parse_args()
+
+    text = TextIndex()
+    if args.command == "build":
+        from brain_retrieve import load_index
+        index = load_index()
+        if index is None:
+            print("❌ 記憶索引不存在")
+            return 1
+        text.rebuild(index.get("memories", []))
+        print(f"✅ 已索引 {len(index.get('memories', []))} 條記憶")
+    elif args.command == "search":
+        for mem_id, score, matched in text.search(" ".join(args.query), args.top_k):
+            print(f"#{mem_id}\t{score:.3f}\t{matched:.0%}")
+    elif args.command == "stats":
+        print(json.dumps(text.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
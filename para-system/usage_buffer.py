@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+檢索計數寫後緩衝 - retrieval_count / last_retrieval 不在讀路徑上搶 index.lock
+每個進程只追加自己的緩衝文件（memory/usage/<host>-<pid>.log，一次檢索一行，不加鎖）：
+
+    {"at": "ISO-8601", "ids": [3, 7, 12]}
+
+持排他鎖的寫入方（brain_encode、memory_decay，或 `usage_buffer.py merge`）先把緩衝文件
+改名認領，把合併後的計數快照寫入 merge.pending 並刪除已認領的文件，再提交索引
+（一條 "usage" 日誌記錄 / 一次 SQLite 事務），最後刪除快照；中斷的合併在下次合併時重放快照。
+衰減與強化總是在合併之後執行，看到的使用統計是完整的。
+
+用法: python3 usage_buffer.py stats
+      python3 usage_buffer.py merge
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import socket
+import argparse
+import datetime
+
+# 導入配置和日誌
+from config import Config
+from logger import get_logger
+
+logger = get_logger('usage_buffer')
+
+USAGE_FIELDS = ("retrieval_count", "last_retrieval")
+
+_CLAIMED = ".merging"
+
+
+class UsageBuffer:
+    """按進程分文件的追加緩衝"""
+
+    def __init__(self, directory=None):
+        self.directory = Config.USAGE_DIR if directory is None else directory
+
+    def _own_path(self):
+        return self.directory / f"{socket.gethostname()}-{os.getpid()}.log"
+
+    def record(self, mem_ids, when=None):
+        """記錄一次檢索命中的記憶（單次 O_APPEND 寫入，無鎖）"""
+        if not mem_ids:
+            return
+        line = json.dumps({"at": (when or datetime.datetime.now()).isoformat(),
+                           "ids": list(mem_ids)}) + "\n"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd = os.open(self._own_path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            # 計數丟失不影響檢索結果
+            logger.warning(f"Failed to record retrieval usage: {e}")
+
+    def _files(self, *suffixes):
+        """緩衝文件（默認包括未認領與已認領的）"""
+        suffixes = suffixes or (".log", _CLAIMED)
+        if not self.directory.exists():
+            return []
+        return sorted(path for path in self.directory.iterdir() if path.suffix in suffixes)
+
+    @staticmethod
+    def _read(paths):
+        """匯總 → {id: [次數, 最近檢索時間]}（忽略寫入中斷留下的半行）"""
+        usage = {}
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                continue
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                for mem_id in record.get("ids", []):
+                    entry = usage.setdefault(mem_id, [0, record["at"]])
+                    entry[0] += 1
+                    entry[1] = max(entry[1], record["at"])
+        return usage
+
+    def pending(self):
+        """尚未合併的計數（只讀，不認領）"""
+        return self._read(self._files())
+
+    @property
+    def pending_path(self):
+        """合併中的計數快照：認領文件已刪除、索引提交尚未確認時的恢復依據"""
+        return self.directory / "merge.pending"
+
+    def merge(self, store):
+        """
+        把緩衝計數合併進索引（調用方持有 index.lock 排他鎖）
+        寫入的是合併後的絕對值而不是增量：先把這些值與已認領的文件名原子寫入 merge.pending，
+        刪除認領文件，再提交索引，最後刪除快照。任一步中斷後，下次合併重放快照，
+        重放相同的絕對值是冪等的，計數既不丟失也不重複累加。
+        Returns:
+            合併的記憶數
+        """
+        merged = self._replay(store)
+
+        # 先改名認領：此後的檢索寫入新文件，不會被本次刪除
+        stamp = time.time_ns()
+        for path in self._files(".log"):
+            try:
+                os.replace(path, path.with_name(f"{path.stem}.{stamp}{_CLAIMED}"))
+            except FileNotFoundError:
+                continue
+        # 包括上次合併在寫快照前中斷留下的認領文件
+        claimed = self._files(_CLAIMED)
+        if not claimed:
+            return merged
+
+        values = {}
+        for mem_id, (count, last) in self._read(claimed).items():
+            mem = store.get(mem_id)
+            if mem is None:
+                continue  # 已刪除
+            values[mem_id] = [mem.get("retrieval_count", 0) + count,
+                              max(mem.get("last_retrieval") or last, last)]
+        tmp_path = self.pending_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"claimed": [path.name for path in claimed], "values": values}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pending_path)
+        for path in claimed:
+            path.unlink(missing_ok=True)
+
+        merged += self._apply(store, values)
+        self.pending_path.unlink()
+        logger.debug(f"Merged retrieval usage for {len(values)} memories from {len(claimed)} buffers")
+        return merged
+
+    def _replay(self, store):
+        """重放上次中斷的合併（快照中的認領文件已計入快照，一併刪除）"""
+        try:
+            with open(self.pending_path, 'r', encoding='utf-8') as f:
+                pending = json.load(f)
+        except FileNotFoundError:
+            return 0
+        for name in pending["claimed"]:
+            (self.directory / name).unlink(missing_ok=True)
+        # JSON 對象的鍵是字符串
+        merged = self._apply(store, {int(mem_id): value for mem_id, value in pending["values"].items()})
+        self.pending_path.unlink()
+        logger.info(f"Replayed interrupted usage merge for {merged} memories")
+        return merged
+
+    @staticmethod
+    def _apply(store, values):
+        """把絕對值寫入索引（一條 "usage" 日誌記錄 / 一次 SQLite 事務）"""
+        changes = []
+        for mem_id, (count, last) in values.items():
+            mem = store.get(mem_id)
+            if mem is None:
+                continue  # 已刪除
+            mem["retrieval_count"] = count
+            mem["last_retrieval"] = last
+            changes.append((mem, USAGE_FIELDS))
+        if not changes:
+            return 0
+        before = store.version
+        store.update_many("usage", changes)
+        if Config.META_INDEX_PATH.exists():
+            # 檢索計數不屬於元數據索引的字段：索引原本是最新的就仍然是最新的
+            from meta_index import MetaIndex
+            MetaIndex().advance(before, store.version)
+        return len(changes)
+
+    def stats(self):
+        files = self._files()
+        pending = self._read(files)
+        return {"buffers": len(files), "bytes": sum(path.stat().st_size for path in files if path.exists()),
+                "memories": len(pending), "retrievals": sum(count for count, _ in pending.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玥系統 - 檢索計數緩衝")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="顯示未合併的計數")
+    sub.add_parser("merge", help="持鎖把計數合併進記憶索引")
+    args = parser.parse_args()
+
+    buffer = UsageBuffer()
+    if args.command == "stats":
+        print(json.dumps(buffer.stats(), ensure_ascii=False, indent=2))
+    elif args.command == "merge":
+        from index_store import open_index_store
+        lock_path = os.path.join(Config.MEMORY_DIR, "index.lock")
+        os.makedirs(Config.MEMORY_DIR, exist_ok=True)
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                store = open_index_store()
+                merged = buffer.merge(store)
+                store.maybe_compact()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        print(f"✅ 已合併 {merged} 條記憶的檢索計數")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
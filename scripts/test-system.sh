@@ -15,6 +15,10 @@ python3 para-system/brain_encode.py "測試記憶" --score 0.8 2>/dev/null && ec
 echo "3. 測試記憶檢索..."
 python3 para-system/brain_retrieve.py "測試" 2>/dev/null && echo "✅ 記憶檢索正常" || echo "❌ 記憶檢索失敗"
 
+# 3.5 檢查 CLI 啟動預算（延遲導入、無導入副作用）
+echo "3.5 檢查 CLI 啟動預算..."
+python3 para-system/benchmarks/startup_budget.py && echo "✅ 啟動預算正常" || echo "❌ 啟動預算超出"
+
 # 4. 檢查文件完整性
 echo "4. 檢查核心文件..."
 for file in MEMORY.md SOUL.md USER.md handoff.md IDENTITY.md TOOLS.md; do